@@ -0,0 +1,70 @@
+import argparse
+import configparser
+import datetime
+from helpers.redshift_connection import initialize_connection_pool
+from helpers.sql_queries import SqlQueries
+
+
+query_helper = SqlQueries()
+
+
+def time_copy(dw_connection, table, source_format, s3_path, aws_key, aws_secret):
+    """
+    Truncates a stage table, COPYs one S3 prefix into it and measures how long the COPY took.
+    :param dw_connection: The psycopg2 connection object, assumed to be Amazon Redshift
+    :param table: the stage table to load
+    :param source_format: JSON, JSON_GZIP or PARQUET
+    :param s3_path: the S3 prefix to COPY from
+    :param aws_key: Your AWS Key to authorize the connection to S3
+    :param aws_secret: Your AWS Secret to authorize the connection to S3
+    :return: a tuple of seconds taken and rows loaded
+    """
+    with dw_connection.cursor() as crsr:
+        crsr.execute(query_helper.truncate_sql_format.format(table))
+        dw_connection.commit()
+
+        if source_format == 'PARQUET':
+            copy_sql = query_helper.copy_columnar_sql_format.format(table, s3_path, aws_key, aws_secret, 'PARQUET')
+        elif source_format == 'JSON_GZIP':
+            copy_sql = query_helper.copy_sql_format.format(table, s3_path, aws_key, aws_secret, 'JSON \'auto\'\r\nGZIP')
+        else:
+            copy_sql = query_helper.copy_sql_format.format(table, s3_path, aws_key, aws_secret, 'JSON \'auto\'')
+
+        start_time = datetime.datetime.now()
+        crsr.execute(copy_sql)
+        dw_connection.commit()
+        seconds_taken = (datetime.datetime.now() - start_time).total_seconds()
+
+        crsr.execute("select count(1) from {}".format(table))
+        return seconds_taken, crsr.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares Redshift COPY time of the same dataset in several formats")
+    parser.add_argument("sources", nargs="+", metavar="FORMAT=S3_PATH",
+                        help="e.g. JSON=s3://bucket/bench/json_none PARQUET=s3://bucket/bench/parquet_zstd")
+    parser.add_argument("--table", default="stage_parking_violations")
+    parser.add_argument("--config", default="dwh.cfg",
+                        help="The configuration file, e.g. dwh_local.cfg to compare the formats on the local stand-in")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read_file(open(args.config))
+
+    redshift_pool = initialize_connection_pool(config, max_connections=1)
+
+    print("|format|source|rows|COPY (s)|")
+    print("|---|---|---|---|")
+
+    with redshift_pool.connection() as redshift:
+        for source in args.sources:
+            source_format, s3_path = source.split('=', 1)
+            seconds_taken, rows_loaded = time_copy(redshift, args.table, source_format.upper(), s3_path,
+                                                   config['AWS']['KEY'], config['AWS']['SECRET'])
+            print("|{}|{}|{}|{:.1f}|".format(source_format.upper(), s3_path, rows_loaded, seconds_taken))
+
+    redshift_pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
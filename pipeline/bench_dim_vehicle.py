@@ -0,0 +1,106 @@
+import argparse
+import configparser
+import statistics
+import time
+from helpers.redshift_connection import initialize_connection_pool
+from helpers.sql_queries import SqlQueries
+
+
+query_helper = SqlQueries()
+
+
+def timed_execute(crsr, sql):
+    """
+    Runs one statement and measures how long it took.
+    :param crsr: a psycopg2 cursor
+    :param sql: the statement to run
+    :return: the seconds taken
+    """
+    start_time = time.perf_counter()
+    crsr.execute(sql)
+    return time.perf_counter() - start_time
+
+
+def run_mode(dw_connection, dim_vehicle_mode, summons_number_range):
+    """
+    Rebuilds dim_vehicle in the given mode and reloads the staged violations into the fact table, inside a transaction
+    that is rolled back at the end, so the warehouse is left as it was. Only the IDENTITY counter of dim_vehicle moves
+    on, which leaves a gap in the vehicle keys handed out next.
+    :param dw_connection: a psycopg2 connection to the data warehouse, with the stage tables already loaded
+    :param dim_vehicle_mode: a key of SqlQueries.dim_vehicle_modes
+    :param summons_number_range: the (min, max) summons numbers in stage_parking_violations
+    :return: a dictionary of measurements
+    """
+    vehicle_mode = query_helper.dim_vehicle_modes[dim_vehicle_mode]
+
+    try:
+        with dw_connection.cursor() as crsr:
+            crsr.execute("delete from dim_vehicle")
+            crsr.execute(query_helper.zerosk_dim_vehicle)
+            dimension_seconds = timed_execute(crsr, query_helper.get_sql_command('dim_vehicle',
+                                                                                 vehicle_mode['insert_command']))
+
+            crsr.execute("select count(*) from dim_vehicle")
+            dimension_rows = crsr.fetchone()[0]
+
+            fact_seconds = timed_execute(crsr, query_helper.delete_range_fact_parkingviolation.format(
+                min_summons_number=summons_number_range[0], max_summons_number=summons_number_range[1]) +
+                query_helper.insert_fact_parkingviolation.format(
+                    vehicle_join_condition=vehicle_mode['vehicle_join_condition']))
+
+            crsr.execute("select count(*), sum(case when vehicle_key = 0 then 1 else 0 end) from fact_parkingviolation "
+                         "where parking_violation_key between {} and {}".format(*summons_number_range))
+            fact_rows, unknown_vehicle_rows = crsr.fetchone()
+    finally:
+        dw_connection.rollback()
+
+    return {
+        "mode": dim_vehicle_mode,
+        "dimension_rows": dimension_rows,
+        "dimension_seconds": dimension_seconds,
+        "fact_rows": fact_rows,
+        "unknown_vehicle_rows": unknown_vehicle_rows,
+        "fact_seconds": fact_seconds
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the size of dim_vehicle and the time taken by the fact load "
+                                                 "in each DIM_VEHICLE_MODE, against the currently staged violations. "
+                                                 "Every change is rolled back.")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per mode; the median times are reported")
+    parser.add_argument("--config", default="dwh.cfg",
+                        help="The configuration file, e.g. dwh_local.cfg to compare the modes on the local stand-in")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read_file(open(args.config))
+
+    redshift_pool = initialize_connection_pool(config, max_connections=1)
+
+    with redshift_pool.connection() as redshift:
+        with redshift.cursor() as crsr:
+            crsr.execute(query_helper.stage_summons_range_sql)
+            summons_number_range = crsr.fetchone()
+        redshift.rollback()
+
+        if summons_number_range[0] is None:
+            parser.error("stage_parking_violations is empty; run etl.py --tables stage_parking_violations first")
+
+        print("|mode|dim_vehicle rows|dim_vehicle load (s)|fact rows|fact rows with unknown vehicle|fact load (s)|")
+        print("|---|---|---|---|---|---|")
+
+        for dim_vehicle_mode in sorted(query_helper.dim_vehicle_modes):
+            results = [run_mode(redshift, dim_vehicle_mode, summons_number_range) for i in range(args.runs)]
+            result = dict(results[-1],
+                          dimension_seconds=statistics.median(result['dimension_seconds'] for result in results),
+                          fact_seconds=statistics.median(result['fact_seconds'] for result in results))
+
+            print("|{mode}|{dimension_rows}|{dimension_seconds:.2f}|{fact_rows}|{unknown_vehicle_rows}|"
+                  "{fact_seconds:.2f}|".format(**result))
+
+    redshift_pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Lets the tests import helpers.* and etl the way the scripts of this directory do
@@ -1,47 +1,55 @@
+import argparse
 import configparser
-from helpers.redshift_connection import initialize_connection
+import datetime
+from helpers.redshift_connection import initialize_connection_pool
 from helpers.sql_queries import SqlQueries
 
 
 query_helper = SqlQueries()
 
 
-def create_data_warehouse():
+def create_data_warehouse(config_path='dwh.cfg'):
     """
     The main driver of this script. This will instantiate a connection to the data warehouse and run DROP and CREATE
     scripts for all tables for the data warehouse defined in the list below with the help of the SqlQueries() class.
+    :param config_path: Optional. The configuration file to use instead of dwh.cfg, e.g. dwh_local.cfg
     :return: None
     """
+    start_time = datetime.datetime.now()
+
     config = configparser.ConfigParser()
-    config.read_file(open('dwh.cfg'))
+    config.read_file(open(config_path))
 
-    redshift = initialize_connection(
-        config['DWH']['DWH_ENDPOINT'],
-        config['DWH']['DWH_PORT'],
-        config['DWH']['DWH_DB'],
-        config['DWH']['DWH_DB_USER'],
-        config['DWH']['DWH_DB_PASSWORD'])
+    redshift_pool = initialize_connection_pool(config, max_connections=1)
 
     table_names = ['stage_violation', 'stage_vehicle', 'stage_registrationstate', 'stage_precinct',
-                   'stage_issuingagency', 'stage_parking_violations', 'fact_parkingviolation', 'dim_issuingagency',
-                   'dim_precinct', 'dim_violation', 'dim_registrationstate', 'dim_vehicle', 'dim_borough', 'dim_time',
-                   'dim_date']
+                   'stage_issuingagency', 'stage_parking_violations', 'stage_fact_parkingviolation',
+                   'fact_parkingviolation', 'dim_issuingagency', 'dim_precinct', 'dim_violation',
+                   'dim_registrationstate', 'dim_vehicle', 'dim_borough', 'dim_time', 'dim_date']
 
     print("Starting creation of the Parking Violations data warehouse...")
 
-    with redshift.cursor() as crsr:
-        for table in table_names:
-            crsr.execute(query_helper.drop_sql_format.format(table))
-            crsr.execute(query_helper.get_sql_command(table, 'create'))
-            redshift.commit()
+    with redshift_pool.connection() as redshift:
+        with redshift.cursor() as crsr:
+            for table in table_names:
+                crsr.execute(query_helper.drop_sql_format.format(table))
+                crsr.execute(query_helper.get_sql_command(table, 'create'))
+                redshift.commit()
 
-    redshift.close()
+    redshift_pool.closeall()
 
-    print("Creation of the Parking Violations data warehouse complete!")
+    print("Creation of the Parking Violations data warehouse complete! Time taken: {:.1f} seconds".format(
+        (datetime.datetime.now() - start_time).total_seconds()))
 
 
 def main():
-    create_data_warehouse()
+    parser = argparse.ArgumentParser(description="Drops and creates every table of the Parking Violations data "
+                                                 "warehouse")
+    parser.add_argument("--config", default="dwh.cfg",
+                        help="The configuration file, e.g. dwh_local.cfg to create the local DuckDB stand-in")
+    args = parser.parse_args()
+
+    create_data_warehouse(args.config)
 
 
 if __name__ == "__main__":
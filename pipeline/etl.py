@@ -1,6 +1,9 @@
+import argparse
 import configparser
 import datetime
-from helpers.redshift_connection import initialize_connection
+from concurrent.futures import ThreadPoolExecutor
+from helpers.dag_scheduler import run_graph
+from helpers.redshift_connection import initialize_connection_pool
 from helpers.sql_queries import SqlQueries
 from helpers.quality_checks import DataQuality
 
@@ -8,78 +11,70 @@ from helpers.quality_checks import DataQuality
 quality_check_helper = DataQuality()
 query_helper = SqlQueries()
 
+# Every stage table is COPYed from the directory of this bucket named after it, e.g. stage_precinct from precinct
+S3_BUCKET_PATH = 's3://farchila-udacity-final/'
 
-def run_sql_copy_from_list(dw_connection, table_list, source_format, aws_key, aws_secret, csv_ignore_header=0):
+
+def get_month_partitions(from_month, to_month):
     """
-    Takes in a psycopg2 connection object, a list of stage table names, a source format, credentials, and an optional
-    CSV ignoreheader param and runs a Redshift COPY on all given tables. The naming convention of the tables assume that
-    a matching directory exists in the S3 bucket.
-    :param dw_connection: The psycopg2 connection object, assumed to be Amazon Redshift
-    :param table_list: A list of table names on which to iterate and run the COPY
-    :param source_format: CSV or JSON
-    :param aws_key: Your AWS Key to authorize the connection to S3
-    :param aws_secret: Your AWS Secret to authorize the connection to S3
-    :param csv_ignore_header: Optional. Number of rows to skip in CSV file, for example, if the first row is a header
-    :return: None
+    Lists the year_number=/month_number= partition prefixes written by spark/process_violations.py for an inclusive
+    range of months.
+    :param from_month: the first month to include, as 'YYYY-MM'
+    :param to_month: the last month to include, as 'YYYY-MM'
+    :return: a list of partition prefixes, e.g. ['year_number=2020/month_number=7/', ...]
     """
-    with dw_connection.cursor() as crsr:
-        for table in table_list:
-            crsr.execute(query_helper.truncate_sql_format.format(table))
-            dw_connection.commit()
+    year_number, month_number = [int(part) for part in from_month.split('-')]
+    last_year_number, last_month_number = [int(part) for part in to_month.split('-')]
+    partitions = []
 
-        print("All {} Stage tables truncated and ready for COPY.".format(source_format))
+    while (year_number, month_number) <= (last_year_number, last_month_number):
+        # The trailing slash keeps month_number=1 from also matching month_number=10 through 12
+        partitions.append("year_number={}/month_number={}/".format(year_number, month_number))
+        year_number, month_number = (year_number + 1, 1) if month_number == 12 else (year_number, month_number + 1)
 
-        phase_start_time = datetime.datetime.now()
+    return partitions
 
-        for table in table_list:
-            print("COPYing " + table)
-            if source_format.upper() == 'CSV':
-                source_format_final = 'CSV\r\nIGNOREHEADER {}'.format(csv_ignore_header)
-            if source_format.upper() == 'JSON':
-                source_format_final = 'JSON \'auto\''
-            crsr.execute(query_helper.copy_sql_format.format(
-                table,
-                's3://farchila-udacity-final/' + table.replace('stage_', ''),
-                aws_key,
-                aws_secret,
-                source_format_final))
-            dw_connection.commit()
 
-        print("{} table COPY phase complete. time taken: {} seconds".format(
-            source_format.upper(), (datetime.datetime.now() - phase_start_time).seconds))
-
-
-def run_sql_commands_from_list(dw_connection, table_list, command_type, truncate_target_first=False):
+def get_copy_sql_list(table, source_format, aws_key, aws_secret, csv_ignore_header=0, partition_list=None,
+                      manifest_path=None):
     """
-    Takes in a psycopg2 connection object and a list of dim or fact table names and performs the command_type on each
-    one, which is retrieved dynamically from the SqlQueries class.
-    :param dw_connection: The psycopg2 connection object, assumed to be Amazon Redshift
-    :param table_list: A list of table names on which to iterate and run the desired command
-    :param command_type: 'insert' or 'zerosk'
-    :param truncate_target_first: Optional: if True, the target table will be truncated first.
-    :return: None
+    Builds the Redshift COPY statements that load one stage table. The naming convention of the tables assume that a
+    matching directory exists in the S3 bucket. A COPY can be narrowed to some partitions of that directory, or to the
+    files listed in a manifest.
+    :param table: The stage table to COPY into
+    :param source_format: CSV, JSON or PARQUET
+    :param aws_key: Your AWS Key to authorize the connection to S3
+    :param aws_secret: Your AWS Secret to authorize the connection to S3
+    :param csv_ignore_header: Optional. Number of rows to skip in CSV file, for example, if the first row is a header
+    :param partition_list: Optional. Partition prefixes within the table's directory to COPY, instead of all of it
+    :param manifest_path: Optional. The S3 path of a Redshift manifest listing the files to COPY
+    :return: A list of COPY statements, one per source path
     """
-    with dw_connection.cursor() as crsr:
-        for table in table_list:
-            status_message_format = "Performing {} on {}{}..."
-            truncate_message = ""
-            if truncate_target_first:
-                truncate_message = " with TRUNCATE first"
-
-            status_message = status_message_format.format(command_type, table, truncate_message)
+    if source_format.upper() == 'CSV':
+        source_format_final = 'CSV\r\nIGNOREHEADER {}'.format(csv_ignore_header)
+    if source_format.upper() == 'JSON':
+        source_format_final = 'JSON \'auto\''
+    if source_format.upper() == 'PARQUET':
+        source_format_final = 'PARQUET'
 
-            print(status_message)
+    source_path = S3_BUCKET_PATH + table.replace('stage_', '')
 
-            phase_start_time = datetime.datetime.now()
+    if manifest_path is not None:
+        source_path_list = [manifest_path]
+        source_format_final += '\r\nMANIFEST'
+    elif partition_list is not None:
+        source_path_list = [source_path + '/' + partition for partition in partition_list]
+    else:
+        source_path_list = [source_path]
 
-            if truncate_target_first:
-                crsr.execute(query_helper.truncate_sql_format.format(table))
+    # Columnar formats only accept a subset of the COPY parameters
+    if source_format.upper() == 'PARQUET':
+        copy_sql_format = query_helper.copy_columnar_sql_format
+    else:
+        copy_sql_format = query_helper.copy_sql_format
 
-            crsr.execute(query_helper.get_sql_command(table, command_type))
-            dw_connection.commit()
-
-            print(table + " hydrated. Time taken: {} seconds".format(
-                (datetime.datetime.now() - phase_start_time).seconds))
+    return [copy_sql_format.format(table, source_path, aws_key, aws_secret, source_format_final)
+            for source_path in source_path_list]
 
 
 def run_data_quality_check(dw_connection, quality_check_dict):
@@ -88,7 +83,7 @@ def run_data_quality_check(dw_connection, quality_check_dict):
     description of the test, and the expected number of rows that should result.
     :param dw_connection: The psycopg2 connection object, assumed to be Amazon Redshift
     :param quality_check_dict: The quality check dictionary. The keys should be {'query', 'test_description', and 'expected_number_of_rows'}
-    :return:
+    :return: True if the check passed
     """
     with dw_connection.cursor() as crsr:
         desc = quality_check_dict["test_description"]
@@ -104,78 +99,295 @@ def run_data_quality_check(dw_connection, quality_check_dict):
             print(
                 "ALERT! Data quality check \"{}\" did not pass. Expected {} row(s) but got {}. Please investigate.".
                 format(desc, passing_result, rows_returned))
+            return False
 
         else:
             print("Data quality check \"{}\" passed!".format(desc))
+            return True
 
 
-def run_pipeline():
+def get_stage_summons_range(dw_connection):
     """
-    The main driver function in this script. This will run the entire data pipeline for the Parking Violations data
-    warehouse, leveraging lists of tables that vary based on load requirements, and uses the SqlQueries() class to
-    retrieve and execute SQL to load the data. This function will also report on time taken for each table to load, as
-    well as overall time for the pipeline job to finish.
-    :return: None
+    Takes in a psycopg2 connection object and looks up the range of summons numbers in the current load.
+    :param dw_connection: The psycopg2 connection object, assumed to be Amazon Redshift
+    :return: A (min, max) tuple of summons numbers, or None if stage_parking_violations is empty
     """
-    overall_start_time = datetime.datetime.now()
-    print("Data load has started at {}".format(overall_start_time))
+    with dw_connection.cursor() as crsr:
+        crsr.execute(query_helper.stage_summons_range_sql)
+        min_summons_number, max_summons_number = crsr.fetchone()
 
-    config = configparser.ConfigParser()
-    config.read_file(open('dwh.cfg'))
+    if min_summons_number is None:
+        return None
 
-    redshift = initialize_connection(
-        config['DWH']['DWH_ENDPOINT'],
-        config['DWH']['DWH_PORT'],
-        config['DWH']['DWH_DB'],
-        config['DWH']['DWH_DB_USER'],
-        config['DWH']['DWH_DB_PASSWORD'])
+    return min_summons_number, max_summons_number
 
-    # Get our lists set up based on whether tables are stage or permanent and what the load logic is...
-    stage_tables_csv = ['stage_issuingagency', 'stage_precinct', 'stage_registrationstate', 'stage_vehicle',
-                    'stage_violation']
 
-    stage_tables_json = ['stage_parking_violations']
+def run_orphan_checks(dw_connection, fact_table, orphan_check_dict_list, summons_number_range=None):
+    """
+    Takes in a psycopg2 connection object and the orphan key checks of one fact table, runs them all as a single query
+    built by DataQuality.get_orphan_check_query(), and reports the result of each check separately.
+    :param dw_connection: The psycopg2 connection object, assumed to be Amazon Redshift
+    :param fact_table: The fact table the checks are on
+    :param orphan_check_dict_list: The orphan check dictionaries, see DataQuality.orphan_check_dict_list
+    :param summons_number_range: Optional. Only check fact rows in this (min, max) range of summons numbers
+    :return: True if every check passed
+    """
+    with dw_connection.cursor() as crsr:
+        query = quality_check_helper.get_orphan_check_query(fact_table, orphan_check_dict_list, summons_number_range)
+
+        print("Running {} orphan key checks on {} in a single scan\r\n\r\nquery: {}\r\n".format(
+            len(orphan_check_dict_list), fact_table, query))
+
+        crsr.execute(query)
+        orphan_counts = crsr.fetchone()
+
+    all_passed = True
+    for orphan_check_dict, orphan_count in zip(orphan_check_dict_list, orphan_counts):
+        desc = orphan_check_dict["test_description"]
+
+        # sum() over an empty fact table is null, which means there are no orphans either
+        if orphan_count:
+            print("ALERT! Data quality check \"{}\" did not pass. Found {} {} value(s) missing from {}.{}. Please "
+                  "investigate.".format(desc, orphan_count, orphan_check_dict["fact_column"],
+                                        orphan_check_dict["dimension_table"], orphan_check_dict["dimension_column"]))
+            all_passed = False
+        else:
+            print("Data quality check \"{}\" passed!".format(desc))
+
+    return all_passed
+
+
+def run_data_quality_checks(connection_pool, max_workers=1, full_sweep=False):
+    """
+    Runs the data quality checks in DataQuality. By default only the rows of the current load are checked, i.e. the
+    range of summons numbers in stage_parking_violations, so the cost follows the size of the load rather than of the
+    warehouse. A full sweep checks the whole fact table instead, and also runs the full sweep only checks. The orphan
+    key checks of each fact table are fused into one query, and those fused queries run concurrently with the checks
+    that can't be fused, each on its own pooled connection.
+    :param connection_pool: The RedshiftConnectionPool to take connections from
+    :param max_workers: Optional. The maximum number of check queries running at the same time
+    :param full_sweep: Optional. Check the whole fact table rather than the current load
+    :return: True if every check passed
+    """
+    def run_with_connection(check_function, *args):
+        with connection_pool.connection() as dw_connection:
+            return check_function(dw_connection, *args)
 
-    dim_tables_zerosk = ['dim_vehicle']
+    phase_start_time = datetime.datetime.now()
 
-    dim_tables_trunc = ['dim_registrationstate', 'dim_violation', 'dim_borough', 'dim_precinct', 'dim_issuingagency']
+    with connection_pool.connection() as dw_connection:
+        summons_number_range = get_stage_summons_range(dw_connection)
 
-    dim_tables_append = ['dim_vehicle', 'dim_time', 'dim_date']
+    quality_check_dict_list = []
+    if summons_number_range is not None:
+        quality_check_dict_list = [
+            dict(quality_check_dict, query=quality_check_dict["query"].format(
+                min_summons_number=summons_number_range[0], max_summons_number=summons_number_range[1]))
+            for quality_check_dict in quality_check_helper.quality_check_dict_list]
 
-    fact_tables = ['fact_parkingviolation']
+    if full_sweep:
+        print("Running a full sweep of the data quality checks over the whole fact table.")
+        quality_check_dict_list += quality_check_helper.full_sweep_quality_check_dict_list
+        orphan_check_range = None
+    elif summons_number_range is None:
+        print("Nothing was staged in this load, so there is nothing to check.")
+        return True
+    else:
+        print("Running data quality checks on summons numbers {} to {}.".format(*summons_number_range))
+        orphan_check_range = summons_number_range
 
-    # First phase: Copy our source data that's been staged in S3
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_with_connection, run_orphan_checks, fact_table, orphan_check_dict_list,
+                                   orphan_check_range)
+                   for fact_table, orphan_check_dict_list in quality_check_helper.get_orphan_check_groups().items()]
+        futures += [executor.submit(run_with_connection, run_data_quality_check, quality_check_dict)
+                    for quality_check_dict in quality_check_dict_list]
 
-    run_sql_copy_from_list(dw_connection=redshift, table_list=stage_tables_csv, source_format='CSV',
-                           aws_key=config['AWS']['KEY'], aws_secret=config['AWS']['SECRET'], csv_ignore_header=1)
+        all_passed = all([future.result() for future in futures])
 
-    run_sql_copy_from_list(dw_connection=redshift, table_list=stage_tables_json, source_format='JSON',
-                           aws_key=config['AWS']['KEY'], aws_secret=config['AWS']['SECRET'])
+    print("Data quality checks complete{}. time taken: {:.1f} seconds".format(
+        "" if all_passed else " with failures", (datetime.datetime.now() - phase_start_time).total_seconds()))
 
-    # Next, run the appropriate SQL commands to hydrate the dim and fact tables with desired business logic
+    return all_passed
 
-    run_sql_commands_from_list(dw_connection=redshift, table_list=dim_tables_zerosk, command_type="zerosk")
 
-    run_sql_commands_from_list(dw_connection=redshift, table_list=dim_tables_trunc, command_type="insert",
-                               truncate_target_first=True)
+def run_table_commands(dw_connection, table, copy_options=None, dim_vehicle_mode='cross_product', fact_source='sql'):
+    """
+    Takes in a psycopg2 connection object and a table of the SqlQueries load graph, and runs the commands that load it
+    in order, committing after each.
+    :param dw_connection: The psycopg2 connection object, assumed to be Amazon Redshift
+    :param table: The name of the table to load, a key of SqlQueries.get_load_graph()
+    :param copy_options: Optional. The keyword arguments of get_copy_sql_list() other than the table, for stage tables
+    :param dim_vehicle_mode: Optional. How dim_vehicle is built and joined, a key of SqlQueries.dim_vehicle_modes
+    :param fact_source: Optional. Where the fact rows come from, a key of SqlQueries.fact_sources
+    :return: None
+    """
+    vehicle_mode = query_helper.dim_vehicle_modes[dim_vehicle_mode]
 
-    run_sql_commands_from_list(dw_connection=redshift, table_list=dim_tables_append, command_type="insert")
+    with dw_connection.cursor() as crsr:
+        for command in query_helper.get_load_graph(fact_source)[table]['commands']:
+            print("Performing {} on {}...".format(command, table))
+
+            if command == 'copy':
+                sql_list = get_copy_sql_list(table=table, **copy_options)
+            elif command == 'truncate':
+                sql_list = [query_helper.truncate_sql_format.format(table)]
+            elif command == 'merge':
+                # Both statements go in one execute, and so one transaction: readers never see the range half loaded
+                summons_number_range = get_stage_summons_range(dw_connection)
+                if summons_number_range is None:
+                    print("Nothing was staged, so there is nothing to merge into " + table)
+                    sql_list = []
+                else:
+                    print("Replacing summons numbers {} to {} in {}".format(
+                        summons_number_range[0], summons_number_range[1], table))
+                    sql_list = [query_helper.get_sql_command(table, 'delete_range').format(
+                        min_summons_number=summons_number_range[0], max_summons_number=summons_number_range[1]) +
+                                query_helper.get_sql_command(
+                                    table, query_helper.fact_sources[fact_source]['insert_command']).format(
+                                    vehicle_join_condition=vehicle_mode['vehicle_join_condition'],
+                                    min_summons_number=summons_number_range[0],
+                                    max_summons_number=summons_number_range[1])]
+            elif table == 'dim_vehicle' and command == 'insert':
+                sql_list = [query_helper.get_sql_command(table, vehicle_mode['insert_command'])]
+            else:
+                sql_list = [query_helper.get_sql_command(table, command)]
+
+            for sql in sql_list:
+                crsr.execute(sql)
+                dw_connection.commit()
+
+
+def run_pipeline(manifest_path=None, from_month=None, to_month=None, max_workers=1, table_list=None,
+                 full_sweep=False, config_path='dwh.cfg'):
+    """
+    The main driver function in this script. This will run the data pipeline for the Parking Violations data
+    warehouse, following the load graph declared in the SqlQueries() class to retrieve and execute SQL to load the data,
+    with tables that do not depend on each other loaded at the same time. This function will also report on time taken
+    for each table to load, the critical path through the graph, as well as overall time for the pipeline job to finish.
+    :param manifest_path: Optional. The S3 path of the manifest written by spark/process_violations.py --manifest. Only
+    the parking violation files it lists are staged.
+    :param from_month: Optional. With to_month, only the parking violations of these months ('YYYY-MM') are staged.
+    :param to_month: Optional. The last month to stage, inclusive.
+    :param max_workers: Optional. The maximum number of tables loaded at the same time, each on its own connection
+    from the pool configured in the [POOL] section of dwh.cfg.
+    :param table_list: Optional. Only load these tables and the tables they depend on. Data quality checks only run
+    when the fact table is loaded.
+    :param full_sweep: Optional. Run the data quality checks over the whole fact table, not just this load. This also
+    happens on the FULL_SWEEP_DAY set in the [QUALITY] section of dwh.cfg.
+    :param config_path: Optional. The configuration file to use instead of dwh.cfg, e.g. dwh_local.cfg
+    :return: None
+    """
+    overall_start_time = datetime.datetime.now()
+    print("Data load has started at {}".format(overall_start_time))
 
-    run_sql_commands_from_list(dw_connection=redshift, table_list=fact_tables, command_type="insert")
+    config = configparser.ConfigParser()
+    config.read_file(open(config_path))
+
+    # The pool caps the connections held on the cluster; workers beyond POOL_MAX_CONNECTIONS wait for a free one
+    redshift_pool = initialize_connection_pool(config)
+
+    # Stage tables are COPYed from the S3 directory named after them. The Spark job stages parking violations as JSON
+    # Lines unless it was run with --output-format parquet. Only the new files are staged when a manifest or a month
+    # range is given; the fact load skips rows it already has either way
+    partition_list = None
+    if from_month is not None:
+        # A month without violations has no partition, and a COPY from a prefix that matches nothing fails the load
+        parking_violations_path = S3_BUCKET_PATH + 'parking_violations/'
+        partition_list = []
+        for partition in get_month_partitions(from_month, to_month):
+            if redshift_pool.source_exists(parking_violations_path + partition, config['AWS']['KEY'],
+                                           config['AWS']['SECRET']):
+                partition_list.append(partition)
+            else:
+                print("Skipping {}: no parking violations were staged for that month".format(partition))
+
+    copy_options = {'source_format': 'CSV', 'aws_key': config['AWS']['KEY'], 'aws_secret': config['AWS']['SECRET'],
+                    'csv_ignore_header': 1}
+    parking_violations_copy_options = {
+        'source_format': config.get('STAGE', 'PARKING_VIOLATIONS_FORMAT', fallback='JSON'),
+        'aws_key': config['AWS']['KEY'],
+        'aws_secret': config['AWS']['SECRET'],
+        'partition_list': partition_list,
+        'manifest_path': manifest_path}
+
+    dim_vehicle_mode = config.get('LOAD', 'DIM_VEHICLE_MODE', fallback='cross_product')
+    if dim_vehicle_mode not in query_helper.dim_vehicle_modes:
+        raise ValueError("DIM_VEHICLE_MODE must be one of {}, got {}".format(
+            sorted(query_helper.dim_vehicle_modes), dim_vehicle_mode))
+
+    # With FACT_SOURCE=spark the fact rows arrive keyed by spark/build_fact_rows.py, which identifies vehicles by hash
+    fact_source = config.get('LOAD', 'FACT_SOURCE', fallback='sql')
+    if fact_source not in query_helper.fact_sources:
+        raise ValueError("FACT_SOURCE must be one of {}, got {}".format(sorted(query_helper.fact_sources), fact_source))
+    if fact_source == 'spark' and dim_vehicle_mode != 'observed':
+        raise ValueError("FACT_SOURCE=spark requires DIM_VEHICLE_MODE=observed")
+
+    fact_copy_options = {'source_format': config.get('STAGE', 'FACT_FORMAT', fallback='JSON'),
+                         'aws_key': config['AWS']['KEY'], 'aws_secret': config['AWS']['SECRET']}
+
+    table_copy_options = {'stage_parking_violations': parking_violations_copy_options,
+                          'stage_fact_parkingviolation': fact_copy_options}
+
+    def load_table(table):
+        with redshift_pool.connection() as redshift:
+            run_table_commands(dw_connection=redshift, table=table,
+                               copy_options=table_copy_options.get(table, copy_options),
+                               dim_vehicle_mode=dim_vehicle_mode, fact_source=fact_source)
+
+    table_seconds = run_graph(query_helper.get_load_graph(fact_source), load_table, max_workers=max_workers,
+                              target_list=table_list)
 
     # Data Quality checks: the last phase
 
-    for qc_test in quality_check_helper.quality_check_dict_list:
-        run_data_quality_check(dw_connection=redshift, quality_check_dict=qc_test)
+    if 'fact_parkingviolation' in table_seconds:
+        # Sweep the whole fact table when asked, or on the configured day of the week
+        full_sweep_day = config.get('QUALITY', 'FULL_SWEEP_DAY', fallback='')
+        if full_sweep_day and datetime.datetime.now().strftime('%A').lower() == full_sweep_day.lower():
+            full_sweep = True
+
+        run_data_quality_checks(connection_pool=redshift_pool, max_workers=max_workers, full_sweep=full_sweep)
 
-    redshift.close()
+    redshift_pool.report()
+    redshift_pool.closeall()
 
     print("Data load complete: total time taken: {} minutes".format(
         (datetime.datetime.now() - overall_start_time).seconds / 60.0))
 
 
 def main():
-    run_pipeline()
+    parser = argparse.ArgumentParser(description="Loads the Parking Violations data warehouse from S3")
+    parser.add_argument("--manifest",
+                        help="S3 path of the manifest written by spark/process_violations.py --manifest. Only the "
+                             "parking violation files it lists are staged.")
+    parser.add_argument("--from-month", help="Stage only the parking violations from this month on, as YYYY-MM")
+    parser.add_argument("--to-month", help="Stage only the parking violations up to this month, as YYYY-MM")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Load up to this many independent tables at the same time, each on its own connection. "
+                             "Keep it within the WLM queue's concurrency.")
+    parser.add_argument("--tables", nargs="+", metavar="TABLE",
+                        help="Only load these tables, together with the tables they depend on")
+    parser.add_argument("--full-sweep", action="store_true",
+                        help="Run the data quality checks over the whole fact table instead of only this load")
+    parser.add_argument("--config", default="dwh.cfg",
+                        help="The configuration file, e.g. dwh_local.cfg to load the local DuckDB stand-in")
+    args = parser.parse_args()
+
+    if args.manifest and (args.from_month or args.to_month):
+        parser.error("--manifest cannot be combined with --from-month/--to-month")
+
+    if args.from_month or args.to_month:
+        if not (args.from_month and args.to_month):
+            parser.error("--from-month and --to-month must be given together")
+        for month in [args.from_month, args.to_month]:
+            try:
+                datetime.datetime.strptime(month, '%Y-%m')
+            except ValueError:
+                parser.error("months must be given as YYYY-MM, got " + month)
+
+    run_pipeline(manifest_path=args.manifest, from_month=args.from_month, to_month=args.to_month,
+                 max_workers=args.workers, table_list=args.tables, full_sweep=args.full_sweep,
+                 config_path=args.config)
 
 
 if __name__ == "__main__":
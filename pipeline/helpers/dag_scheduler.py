@@ -0,0 +1,148 @@
+import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def select_nodes(graph, target_list=None):
+    """
+    Picks the nodes of a dependency graph that need to run in order to build the given targets, i.e. the targets and
+    everything they depend on, directly or indirectly.
+    :param graph: A dictionary of node name -> {'depends_on': [node names], ...}
+    :param target_list: Optional. The nodes to build. If omitted, every node in the graph is selected.
+    :return: A set of node names
+    """
+    if target_list is None:
+        return set(graph)
+
+    unknown_nodes = [node for node in target_list if node not in graph]
+    if unknown_nodes:
+        raise ValueError("Unknown table(s) {}. Known tables are: {}".format(unknown_nodes, sorted(graph)))
+
+    selected_nodes = set()
+    pending_nodes = list(target_list)
+
+    while pending_nodes:
+        node = pending_nodes.pop()
+        if node not in selected_nodes:
+            selected_nodes.add(node)
+            pending_nodes.extend(graph[node]['depends_on'])
+
+    return selected_nodes
+
+
+def get_topological_order(graph, node_set):
+    """
+    Orders the given nodes so that every node comes after all of its dependencies, raising a ValueError if the
+    dependencies form a cycle.
+    :param graph: A dictionary of node name -> {'depends_on': [node names], ...}
+    :param node_set: The nodes to order; they must already include all of their dependencies, see select_nodes()
+    :return: A list of node names
+    """
+    ordered_nodes = []
+    remaining_nodes = sorted(node_set)
+
+    while remaining_nodes:
+        ready_nodes = [node for node in remaining_nodes
+                       if all(dependency in ordered_nodes for dependency in graph[node]['depends_on'])]
+        if not ready_nodes:
+            raise ValueError("The dependencies of {} form a cycle".format(remaining_nodes))
+
+        ordered_nodes.extend(ready_nodes)
+        remaining_nodes = [node for node in remaining_nodes if node not in ready_nodes]
+
+    return ordered_nodes
+
+
+def get_critical_path(graph, node_seconds):
+    """
+    Finds the chain of dependent nodes with the largest total run time. However many workers are available, a run of
+    the graph can never finish faster than this chain, so it is the place to look for savings.
+    :param graph: A dictionary of node name -> {'depends_on': [node names], ...}
+    :param node_seconds: A dictionary of node name -> seconds taken, for the nodes that ran
+    :return: A tuple of (list of node names from first to last, total seconds)
+    """
+    path_seconds = {}
+    path_previous = {}
+
+    for node in get_topological_order(graph, set(node_seconds)):
+        dependencies = [dependency for dependency in graph[node]['depends_on'] if dependency in node_seconds]
+        previous_node = max(dependencies, key=lambda dependency: path_seconds[dependency], default=None)
+
+        path_previous[node] = previous_node
+        path_seconds[node] = node_seconds[node] + (path_seconds[previous_node] if previous_node is not None else 0)
+
+    if not path_seconds:
+        return [], 0
+
+    node = max(path_seconds, key=lambda candidate: path_seconds[candidate])
+    total_seconds = path_seconds[node]
+    critical_path = []
+
+    while node is not None:
+        critical_path.insert(0, node)
+        node = path_previous[node]
+
+    return critical_path, total_seconds
+
+
+def run_graph(graph, run_node, max_workers=1, target_list=None):
+    """
+    Runs the nodes of a dependency graph, starting each one as soon as all of its dependencies have finished, with up
+    to max_workers nodes running at the same time. If a node fails, no new nodes are started, the running ones are
+    allowed to finish, and the error is raised. The time taken by each node is printed as it finishes, and the total
+    and the critical path at the end.
+    :param graph: A dictionary of node name -> {'depends_on': [node names], ...}
+    :param run_node: A function taking a node name, which does the work of that node
+    :param max_workers: Optional. The maximum number of nodes to run at the same time
+    :param target_list: Optional. Only run these nodes and their dependencies, see select_nodes()
+    :return: A dictionary of node name -> seconds taken
+    """
+    node_set = select_nodes(graph, target_list)
+    remaining_nodes = get_topological_order(graph, node_set)
+    node_seconds = {}
+
+    def timed_run_node(node):
+        node_start_time = datetime.datetime.now()
+        run_node(node)
+        return (datetime.datetime.now() - node_start_time).total_seconds()
+
+    print("Running {} table(s) with up to {} concurrent workers: {}".format(
+        len(remaining_nodes), max_workers, ", ".join(remaining_nodes)))
+
+    phase_start_time = datetime.datetime.now()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running_futures = {}
+
+        while remaining_nodes or running_futures:
+            ready_nodes = [node for node in remaining_nodes
+                           if all(dependency in node_seconds for dependency in graph[node]['depends_on']
+                                  if dependency in node_set)]
+
+            # Only hand the executor as many nodes as it can start, so a node that becomes ready later is not queued
+            # behind ones that were merely submitted earlier
+            for node in ready_nodes[:max_workers - len(running_futures)]:
+                running_futures[executor.submit(timed_run_node, node)] = node
+                remaining_nodes.remove(node)
+
+            done_futures, pending_futures = wait(list(running_futures), return_when=FIRST_COMPLETED)
+
+            for future in done_futures:
+                node = running_futures.pop(future)
+                if future.exception() is not None:
+                    print("{} failed, waiting for the {} running table(s) to finish...".format(
+                        node, len(running_futures)))
+                    wait(list(running_futures))
+                    raise future.exception()
+
+                node_seconds[node] = future.result()
+                print("{} loaded. Time taken: {:.1f} seconds".format(node, node_seconds[node]))
+
+    phase_seconds = (datetime.datetime.now() - phase_start_time).total_seconds()
+    critical_path, critical_path_seconds = get_critical_path(graph, node_seconds)
+
+    print("All {} table(s) loaded in {:.1f} seconds, versus {:.1f} seconds if run one at a time.".format(
+        len(node_seconds), phase_seconds, sum(node_seconds.values())))
+    print("Critical path ({:.1f} seconds): {}".format(critical_path_seconds, " -> ".join(
+        "{} ({:.1f} s)".format(node, node_seconds[node]) for node in critical_path)))
+
+    return node_seconds
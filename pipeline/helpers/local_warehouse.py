@@ -0,0 +1,443 @@
+import json
+import os
+import re
+import duckdb
+from helpers.redshift_connection import RedshiftConnectionPool
+
+
+# Redshift functions whose date part is a bare keyword, e.g. datediff(minute, ...), and the DuckDB interval function
+# that adds a number of each part, for dateadd()
+DATE_PART_INTERVAL_FUNCTIONS = {
+    'year': 'to_years', 'month': 'to_months', 'week': 'to_weeks', 'day': 'to_days', 'hour': 'to_hours',
+    'minute': 'to_minutes', 'second': 'to_seconds'
+}
+
+# Redshift to_char()/to_date() format elements and their strftime() equivalents
+DATE_FORMAT_ELEMENTS = {'YYYY': '%Y', 'HH24': '%H', 'MM': '%m', 'DD': '%d', 'MI': '%M', 'SS': '%S', 'Day': '%A'}
+
+DATE_FORMAT_PATTERN = re.compile('|'.join(sorted(DATE_FORMAT_ELEMENTS, key=len, reverse=True)))
+
+COPY_PATTERN = re.compile(r"^\s*COPY\s+(\S+)\s+FROM\s+'([^']+)'(.*)$", re.IGNORECASE | re.DOTALL)
+
+IDENTITY_PATTERN = re.compile(r'\bIDENTITY\s*\(\s*(-?\d+)\s*,\s*(-?\d+)\s*\)', re.IGNORECASE)
+
+
+def find_closing_parenthesis(sql, open_index):
+    """
+    Finds the parenthesis that closes the one at open_index, skipping over string literals.
+    :param sql: the SQL text
+    :param open_index: the index of an opening parenthesis
+    :return: the index of the matching closing parenthesis
+    """
+    depth = 0
+    index = open_index
+
+    while index < len(sql):
+        character = sql[index]
+        if character == "'":
+            index = sql.index("'", index + 1)
+        elif character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+            if depth == 0:
+                return index
+        index += 1
+
+    raise ValueError("Unbalanced parentheses in: " + sql)
+
+
+def split_arguments(arguments):
+    """
+    Splits the text between the parentheses of a function call on its top-level commas.
+    :param arguments: e.g. "minute, time_key, '1900-01-01 00:00:00'"
+    :return: a list of stripped argument texts
+    """
+    argument_list = []
+    depth = 0
+    start_index = 0
+    index = 0
+
+    while index < len(arguments):
+        character = arguments[index]
+        if character == "'":
+            index = arguments.index("'", index + 1)
+        elif character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        elif character == ',' and depth == 0:
+            argument_list.append(arguments[start_index:index].strip())
+            start_index = index + 1
+        index += 1
+
+    argument_list.append(arguments[start_index:].strip())
+    return argument_list
+
+
+def replace_function_calls(sql, function_name, build_call):
+    """
+    Rewrites every call of a function. Calls are rewritten from the last to the first, so that calls nested in the
+    arguments of another are already rewritten by the time the outer call is.
+    :param sql: the SQL text
+    :param function_name: the name of the function, matched case-insensitively
+    :param build_call: a function taking the list of argument texts and returning the replacement text
+    :return: the rewritten SQL text
+    """
+    call_pattern = re.compile(r'(?<![\w.]){}\s*\('.format(function_name), re.IGNORECASE)
+
+    for call_match in reversed(list(call_pattern.finditer(sql))):
+        open_index = call_match.end() - 1
+        close_index = find_closing_parenthesis(sql, open_index)
+        sql = sql[:call_match.start()] + build_call(split_arguments(sql[open_index + 1:close_index])) + \
+            sql[close_index + 1:]
+
+    return sql
+
+
+def get_string_literal_spans(sql):
+    """
+    Finds the string literals of a SQL text.
+    :param sql: the SQL text
+    :return: a list of (start, end) index pairs, end exclusive, quotes included
+    """
+    return [string_match.span() for string_match in re.finditer(r"'(?:[^']|'')*'", sql)]
+
+
+def get_operand(sql, plus_index, direction):
+    """
+    Finds the operand on one side of a '+': a string literal, a parenthesized expression or function call, or a bare
+    identifier or number.
+    :param sql: the SQL text
+    :param plus_index: the index of the '+'
+    :param direction: -1 for the left operand, 1 for the right one
+    :return: the text of the operand
+    """
+    if direction > 0:
+        operand_match = re.match(r"\s*('(?:[^']|'')*'|[\w.]*\s*\(|[\w.]+)", sql[plus_index + 1:])
+        if operand_match is None:
+            return ''
+        operand = operand_match.group(1)
+        if operand.endswith('('):
+            open_index = plus_index + 1 + operand_match.end() - 1
+            return sql[plus_index + 1:find_closing_parenthesis(sql, open_index) + 1].strip()
+        return operand
+
+    end_index = plus_index - 1
+    while end_index >= 0 and sql[end_index].isspace():
+        end_index -= 1
+
+    if end_index < 0:
+        return ''
+    if sql[end_index] == "'":
+        literal_match = re.search(r"'(?:[^']|'')*'$", sql[:end_index + 1])
+        return literal_match.group(0) if literal_match else ''
+    if sql[end_index] == ')':
+        depth = 0
+        start_index = end_index
+        while start_index >= 0:
+            if sql[start_index] == ')':
+                depth += 1
+            elif sql[start_index] == '(':
+                depth -= 1
+                if depth == 0:
+                    break
+            start_index -= 1
+        function_match = re.search(r'[\w.]*$', sql[:start_index])
+        return sql[function_match.start():end_index + 1]
+
+    identifier_match = re.search(r'[\w.]+$', sql[:end_index + 1])
+    return identifier_match.group(0) if identifier_match else ''
+
+
+def translate_string_concatenation(sql):
+    """
+    Rewrites Redshift's string concatenation with '+' into '||'. Without type information, a '+' is taken to join
+    strings when either operand is a string literal or an expression involving one, e.g. nullif(house_number, 'NaN');
+    arithmetic in SqlQueries never involves string literals.
+    :param sql: the SQL text
+    :return: the rewritten SQL text
+    """
+    literal_spans = get_string_literal_spans(sql)
+    plus_indexes = [index for index, character in enumerate(sql) if character == '+'
+                    and not any(start <= index < end for start, end in literal_spans)]
+
+    for plus_index in reversed(plus_indexes):
+        if any("'" in get_operand(sql, plus_index, direction) for direction in (-1, 1)):
+            sql = sql[:plus_index] + '||' + sql[plus_index + 1:]
+
+    return sql
+
+
+def translate_date_format(redshift_format):
+    """
+    Converts a quoted Redshift datetime format, e.g. 'YYYYMMDD', into a quoted strftime() format, e.g. '%Y%m%d'.
+    :param redshift_format: the format, quotes included
+    :return: the converted format, quotes included
+    """
+    return DATE_FORMAT_PATTERN.sub(lambda element: DATE_FORMAT_ELEMENTS[element.group(0)], redshift_format)
+
+
+def translate_ddl(sql):
+    """
+    Rewrites a Redshift CREATE or DROP TABLE statement for DuckDB. Distribution and sort keys are dropped. So are
+    primary keys, which Redshift doesn't enforce and DuckDB would. An IDENTITY column becomes a column defaulting to the
+    next value of a sequence named after the table.
+    :param sql: the SQL text
+    :return: the rewritten SQL text, possibly several statements
+    """
+    drop_match = re.match(r'\s*DROP\s+TABLE\s+IF\s+EXISTS\s+(\w+)', sql, re.IGNORECASE)
+    if drop_match is not None:
+        return "{};\nDROP SEQUENCE IF EXISTS {}_identity;".format(sql.rstrip().rstrip(';'), drop_match.group(1))
+
+    create_match = re.match(r'\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', sql, re.IGNORECASE)
+    if create_match is None:
+        return sql
+
+    sql = re.sub(r'\b(?:COMPOUND\s+|INTERLEAVED\s+)?SORTKEY\s*\([^)]*\)', '', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\b(?:DISTKEY\s*\([^)]*\)|DISTSTYLE\s+\w+)', '', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\s+(?:DISTKEY|SORTKEY|PRIMARY\s+KEY)\b', '', sql, flags=re.IGNORECASE)
+
+    identity_match = IDENTITY_PATTERN.search(sql)
+    if identity_match is not None:
+        sequence_name = create_match.group(1) + '_identity'
+        seed, step = identity_match.group(1, 2)
+        # DuckDB checks START against the default MINVALUE unless INCREMENT BY and MINVALUE come first
+        sql = "CREATE SEQUENCE IF NOT EXISTS {} INCREMENT BY {} MINVALUE {} START {};\n".format(
+            sequence_name, step, seed, seed) + \
+            IDENTITY_PATTERN.sub("DEFAULT nextval('{}')".format(sequence_name), sql)
+
+    return sql
+
+
+def translate_sql(sql):
+    """
+    Rewrites the Redshift dialect used by SqlQueries and DataQuality into DuckDB SQL. COPY statements are not SQL to
+    DuckDB and are handled by LocalWarehouseConnection.copy() instead.
+    :param sql: the Redshift SQL text
+    :return: the DuckDB SQL text
+    """
+    sql = translate_ddl(sql)
+    sql = translate_string_concatenation(sql)
+
+    sql = replace_function_calls(sql, 'len', lambda arguments: "length({})".format(arguments[0]))
+    sql = replace_function_calls(sql, 'dateadd', lambda arguments: "(CAST({} AS TIMESTAMP) + {}(CAST({} AS BIGINT)))".format(
+        arguments[2], DATE_PART_INTERVAL_FUNCTIONS[arguments[0].lower()], arguments[1]))
+    sql = replace_function_calls(sql, 'datediff', lambda arguments: "date_diff('{}', CAST({} AS TIMESTAMP), CAST({} AS "
+                                                                    "TIMESTAMP))".format(arguments[0].lower(),
+                                                                                         arguments[1], arguments[2]))
+    sql = replace_function_calls(sql, 'date_part', lambda arguments: "date_part('{}', {})".format(
+        arguments[0].strip("'").lower(), arguments[1]))
+    sql = replace_function_calls(sql, 'to_char', lambda arguments: "strftime({}, {})".format(
+        arguments[0], translate_date_format(arguments[1])) if arguments[1] != "'Day'"
+        # Redshift blank-pads day names to the longest, Wednesday
+        else "rpad(strftime({}, '%A'), 9, ' ')".format(arguments[0]))
+    sql = replace_function_calls(sql, 'to_date', lambda arguments: "CAST(strptime({}, {}) AS DATE)".format(
+        arguments[0], translate_date_format(arguments[1])))
+
+    return sql
+
+
+def quote_literal(value):
+    """
+    Quotes a value as a SQL string literal.
+    :param value: the string to quote
+    :return: the quoted string
+    """
+    return "'" + value.replace("'", "''") + "'"
+
+
+class LocalWarehouseCursor:
+    """
+    The subset of a psycopg2 cursor that the pipeline uses, over a LocalWarehouseConnection.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def execute(self, sql):
+        """
+        Runs a Redshift statement, or several separated by semicolons, after translating it. Like psycopg2, the first
+        statement opens a transaction that lasts until commit() or rollback().
+        :param sql: the Redshift SQL text
+        :return: None
+        """
+        self.connection.begin()
+
+        if COPY_PATTERN.match(sql):
+            self.connection.copy(sql)
+        else:
+            self.connection.duckdb_connection.execute(translate_sql(sql))
+
+    def fetchone(self):
+        return self.connection.duckdb_connection.fetchone()
+
+    def fetchall(self):
+        return self.connection.duckdb_connection.fetchall()
+
+    def close(self):
+        pass
+
+
+class LocalWarehouseConnection:
+    """
+    A stand-in for a psycopg2 connection to Redshift, backed by a DuckDB connection, so that create_tables.py, etl.py
+    and the data quality checks can run on a laptop. SQL is translated with translate_sql(). COPY reads from a local
+    directory laid out like the S3 bucket: s3://<bucket>/<key> is read from <data root>/<bucket>/<key>.
+    """
+
+    def __init__(self, duckdb_connection, data_root):
+        """
+        :param duckdb_connection: a DuckDB connection, usually a cursor() of a shared database
+        :param data_root: the local directory standing in for S3
+        """
+        self.duckdb_connection = duckdb_connection
+        self.data_root = data_root
+        self.in_transaction = False
+        self.closed = 0
+
+        # Redshift divides integers with integer division
+        self.duckdb_connection.execute("SET integer_division = true")
+
+    def cursor(self):
+        return LocalWarehouseCursor(self)
+
+    def begin(self):
+        """
+        Opens a transaction if none is open yet, as psycopg2 does implicitly before the first statement.
+        :return: None
+        """
+        if not self.in_transaction:
+            self.duckdb_connection.execute("BEGIN TRANSACTION")
+            self.in_transaction = True
+
+    def commit(self):
+        if self.in_transaction:
+            self.in_transaction = False
+            self.duckdb_connection.execute("COMMIT")
+
+    def rollback(self):
+        if self.in_transaction:
+            self.in_transaction = False
+            self.duckdb_connection.execute("ROLLBACK")
+
+    def close(self):
+        if not self.closed:
+            self.rollback()
+            self.duckdb_connection.close()
+            self.closed = 1
+
+    def get_local_path(self, url):
+        """
+        Maps an S3 URL onto the local data root.
+        :param url: e.g. s3://farchila-udacity-final/precinct
+        :return: e.g. <data root>/farchila-udacity-final/precinct
+        """
+        return os.path.join(self.data_root, re.sub(r'^s3[an]?://', '', url))
+
+    def list_source_files(self, url, is_manifest):
+        """
+        Lists the files a COPY reads: every file whose path starts with the prefix, like S3 keys do, or the files
+        listed in a manifest. Empty and hidden files, e.g. _SUCCESS markers, are skipped.
+        :param url: the FROM of the COPY
+        :param is_manifest: whether url is a manifest rather than a prefix
+        :return: a sorted list of local file paths
+        """
+        if is_manifest:
+            with open(self.get_local_path(url)) as manifest_file:
+                entries = json.load(manifest_file)["entries"]
+
+            missing_paths = [self.get_local_path(entry["url"]) for entry in entries
+                             if entry.get("mandatory") and not os.path.exists(self.get_local_path(entry["url"]))]
+            if missing_paths:
+                raise duckdb.IOException("Mandatory files of the manifest {} are missing: {}".format(
+                    url, missing_paths))
+
+            return sorted(self.get_local_path(entry["url"]) for entry in entries
+                          if os.path.exists(self.get_local_path(entry["url"])))
+
+        prefix = self.get_local_path(url)
+        source_files = []
+
+        for directory, directory_names, file_names in os.walk(os.path.dirname(prefix)):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                if path.startswith(prefix) and not file_name.startswith(('_', '.')) and os.path.getsize(path) > 0:
+                    source_files.append(path)
+
+        return sorted(source_files)
+
+    def copy(self, sql):
+        """
+        Runs a Redshift COPY of CSV, JSON 'auto' or PARQUET data by reading the local files with DuckDB. As in
+        Redshift, CSV and Parquet columns are matched to the table's columns by position and JSON fields by name.
+        :param sql: the COPY statement, see SqlQueries.copy_sql_format
+        :return: None
+        """
+        table, url, options = COPY_PATTERN.match(sql).groups()
+        source_files = self.list_source_files(url, re.search(r'\bMANIFEST\b', options, re.IGNORECASE) is not None)
+        if not source_files:
+            raise duckdb.IOException("The specified S3 prefix '{}' does not exist under {}".format(url, self.data_root))
+
+        table_columns = [(column_name, column_type) for cid, column_name, column_type, *rest
+                         in self.duckdb_connection.execute("PRAGMA table_info({})".format(quote_literal(table)))
+                         .fetchall()]
+        file_list = "[{}]".format(", ".join(quote_literal(path) for path in source_files))
+        column_types = "{{{}}}".format(", ".join("{}: {}".format(quote_literal(column_name), quote_literal(column_type))
+                                                 for column_name, column_type in table_columns))
+
+        source_format = re.search(r'\bFORMAT\s+(?:AS\s+)?(\w+)', options, re.IGNORECASE).group(1).upper()
+        if source_format == 'CSV':
+            header_match = re.search(r'\bIGNOREHEADER\s+(\d+)', options, re.IGNORECASE)
+            source = "read_csv({}, header = false, skip = {}, columns = {}, quote = '\"', escape = '\"', " \
+                     "hive_partitioning = false)".format(file_list, header_match.group(1) if header_match else 0,
+                                                         column_types)
+        elif source_format == 'JSON':
+            source = "read_json({}, format = 'newline_delimited', columns = {}, hive_partitioning = false)".format(
+                file_list, column_types)
+        elif source_format == 'PARQUET':
+            source = "read_parquet({}, hive_partitioning = false)".format(file_list)
+        else:
+            raise duckdb.NotImplementedException("COPY FORMAT {} is not supported locally".format(source_format))
+
+        self.duckdb_connection.execute("INSERT INTO {} SELECT * FROM {}".format(table, source))
+
+
+class LocalWarehousePool(RedshiftConnectionPool):
+    """
+    A RedshiftConnectionPool of LocalWarehouseConnections to one DuckDB database file, selected with DWH_BACKEND=duckdb
+    in dwh.cfg. DuckDB runs in this process, so every connection of the pool is a cursor of the same database.
+    """
+
+    error_class = duckdb.Error
+
+    def __init__(self, database_path, data_root, min_connections=1, max_connections=4, health_check_seconds=60):
+        """
+        :param database_path: the DuckDB database file, created if it doesn't exist
+        :param data_root: the local directory standing in for S3, see LocalWarehouseConnection
+        :param min_connections: Optional. The number of connections opened up front and kept open
+        :param max_connections: Optional. The most connections the pool will open at once
+        :param health_check_seconds: Optional. Connections idle for longer than this are checked before reuse
+        """
+        self.database = duckdb.connect(database_path)
+        self.data_root = data_root
+
+        super().__init__(database_path, None, None, None, None, min_connections=min_connections,
+                         max_connections=max_connections, keepalives=False, health_check_seconds=health_check_seconds)
+
+    def connect(self):
+        return LocalWarehouseConnection(self.database.cursor(), self.data_root)
+
+    def source_exists(self, url, aws_key=None, aws_secret=None):
+        with self.connection() as connection:
+            return len(connection.list_source_files(url, False)) > 0
+
+    def closeall(self):
+        super().closeall()
+        self.database.close()
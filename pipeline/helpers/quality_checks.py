@@ -8,86 +8,137 @@ class DataQuality:
         'expected_number_of_rows': The number of rows you'd expect. If the actual row count returned is different, an
             alert is raised and the test fails.
     }
+    Queries in quality_check_dict_list only look at the current load: {min_summons_number} and {max_summons_number} are
+    replaced with the range of summons numbers in stage_parking_violations. Checks that need the whole fact table go in
+    full_sweep_quality_check_dict_list instead, and only run on a full sweep.
+    A check that a fact table's key exists in a dimension should instead be added to orphan_check_dict_list, with the
+    following key-value pairs, so that it is fused with the other checks on the same fact table:
+    {
+        'fact_table', 'fact_column': The fact table and its foreign key column.
+        'dimension_table', 'dimension_column': The dimension table and the key column the foreign key refers to.
+        'test_description': A human-readable description of the test. The test fails if any orphan key is found.
+    }
     """
     quality_check_dict_list = [
         {
             "query": """
-                select count(1) from fact_parkingviolation fp
+                select count(distinct spv.summons_number) from stage_parking_violations spv
                 union
-                select count(1) from stage_parking_violations spv;""",
-            "test_description": "Ensure grain hasn't changed and row counts match between fact and stage table",
+                select count(1) from fact_parkingviolation fp
+                join (select distinct summons_number from stage_parking_violations) spv
+                    on fp.parking_violation_key = spv.summons_number
+                where fp.parking_violation_key between {min_summons_number} and {max_summons_number};""",
+            "test_description": "Ensure grain hasn't changed and every violation of this load made it to the fact table",
             "expected_number_of_rows": 1
-        },
+        }
+    ]
+
+    full_sweep_quality_check_dict_list = [
         {
-            "query": """select 1 from fact_parkingviolation
-                left join dim_borough on fact_parkingviolation.borough_key = dim_borough.borough_key
-                where dim_borough.borough_key is null limit 1;""",
-            "test_description": "Verify no missing borough references",
+            "query": """select parking_violation_key from fact_parkingviolation
+                group by parking_violation_key
+                having count(1) > 1 limit 1;""",
+            "test_description": "Ensure no violation was loaded into the fact table twice",
             "expected_number_of_rows": 0
+        }
+    ]
+
+    # The sort key of each fact table, which holds the summons number, so that scoped checks only read the blocks of
+    # the current load
+    fact_scope_column_dict = {
+        "fact_parkingviolation": "parking_violation_key"
+    }
+
+    # Orphan key checks: every key of the fact table must exist in its dimension. Checks on the same fact table are
+    # fused into one query by get_orphan_check_query(), so the fact table is scanned once however many there are.
+    orphan_check_dict_list = [
+        {
+            "fact_table": "fact_parkingviolation", "fact_column": "borough_key",
+            "dimension_table": "dim_borough", "dimension_column": "borough_key",
+            "test_description": "Verify no missing borough references"
         },
         {
-            "query": """select 1 from fact_parkingviolation
-                left join dim_date on fact_parkingviolation.issue_date_key = dim_date.date_key
-                where dim_date.date_key is null limit 1;""",
-            "test_description": "Verify all issue dates exist",
-            "expected_number_of_rows": 0
+            "fact_table": "fact_parkingviolation", "fact_column": "issue_date_key",
+            "dimension_table": "dim_date", "dimension_column": "date_key",
+            "test_description": "Verify all issue dates exist"
         },
         {
-            "query": """select 1 from fact_parkingviolation
-                left join dim_date on fact_parkingviolation.vehicle_expiration_date_key = dim_date.date_key
-                where dim_date.date_key is null limit 1;""",
-            "test_description": "Verify all vehicle expiration dates exist",
-            "expected_number_of_rows": 0
+            "fact_table": "fact_parkingviolation", "fact_column": "vehicle_expiration_date_key",
+            "dimension_table": "dim_date", "dimension_column": "date_key",
+            "test_description": "Verify all vehicle expiration dates exist"
         },
         {
-            "query": """select 1 from fact_parkingviolation
-                left join dim_issuingagency
-                    on fact_parkingviolation.issuing_agency_key = dim_issuingagency.issuing_agency_key
-                where dim_issuingagency.issuing_agency_key is null limit 1;""",
-            "test_description": "Verify no missing issuing agencies",
-            "expected_number_of_rows": 0
+            "fact_table": "fact_parkingviolation", "fact_column": "issuing_agency_key",
+            "dimension_table": "dim_issuingagency", "dimension_column": "issuing_agency_key",
+            "test_description": "Verify no missing issuing agencies"
         },
         {
-            "query": """select 1 from fact_parkingviolation
-                left join dim_precinct on fact_parkingviolation.issuer_precinct_key = dim_precinct.precinct_key
-                where dim_precinct.precinct_key is null limit 1;""",
-            "test_description": "Verify no missing issuer precincts",
-            "expected_number_of_rows": 0
+            "fact_table": "fact_parkingviolation", "fact_column": "issuer_precinct_key",
+            "dimension_table": "dim_precinct", "dimension_column": "precinct_key",
+            "test_description": "Verify no missing issuer precincts"
         },
         {
-            "query": """select 1 from fact_parkingviolation
-                left join dim_precinct on fact_parkingviolation.violation_precinct_key = dim_precinct.precinct_key
-                where dim_precinct.precinct_key is null limit 1;""",
-            "test_description": "Verify no missing violation precincts",
-            "expected_number_of_rows": 0
+            "fact_table": "fact_parkingviolation", "fact_column": "violation_precinct_key",
+            "dimension_table": "dim_precinct", "dimension_column": "precinct_key",
+            "test_description": "Verify no missing violation precincts"
         },
         {
-            "query": """select 1 from fact_parkingviolation
-                left join dim_registrationstate
-                    on fact_parkingviolation.registration_state_key = dim_registrationstate.registration_state_key
-                where dim_registrationstate.registration_state_key is null limit 1;""",
-            "test_description": "Verify no missing registration states",
-            "expected_number_of_rows": 0
+            "fact_table": "fact_parkingviolation", "fact_column": "registration_state_key",
+            "dimension_table": "dim_registrationstate", "dimension_column": "registration_state_key",
+            "test_description": "Verify no missing registration states"
         },
         {
-            "query": """select 1 from fact_parkingviolation
-                left join dim_time on fact_parkingviolation.time_key = dim_time.time_key
-                where dim_time.time_key is null limit 1;""",
-            "test_description": "Verify all times are populated",
-            "expected_number_of_rows": 0
+            "fact_table": "fact_parkingviolation", "fact_column": "time_key",
+            "dimension_table": "dim_time", "dimension_column": "time_key",
+            "test_description": "Verify all times are populated"
         },
         {
-            "query": """select 1 from fact_parkingviolation
-                left join dim_vehicle on fact_parkingviolation.vehicle_key = dim_vehicle.vehicle_key
-                where dim_vehicle.vehicle_key is null limit 1;""",
-            "test_description": "Verify all vehicle keys are present",
-            "expected_number_of_rows": 0
+            "fact_table": "fact_parkingviolation", "fact_column": "vehicle_key",
+            "dimension_table": "dim_vehicle", "dimension_column": "vehicle_key",
+            "test_description": "Verify all vehicle keys are present"
         },
         {
-            "query": """select 1 from fact_parkingviolation
-                left join dim_violation on fact_parkingviolation.violation_key = dim_violation.violation_key
-                where dim_violation.violation_key is null limit 1;""",
-            "test_description": "Verify no missing violation keys",
-            "expected_number_of_rows": 0
+            "fact_table": "fact_parkingviolation", "fact_column": "violation_key",
+            "dimension_table": "dim_violation", "dimension_column": "violation_key",
+            "test_description": "Verify no missing violation keys"
         }
     ]
+
+    def get_orphan_check_groups(self):
+        """
+        Groups the orphan key checks by fact table, since all the checks of one fact table can share a single scan.
+        :return: A dictionary of fact table name -> list of orphan check dictionaries
+        """
+        orphan_check_groups = {}
+        for orphan_check_dict in self.orphan_check_dict_list:
+            orphan_check_groups.setdefault(orphan_check_dict["fact_table"], []).append(orphan_check_dict)
+
+        return orphan_check_groups
+
+    def get_orphan_check_query(self, fact_table, orphan_check_dict_list, summons_number_range=None):
+        """
+        Builds one query that counts the orphan keys of every given check in a single scan of the fact table: the fact
+        is LEFT JOINed to each dimension once per check, and a fact key without a match counts as an orphan of that
+        check. Dimension keys are primary keys, so the joins don't multiply fact rows.
+        :param fact_table: The fact table all the checks are on
+        :param orphan_check_dict_list: The orphan check dictionaries to fuse, see orphan_check_dict_list
+        :param summons_number_range: Optional. A (min, max) tuple; only fact rows with summons numbers in this range are
+        checked. If omitted, the whole fact table is checked.
+        :return: A SQL string returning one row, with one orphan count per check in the same order
+        """
+        orphan_counts = []
+        joins = []
+
+        for check_number, orphan_check_dict in enumerate(orphan_check_dict_list):
+            dimension_alias = "d{}".format(check_number)
+            orphan_counts.append("sum(case when {0}.{1} is null then 1 else 0 end) as orphans_{2}".format(
+                dimension_alias, orphan_check_dict["dimension_column"], check_number))
+            joins.append("left join {0} {1} on f.{2} = {1}.{3}".format(
+                orphan_check_dict["dimension_table"], dimension_alias, orphan_check_dict["fact_column"],
+                orphan_check_dict["dimension_column"]))
+
+        if summons_number_range is not None:
+            joins.append("where f.{} between {:d} and {:d}".format(
+                self.fact_scope_column_dict[fact_table], summons_number_range[0], summons_number_range[1]))
+
+        return "select\n    {}\nfrom {} f\n{};".format(",\n    ".join(orphan_counts), fact_table, "\n".join(joins))
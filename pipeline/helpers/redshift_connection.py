@@ -1,21 +1,358 @@
+import contextlib
+import datetime
+import re
+import threading
 import psycopg2
 
 
-def initialize_connection(endpoint, port_number, database_name, database_user, database_password):
+class RedshiftConnectionPool:
     """
-    Create and return a new connection to a cloud data warehouse with the provided parameters
-    :param endpoint: the FQDN or IP address of the target server
-    :param port_number: the port on which the database is listening
-    :param database_name: name of the database
-    :param database_user: username for the connection
-    :param database_password: password for the connection
-    :return: A psycopg2 connection object with which we can interact with the data warehouse
+    A thread-safe pool of connections to a cloud data warehouse, so that concurrent workers each get a connection of
+    their own without opening a new one every time and without ever holding more than max_connections at once.
+    Connections that have sat idle for a while are checked with a trivial query before being handed out, and replaced
+    if they have gone stale. Checkout counts and the time spent waiting for a free connection are recorded, both for
+    the pool and per connection, to help pick max_connections; see report().
     """
-    connection = psycopg2.connect('host={} port={} dbname={} user={} password={}'.format(
-        endpoint,
-        port_number,
-        database_name,
-        database_user,
-        database_password))
-
-    return connection
+
+    # The base class of the errors raised by connections of this pool
+    error_class = psycopg2.Error
+
+    def __init__(self, endpoint, port_number, database_name, database_user, database_password, min_connections=1,
+                 max_connections=4, statement_timeout_seconds=0, keepalives=True, keepalives_idle_seconds=60,
+                 health_check_seconds=60, connect_timeout_seconds=30):
+        """
+        Opens min_connections connections up front. More are opened on demand, up to max_connections.
+        :param endpoint: the FQDN or IP address of the target server
+        :param port_number: the port on which the database is listening
+        :param database_name: name of the database
+        :param database_user: username for the connection
+        :param database_password: password for the connection
+        :param min_connections: Optional. The number of connections opened up front and kept open
+        :param max_connections: Optional. The most connections the pool will open at once
+        :param statement_timeout_seconds: Optional. Statements running longer than this are cancelled by the server.
+        0 means no timeout.
+        :param keepalives: Optional. Enable TCP keepalives, so long COPYs and inserts aren't cut off by idle timeouts
+        between the client and the cluster
+        :param keepalives_idle_seconds: Optional. Seconds of inactivity before the first keepalive is sent
+        :param health_check_seconds: Optional. Connections idle for longer than this are checked before reuse
+        :param connect_timeout_seconds: Optional. How long to wait when opening a connection
+        """
+        if not 0 <= min_connections <= max_connections or max_connections < 1:
+            raise ValueError("Expected 0 <= min_connections <= max_connections and max_connections >= 1, got {} and {}"
+                             .format(min_connections, max_connections))
+
+        self.connect_kwargs = {
+            'host': endpoint,
+            'port': port_number,
+            'dbname': database_name,
+            'user': database_user,
+            'password': database_password,
+            'connect_timeout': connect_timeout_seconds
+        }
+        if keepalives:
+            self.connect_kwargs.update(keepalives=1, keepalives_idle=keepalives_idle_seconds, keepalives_interval=10,
+                                       keepalives_count=5)
+
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.statement_timeout_seconds = statement_timeout_seconds
+        self.health_check_seconds = health_check_seconds
+
+        self.condition = threading.Condition()
+        self.idle_connections = []
+        self.last_used = {}
+        self.connection_metrics = {}
+        self.all_connection_metrics = []
+        self.closed = False
+        self.open_connection_count = 0
+        self.in_use_count = 0
+
+        self.checkout_count = 0
+        self.waited_checkout_count = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.peak_in_use_count = 0
+        self.replaced_connection_count = 0
+
+        for i in range(min_connections):
+            self.idle_connections.append(self.open_connection())
+            self.open_connection_count += 1
+
+    def connect(self):
+        """
+        Opens a new connection to the data warehouse. Subclasses override this to pool connections to another backend.
+        :return: A psycopg2 connection object
+        """
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def source_exists(self, url, aws_key, aws_secret):
+        """
+        Checks that a COPY from an S3 prefix would find something to load, since Redshift fails a COPY whose prefix
+        matches no objects. Subclasses override this to look where their backend COPYs from.
+        :param url: the S3 prefix, e.g. s3://farchila-udacity-final/parking_violations/year_number=2020/month_number=7/
+        :param aws_key: Your AWS Key to authorize the connection to S3
+        :param aws_secret: Your AWS Secret to authorize the connection to S3
+        :return: True if at least one object starts with the prefix
+        """
+        # Imported here so that boto3 is only needed to stage a range of months
+        import boto3
+
+        bucket_name, prefix = re.match(r'^s3[an]?://([^/]+)/(.*)$', url).groups()
+        s3_client = boto3.client('s3', aws_access_key_id=aws_key, aws_secret_access_key=aws_secret)
+
+        return s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix, MaxKeys=1)['KeyCount'] > 0
+
+    def open_connection(self):
+        """
+        Opens a new connection and applies the session settings of the pool.
+        :return: A psycopg2 connection object
+        """
+        connection = self.connect()
+
+        if self.statement_timeout_seconds:
+            with connection.cursor() as crsr:
+                crsr.execute("SET statement_timeout TO {}".format(int(self.statement_timeout_seconds * 1000)))
+            connection.commit()
+
+        metrics = {'checkouts': 0, 'in_use_seconds': 0.0, 'wait_seconds': 0.0}
+        with self.condition:
+            self.last_used[id(connection)] = datetime.datetime.now()
+            self.connection_metrics[id(connection)] = metrics
+            self.all_connection_metrics.append(metrics)
+
+        return connection
+
+    def is_healthy(self, connection):
+        """
+        Checks that a connection is still usable. Recently used connections are trusted without a round trip.
+        :param connection: A psycopg2 connection object from this pool
+        :return: True if the connection can be handed out
+        """
+        if connection.closed:
+            return False
+
+        idle_seconds = (datetime.datetime.now() - self.last_used[id(connection)]).total_seconds()
+        if idle_seconds < self.health_check_seconds:
+            return True
+
+        try:
+            with connection.cursor() as crsr:
+                crsr.execute("select 1")
+                crsr.fetchall()
+            connection.rollback()
+            return True
+        except self.error_class:
+            return False
+
+    def close_connection(self, connection):
+        """
+        Closes a connection and forgets about it. Its metrics are kept for report().
+        :param connection: A psycopg2 connection object from this pool
+        :return: None
+        """
+        try:
+            connection.close()
+        except self.error_class:
+            pass
+
+        with self.condition:
+            self.last_used.pop(id(connection), None)
+            self.connection_metrics.pop(id(connection), None)
+
+    def getconn(self, timeout_seconds=None):
+        """
+        Checks out a connection, waiting for one to be returned if max_connections are already in use.
+        :param timeout_seconds: Optional. Give up after waiting this long, raising a TimeoutError
+        :return: A psycopg2 connection object, to be handed back with putconn()
+        """
+        wait_start_time = datetime.datetime.now()
+        waited = False
+
+        with self.condition:
+            while not self.idle_connections and self.open_connection_count >= self.max_connections:
+                waited = True
+                remaining_seconds = None
+                if timeout_seconds is not None:
+                    remaining_seconds = timeout_seconds - (datetime.datetime.now() - wait_start_time).total_seconds()
+                    if remaining_seconds <= 0:
+                        raise TimeoutError("No connection became free within {} seconds; all {} are in use".format(
+                            timeout_seconds, self.max_connections))
+
+                self.condition.wait(remaining_seconds)
+
+            if self.idle_connections:
+                connection = self.idle_connections.pop()
+            else:
+                # Reserve the slot now and connect outside of the lock, so other threads aren't held up meanwhile
+                connection = None
+                self.open_connection_count += 1
+
+            self.in_use_count += 1
+
+        try:
+            # The health check and connecting both involve a round trip, so they happen outside of the lock too
+            if connection is not None and not self.is_healthy(connection):
+                self.close_connection(connection)
+                connection = None
+                with self.condition:
+                    self.replaced_connection_count += 1
+
+            if connection is None:
+                connection = self.open_connection()
+        except Exception:
+            with self.condition:
+                self.open_connection_count -= 1
+                self.in_use_count -= 1
+                self.condition.notify()
+            raise
+
+        wait_seconds = (datetime.datetime.now() - wait_start_time).total_seconds()
+
+        with self.condition:
+            self.peak_in_use_count = max(self.peak_in_use_count, self.in_use_count)
+            self.checkout_count += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+            if waited:
+                self.waited_checkout_count += 1
+
+            metrics = self.connection_metrics[id(connection)]
+            metrics['checkouts'] += 1
+            metrics['wait_seconds'] += wait_seconds
+            self.last_used[id(connection)] = datetime.datetime.now()
+
+        return connection
+
+    def putconn(self, connection, close=False):
+        """
+        Returns a connection to the pool. Any transaction left open is rolled back. Connections that are broken, or
+        that the caller asks to close, are discarded, and the pool opens a new one when it next needs one.
+        :param connection: A psycopg2 connection object checked out with getconn()
+        :param close: Optional. Close the connection instead of keeping it for reuse
+        :return: None
+        """
+        with self.condition:
+            self.connection_metrics[id(connection)]['in_use_seconds'] += \
+                (datetime.datetime.now() - self.last_used[id(connection)]).total_seconds()
+
+        if not close and not connection.closed:
+            try:
+                connection.rollback()
+            except self.error_class:
+                close = True
+
+        if close or connection.closed or self.closed:
+            self.close_connection(connection)
+
+        with self.condition:
+            if close or connection.closed or self.closed:
+                self.open_connection_count -= 1
+            else:
+                self.last_used[id(connection)] = datetime.datetime.now()
+                self.idle_connections.append(connection)
+
+            self.in_use_count -= 1
+            self.condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self, timeout_seconds=None):
+        """
+        Checks out a connection for the duration of a with block, and returns it to the pool afterwards.
+        :param timeout_seconds: Optional. Give up after waiting this long for a free connection, see getconn()
+        :return: A context manager yielding a psycopg2 connection object
+        """
+        connection = self.getconn(timeout_seconds)
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def closeall(self):
+        """
+        Closes every idle connection. Connections still checked out are closed when they are returned.
+        :return: None
+        """
+        with self.condition:
+            self.closed = True
+            idle_connections, self.idle_connections = self.idle_connections, []
+            self.open_connection_count -= len(idle_connections)
+
+        for connection in idle_connections:
+            self.close_connection(connection)
+
+    def get_metrics(self):
+        """
+        Summarizes how the pool has been used so far.
+        :return: A dictionary of pool-wide metrics, with per-connection metrics under 'connections'
+        """
+        with self.condition:
+            return {
+                'max_connections': self.max_connections,
+                'open_connections': self.open_connection_count,
+                'in_use_connections': self.in_use_count,
+                'peak_in_use_connections': self.peak_in_use_count,
+                'checkouts': self.checkout_count,
+                'checkouts_that_waited': self.waited_checkout_count,
+                'total_wait_seconds': round(self.total_wait_seconds, 3),
+                'max_wait_seconds': round(self.max_wait_seconds, 3),
+                'replaced_connections': self.replaced_connection_count,
+                'connections': [dict(metrics) for metrics in self.all_connection_metrics]
+            }
+
+    def report(self):
+        """
+        Prints the pool metrics. Many checkouts that waited while the peak equals max_connections means the pool, or
+        the number of workers, is too small; a peak well below it means connections are being held for nothing.
+        :return: None
+        """
+        metrics = self.get_metrics()
+
+        print("Connection pool: {checkouts} checkouts, {checkouts_that_waited} of which waited for a free connection "
+              "({total_wait_seconds:.1f} seconds in total, {max_wait_seconds:.1f} at most). Peak of "
+              "{peak_in_use_connections} of {max_connections} connections in use; {replaced_connections} stale "
+              "connections replaced.".format(**metrics))
+
+        for connection_number, connection_metrics in enumerate(metrics['connections']):
+            print("  connection {}: {checkouts} checkouts, {in_use_seconds:.1f} seconds in use, {wait_seconds:.1f} "
+                  "seconds waited for".format(connection_number, **connection_metrics))
+
+
+def initialize_connection_pool(config, max_connections=None):
+    """
+    Create and return a pool of connections to the data warehouse configured in the [DWH] section of dwh.cfg, sized and
+    tuned by its [POOL] section. With DWH_BACKEND=duckdb, the pool instead holds connections to the local stand-in
+    configured in the [LOCAL] section, see helpers/local_warehouse.py.
+    :param config: a ConfigParser with dwh.cfg loaded
+    :param max_connections: Optional. Overrides POOL_MAX_CONNECTIONS from the config
+    :return: A RedshiftConnectionPool
+    """
+    if max_connections is None:
+        max_connections = config.getint('POOL', 'POOL_MAX_CONNECTIONS', fallback=4)
+
+    backend = config.get('DWH', 'DWH_BACKEND', fallback='redshift')
+    if backend not in ['redshift', 'duckdb']:
+        raise ValueError("DWH_BACKEND must be redshift or duckdb, got {}".format(backend))
+
+    if backend == 'duckdb':
+        # Imported here so that duckdb is only needed to run locally
+        from helpers.local_warehouse import LocalWarehousePool
+
+        return LocalWarehousePool(
+            config['LOCAL']['LOCAL_DATABASE'],
+            config['LOCAL']['LOCAL_DATA_ROOT'],
+            min_connections=min(config.getint('POOL', 'POOL_MIN_CONNECTIONS', fallback=1), max_connections),
+            max_connections=max_connections,
+            health_check_seconds=config.getint('POOL', 'POOL_HEALTH_CHECK_SECONDS', fallback=60))
+
+    return RedshiftConnectionPool(
+        config['DWH']['DWH_ENDPOINT'],
+        config['DWH']['DWH_PORT'],
+        config['DWH']['DWH_DB'],
+        config['DWH']['DWH_DB_USER'],
+        config['DWH']['DWH_DB_PASSWORD'],
+        min_connections=min(config.getint('POOL', 'POOL_MIN_CONNECTIONS', fallback=1), max_connections),
+        max_connections=max_connections,
+        statement_timeout_seconds=config.getint('POOL', 'POOL_STATEMENT_TIMEOUT_SECONDS', fallback=0),
+        keepalives=config.getboolean('POOL', 'POOL_KEEPALIVES', fallback=True),
+        keepalives_idle_seconds=config.getint('POOL', 'POOL_KEEPALIVES_IDLE_SECONDS', fallback=60),
+        health_check_seconds=config.getint('POOL', 'POOL_HEALTH_CHECK_SECONDS', fallback=60))
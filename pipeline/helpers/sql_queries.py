@@ -13,10 +13,86 @@ class SqlQueries:
     COMPUPDATE OFF
     STATUPDATE OFF"""
 
+    # Columnar formats only accept a subset of COPY parameters and are loaded by column position rather than by name
+    copy_columnar_sql_format = """COPY {}
+    FROM '{}'
+    ACCESS_KEY_ID '{}'
+    SECRET_ACCESS_KEY '{}'
+    FORMAT AS {}"""
+
     drop_sql_format = "DROP TABLE IF EXISTS {}"
 
+    # The load graph of the data warehouse: for each table, the tables it is built from and the commands that load it,
+    # in order. 'copy' loads a stage table from S3, 'truncate' empties the table first, 'merge' replaces the rows of the
+    # stage summons range with delete_range_ then insert_, and any other command is run with get_sql_command(). Tables
+    # whose dependencies have all been loaded can be loaded at the same time.
+    load_graph = {
+        'stage_issuingagency': {'depends_on': [], 'commands': ['truncate', 'copy']},
+        'stage_precinct': {'depends_on': [], 'commands': ['truncate', 'copy']},
+        'stage_registrationstate': {'depends_on': [], 'commands': ['truncate', 'copy']},
+        'stage_vehicle': {'depends_on': [], 'commands': ['truncate', 'copy']},
+        'stage_violation': {'depends_on': [], 'commands': ['truncate', 'copy']},
+        'stage_parking_violations': {'depends_on': [], 'commands': ['truncate', 'copy']},
+        'dim_registrationstate': {'depends_on': ['stage_registrationstate'], 'commands': ['truncate', 'insert']},
+        'dim_violation': {'depends_on': ['stage_violation'], 'commands': ['truncate', 'insert']},
+        'dim_borough': {'depends_on': ['stage_precinct'], 'commands': ['truncate', 'insert']},
+        'dim_precinct': {'depends_on': ['stage_precinct'], 'commands': ['truncate', 'insert']},
+        'dim_issuingagency': {'depends_on': ['stage_issuingagency'], 'commands': ['truncate', 'insert']},
+        'dim_vehicle': {'depends_on': ['stage_vehicle', 'stage_parking_violations'], 'commands': ['zerosk', 'insert']},
+        'dim_time': {'depends_on': ['stage_parking_violations'], 'commands': ['insert']},
+        'dim_date': {'depends_on': ['stage_parking_violations'], 'commands': ['insert']},
+        'fact_parkingviolation': {'depends_on': ['stage_parking_violations', 'stage_violation', 'stage_precinct',
+                                                 'dim_registrationstate', 'dim_violation', 'dim_borough',
+                                                 'dim_precinct', 'dim_issuingagency', 'dim_vehicle', 'dim_time',
+                                                 'dim_date'],
+                                  'commands': ['merge']}
+    }
+
+    # Where the fact rows come from, set by FACT_SOURCE in the [LOAD] section of dwh.cfg. 'sql' resolves every key of
+    # the fact table in insert_fact_parkingviolation. 'spark' COPYs the rows keyed by spark/build_fact_rows.py into
+    # stage_fact_parkingviolation, so that only the vehicle key is left to look up; it requires DIM_VEHICLE_MODE
+    # observed. For each source, the command that inserts the fact rows and the changes it makes to load_graph.
+    fact_sources = {
+        'sql': {
+            'insert_command': 'insert',
+            'load_graph': {}
+        },
+        'spark': {
+            'insert_command': 'insert_staged',
+            'load_graph': {
+                'stage_fact_parkingviolation': {'depends_on': [], 'commands': ['truncate', 'copy']},
+                'fact_parkingviolation': {'depends_on': ['stage_parking_violations', 'stage_fact_parkingviolation',
+                                                         'dim_registrationstate', 'dim_violation', 'dim_borough',
+                                                         'dim_precinct', 'dim_issuingagency', 'dim_vehicle',
+                                                         'dim_time', 'dim_date'],
+                                          'commands': ['merge']}
+            }
+        }
+    }
+
     truncate_sql_format = "TRUNCATE TABLE {}"
 
+    # How dim_vehicle is built, set by DIM_VEHICLE_MODE in the [LOAD] section of dwh.cfg. 'cross_product' builds every
+    # known make x body style x color, and the fact load finds a violation's vehicle by those three VARCHAR columns.
+    # 'observed' only builds the combinations that were actually ticketed, keyed by the vehicle_hash_key the Spark job
+    # computes, and the fact load finds the vehicle with a single BIGINT join on it. For each mode, the command that
+    # fills dim_vehicle and the condition on which insert_fact_parkingviolation joins it.
+    dim_vehicle_modes = {
+        'cross_product': {
+            'insert_command': 'insert',
+            'vehicle_join_condition': """replace(spv.vehicle_make, 'NaN', '') = dv.make
+            and spv.vehicle_body_type = dv.body_style
+            and spv.vehicle_color_standardized = dv.color_code"""
+        },
+        'observed': {
+            'insert_command': 'insert_observed',
+            'vehicle_join_condition': "spv.vehicle_hash_key = dv.vehicle_hash_key"
+        }
+    }
+
+    # The range of summons numbers in the current load, used to scope work to it
+    stage_summons_range_sql = "SELECT MIN(summons_number), MAX(summons_number) FROM stage_parking_violations"
+
     create_dim_borough = """CREATE TABLE IF NOT EXISTS dim_borough
     (
         borough_key INT PRIMARY KEY DISTKEY SORTKEY,
@@ -74,7 +150,8 @@ class SqlQueries:
         make VARCHAR(50),
         body_style VARCHAR(50),
         color_code VARCHAR(50),
-        color_description VARCHAR(50)
+        color_description VARCHAR(50),
+        vehicle_hash_key BIGINT
     )
     COMPOUND SORTKEY (make, body_style, color_code);
     """
@@ -157,8 +234,31 @@ class SqlQueries:
         violation_legal_code VARCHAR(255),
         violation_description VARCHAR(255),
         vehicle_color_standardized VARCHAR(3),
-        year_number INT,
-        month_number INT
+        time_key INT,
+        issue_date_key INT,
+        vehicle_expiration_date_key INT,
+        vehicle_hash_key BIGINT
+    );"""
+
+    create_stage_fact_parkingviolation = """CREATE TABLE IF NOT EXISTS stage_fact_parkingviolation
+    (
+        parking_violation_key BIGINT,
+        summons_number BIGINT,
+        plate_id VARCHAR(255),
+        registration_state_key VARCHAR(255),
+        plate_type VARCHAR(255),
+        fine_amount INT,
+        issue_date_key INT,
+        violation_key INT,
+        vehicle_hash_key BIGINT,
+        issuing_agency_key VARCHAR(255),
+        vehicle_expiration_date_key INT,
+        violation_precinct_key INT,
+        issuer_precinct_key INT,
+        borough_key INT,
+        time_key INT,
+        violation_address VARCHAR(255),
+        vehicle_year INT
     );"""
 
     create_stage_precinct = """CREATE TABLE IF NOT EXISTS stage_precinct
@@ -219,6 +319,10 @@ class SqlQueries:
         'Unknown' as borough_name;
     """
 
+    # Every day between the earliest and the latest date key of the load, plus the sentinel key 19000101 that the Spark
+    # job gives to missing and invalid dates. The day offsets come from cross-joining digits, which covers 100,000 days,
+    # since generate_series() only runs on the leader node and can't feed an insert. The Spark job only gives date keys
+    # from 1970 to 2099 (MIN_DATE_KEY_YEAR and MAX_DATE_KEY_YEAR in process_violations.py), which fit.
     insert_dim_date = """
     insert into dim_date
     (
@@ -232,18 +336,51 @@ class SqlQueries:
         is_weekday
     )
 
-    with datesource(date_key, calendar_date)
+    with digits(digit)
     as
     (
-        select distinct
-            cast(to_char(cast(issue_date as timestamp), 'YYYYMMDD') as int),
-            cast(issue_date as timestamp)
-        from stage_parking_violations spv
+        select 0 union all select 1 union all select 2 union all select 3 union all select 4 union all
+        select 5 union all select 6 union all select 7 union all select 8 union all select 9
+    ),
+
+    daterange(first_date, last_date)
+    as
+    (
+        select
+            to_date(cast(least(min(nullif(issue_date_key, 19000101)),
+                               min(nullif(vehicle_expiration_date_key, 19000101))) as varchar), 'YYYYMMDD'),
+            to_date(cast(greatest(max(nullif(issue_date_key, 19000101)),
+                                  max(nullif(vehicle_expiration_date_key, 19000101))) as varchar), 'YYYYMMDD')
+        from stage_parking_violations
+    ),
+
+    calendar(calendar_date)
+    as
+    (
+        select
+            cast(dateadd(day, ones.digit + tens.digit * 10 + hundreds.digit * 100 + thousands.digit * 1000
+                              + tenthousands.digit * 10000, daterange.first_date) as date)
+        from daterange
+        cross join digits ones
+        cross join digits tens
+        cross join digits hundreds
+        cross join digits thousands
+        cross join digits tenthousands
+        where ones.digit + tens.digit * 10 + hundreds.digit * 100 + thousands.digit * 1000
+                  + tenthousands.digit * 10000 <= datediff(day, daterange.first_date, daterange.last_date)
+    ),
+
+    datesource(date_key, calendar_date)
+    as
+    (
+        select
+            cast(to_char(calendar_date, 'YYYYMMDD') as int),
+            calendar_date
+        from calendar
         union
-        select distinct
-            cast(replace(left(replace(vehicle_expiration_date, '0E-8', '88880088.0'), len(replace(vehicle_expiration_date, '0E-8', '88880088.0'))-2), '88880088', '19000101') as int),
-            to_date(replace(left(replace(vehicle_expiration_date, '0E-8', '88880088.0'), len(replace(vehicle_expiration_date, '0E-8', '88880088.0'))-2), '88880088', '19000101'), 'YYYYMMDD')
-        from stage_parking_violations spv
+        select
+            19000101,
+            cast('1900-01-01' as date)
     )
 
     select
@@ -334,63 +471,36 @@ class SqlQueries:
         military_time_hour_number
     )
 
-    with times (violation_time, hour_num, minute_num, ap, stringtime)
-    as
-    (
-    select distinct  
-        violation_time,
-        left(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'), 2),
-        substring(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'), 3, 2),
-        case
-            when right(violation_time, 1) similar to '[0-9]' and left(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'), 2) >= 12
-                then 'P'
-            when right(violation_time, 1) similar to '[0-9]' and left(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'), 2) < 12
-                then 'A'
-            when right(violation_time, 1) similar to '[AP]'
-                then 
-                right(violation_time, 1)
-            else 'A'
-            end,
-        case
-            when right(violation_time, 1) = 'P'
-                then cast(cast(left(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'), len(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'))-1) as int) % 1200 + 1200 as varchar(10))
-            when right(violation_time, 1) = 'A'
-                then ltrim(to_char(cast(left(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'), len(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'))-1) as int) % 1200, '0999'))
-            when right(violation_time, 1) similar to '[0-9]'
-                then violation_time
-            else '0000'
-            end
-    from stage_parking_violations spv
-    ),
-
-    alltimes (stringtime, timeval, military_display_time, hour_num, minute_num, ap)
+    with times (time_key, military_hour_num, minute_num)
     as
     (
     select distinct
-        stringtime,
-        cast('1900-01-01 ' + left(stringtime, 2) + ':' + right(stringtime, 2) + ':00.000' as timestamp),
-        left(stringtime, 2) + ':' + right(stringtime, 2) as military_display_time,
-        case
-            when cast(left(stringtime, 2) as int) = 0 or cast(left(stringtime, 2) as int) > 12
-                then abs(cast(left(stringtime, 2) as int) - 12)
-            else cast(left(stringtime, 2) as int)
-            end as hour_num,
-        cast(right(stringtime, 2) as int),
-        ap + 'M'
-    from times
+        coalesce(spv.time_key, 0),
+        coalesce(spv.time_key, 0) / 60,
+        coalesce(spv.time_key, 0) % 60
+    from stage_parking_violations spv
     )
 
     select
-        datediff(minute, '1900-01-01 00:00:00', alltimes.timeval) as time_key,
-        alltimes.timeval as time_timestamp,
-        alltimes.hour_num as hour_number,
-        alltimes.minute_num as minute_number,
-        alltimes.ap as am_pm,
-        alltimes.military_display_time,
-        cast(left(alltimes.military_display_time, 2) as int) as military_time_hour_number
-    from alltimes
+        times.time_key,
+        dateadd(minute, times.time_key, '1900-01-01 00:00:00') as time_timestamp,
+        case
+            when times.military_hour_num = 0 or times.military_hour_num > 12
+                then abs(times.military_hour_num - 12)
+            else times.military_hour_num
+            end as hour_number,
+        times.minute_num as minute_number,
+        case
+            when times.military_hour_num >= 12
+                then 'PM'
+            else 'AM'
+            end as am_pm,
+        lpad(cast(times.military_hour_num as varchar), 2, '0') || ':' || lpad(cast(times.minute_num as varchar), 2, '0')
+            as military_display_time,
+        times.military_hour_num as military_time_hour_number
+    from times
     left join dim_time
-        on  datediff(minute, '1900-01-01 00:00:00', alltimes.timeval) = dim_time.time_key
+        on times.time_key = dim_time.time_key
     where dim_time.time_key is null;
     """
 
@@ -465,6 +575,67 @@ class SqlQueries:
     where dv.vehicle_key is null;
     """
 
+    # The vehicles ticketed in this load that dim_vehicle doesn't have yet. A hash key can only stand for one
+    # combination, so the aggregates merely pick it out of the group.
+    insert_observed_dim_vehicle = """
+    insert into dim_vehicle
+    (
+        vehicle_code,
+        make,
+        body_style,
+        color_code,
+        color_description,
+        vehicle_hash_key
+    )
+
+    with color (code, description) as
+    (
+        select 'BK', 'Black'
+        union
+        select 'WH', 'White'
+        union
+        select 'GY', 'Gray'
+        union
+        select 'BL', 'Blue'
+        union
+        select 'BR', 'Brown'
+        union
+        select 'GL', 'Gold'
+        union
+        select 'MR', 'Maroon'
+        union
+        select 'OR', 'Orange'
+        union
+        select 'PK', 'Pink'
+        union
+        select 'PR', 'Purple'
+        union
+        select 'RD', 'Red'
+        union
+        select 'TN', 'Tan'
+        union
+        select 'YW', 'Yellow'
+        union
+        select 'OTH', 'Other/Unknown'
+    ),
+
+    observed (vehicle_hash_key, make, body_style, color_code) as
+    (
+        select vehicle_hash_key, min(vehicle_make), min(vehicle_body_type), min(vehicle_color_standardized)
+        from stage_parking_violations spv
+        where vehicle_hash_key is not null
+        group by vehicle_hash_key
+    )
+
+    select 'VEH', o.make, o.body_style, o.color_code, coalesce(color.description, 'Other/Unknown'), o.vehicle_hash_key
+    from observed o
+    left join color
+        on o.color_code = color.code
+    left join dim_vehicle dv
+        on o.vehicle_hash_key = dv.vehicle_hash_key
+    where dv.vehicle_key is null;
+    """
+
     insert_dim_violation = """
     insert into dim_violation
     (
@@ -488,6 +659,7 @@ class SqlQueries:
         0 as fine_amount_other;
     """
 
+    # A violation staged more than once, e.g. from overlapping pages or a month staged twice, is inserted only once
     insert_fact_parkingviolation = """
     insert into fact_parkingviolation
     (
@@ -510,21 +682,6 @@ class SqlQueries:
         vehicle_year
     )
     
-    with processed_time
-    as
-    (select distinct
-        violation_time,
-        case
-            when right(violation_time, 1) = 'P'
-                then cast(cast(left(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'), len(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'))-1) as int) % 1200 + 1200 as varchar(10))
-            when right(violation_time, 1) = 'A'
-                then ltrim(to_char(cast(left(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'), len(regexp_replace(violation_time, '[a-zB-OQ-Z\s\. ]', '0'))-1) as int) % 1200, '0999'))
-            when right(violation_time, 1) similar to '[0-9]'
-                then violation_time
-            else '0000'
-            end as stringtime
-    from stage_parking_violations spv)
-    
     select
         spv.summons_number as parking_violation_key,
         spv.summons_number,
@@ -536,28 +693,24 @@ class SqlQueries:
                 then cast(sv.fineamount96thstbelow as int)
             else coalesce(cast(sv.fineamountother as int), 0)
             end as fine_amount,
-        cast(to_char(cast(spv.issue_date as timestamp), 'YYYYMMDD') as int) as issue_date_key,
+        spv.issue_date_key,
         coalesce(cast(sv."violation code" as int), 0) as violation_key,
         coalesce(dv.vehicle_key, 0) as vehicle_key,
         spv.issuing_agency as issuing_agency_key,
-        cast(
-            replace(
-                left(
-                    replace(spv.vehicle_expiration_date, '0E-8', '88880088.0'),
-                    len(replace(spv.vehicle_expiration_date, '0E-8', '88880088.0')) - 2),
-                '88880088', '19000101')
-            as int)
-            as vehicle_expiration_date_key,
+        spv.vehicle_expiration_date_key,
         coalesce(cast(violationprecinct.precinctcode as int), 0) as violation_precinct_key,
         coalesce(cast(issueprecinct.precinctcode as int), 0) as issuer_precinct_key,
         coalesce(db.borough_key, 0) as borough_key,
-        datediff(minute, '1900-01-01 00:00:00', cast(
-            '1900-01-01 ' + left(processed_time.stringtime, 2) + ':' + right(processed_time.stringtime, 2) + ':00.000'
-                as timestamp)
-            ) as time_key,
+        coalesce(spv.time_key, 0) as time_key,
         coalesce(nullif(spv.house_number, 'NaN') + ' ', '') + nullif(spv.street_name, 'NaN') as violation_address,
         cast(spv.vehicle_year as int)
-    from stage_parking_violations spv
+    from
+    (
+    select
+        stage_parking_violations.*,
+        row_number() over (partition by summons_number order by summons_number) as summons_row_number
+    from stage_parking_violations
+    ) spv
     left join stage_violation sv
         on spv.violation_code = sv."violation code"
     left join stage_precinct violationprecinct
@@ -567,14 +720,76 @@ class SqlQueries:
     left join stage_precinct issueprecinct
         on spv.issuer_precinct = issueprecinct.precinctcode
     left join dim_vehicle dv
-        on replace(spv.vehicle_make, 'NaN', '') = dv.make
-            and spv.vehicle_body_type = dv.body_style
-            and spv.vehicle_color_standardized = dv.color_code
-    join processed_time
-        on spv.violation_time = processed_time.violation_time
-    left join fact_parkingviolation f
-        on spv.summons_number = f.parking_violation_key
-    where f.parking_violation_key is null;
+        on {vehicle_join_condition}
+    where spv.summons_row_number = 1;
+    """
+
+    # The fact rows keyed by spark/build_fact_rows.py, which only lack the IDENTITY vehicle key of dim_vehicle. The
+    # Spark stage may have read more than was staged for this load, so only the violations in stage_parking_violations
+    # are inserted: exactly the ones delete_range_fact_parkingviolation removed. Each of them is inserted only once, however
+    # many times it was staged.
+    insert_staged_fact_parkingviolation = """
+    insert into fact_parkingviolation
+    (
+        parking_violation_key,
+        summons_number,
+        plate_id,
+        registration_state_key,
+        plate_type,
+        fine_amount,
+        issue_date_key,
+        violation_key,
+        vehicle_key,
+        issuing_agency_key,
+        vehicle_expiration_date_key,
+        violation_precinct_key,
+        issuer_precinct_key,
+        borough_key,
+        time_key,
+        violation_address,
+        vehicle_year
+    )
+
+    select
+        sfp.parking_violation_key,
+        sfp.summons_number,
+        sfp.plate_id,
+        sfp.registration_state_key,
+        sfp.plate_type,
+        sfp.fine_amount,
+        sfp.issue_date_key,
+        sfp.violation_key,
+        coalesce(dv.vehicle_key, 0) as vehicle_key,
+        sfp.issuing_agency_key,
+        sfp.vehicle_expiration_date_key,
+        sfp.violation_precinct_key,
+        sfp.issuer_precinct_key,
+        sfp.borough_key,
+        sfp.time_key,
+        sfp.violation_address,
+        sfp.vehicle_year
+    from
+    (
+    select
+        stage_fact_parkingviolation.*,
+        row_number() over (partition by parking_violation_key order by parking_violation_key) as summons_row_number
+    from stage_fact_parkingviolation
+    where parking_violation_key between {min_summons_number} and {max_summons_number}
+    ) sfp
+    left join dim_vehicle dv
+        on sfp.vehicle_hash_key = dv.vehicle_hash_key
+    where sfp.summons_row_number = 1
+        and exists(select 1 from stage_parking_violations spv where spv.summons_number = sfp.parking_violation_key);
+    """
+
+    # Run just before insert_fact_parkingviolation or insert_staged_fact_parkingviolation, in the same transaction, so
+    # that restaged violations replace the ones already loaded. The literal bounds let Redshift skip every block of the
+    # fact table outside the range.
+    delete_range_fact_parkingviolation = """
+    delete from fact_parkingviolation
+    using stage_parking_violations spv
+    where fact_parkingviolation.parking_violation_key between {min_summons_number} and {max_summons_number}
+        and fact_parkingviolation.parking_violation_key = spv.summons_number;
     """
 
     zerosk_dim_vehicle = """
@@ -591,6 +806,14 @@ class SqlQueries:
     where not exists(select 1 from dim_vehicle);
     """
 
+    def get_load_graph(self, fact_source='sql'):
+        """
+        Returns load_graph with the changes the given source of fact rows makes to it.
+        :param fact_source: Optional. A key of fact_sources
+        :return: A dictionary shaped like load_graph
+        """
+        return dict(self.load_graph, **self.fact_sources[fact_source]['load_graph'])
+
     def get_sql_command(self, table_name, table_action):
         """
         A helper function that will dynamically retrieve an attribute of the SqlQueries class, which are all SQL
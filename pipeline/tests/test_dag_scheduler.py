@@ -0,0 +1,142 @@
+import threading
+import time
+import pytest
+from helpers.dag_scheduler import get_critical_path, run_graph, select_nodes
+from helpers.sql_queries import SqlQueries
+
+
+GRAPH = {
+    'stage_a': {'depends_on': []},
+    'stage_b': {'depends_on': []},
+    'dim_a': {'depends_on': ['stage_a']},
+    'dim_b': {'depends_on': ['stage_a', 'stage_b']},
+    'fact': {'depends_on': ['dim_a', 'dim_b']},
+}
+
+
+class RecordingRunner:
+    """
+    A run_node function that records when each node started and finished, and can be told to fail some nodes.
+    """
+
+    def __init__(self, failing_nodes=(), seconds=0.01):
+        self.failing_nodes = set(failing_nodes)
+        self.seconds = seconds
+        self.events = []
+        self.lock = threading.Lock()
+
+    def __call__(self, node):
+        with self.lock:
+            self.events.append(('start', node))
+
+        time.sleep(self.seconds)
+        if node in self.failing_nodes:
+            raise RuntimeError(node + ' failed')
+
+        with self.lock:
+            self.events.append(('finish', node))
+
+    def started(self):
+        return [node for event, node in self.events if event == 'start']
+
+    def assert_dependencies_finished_first(self, graph):
+        for node in self.started():
+            start_index = self.events.index(('start', node))
+            for dependency in graph[node]['depends_on']:
+                assert ('finish', dependency) in self.events[:start_index], \
+                    '{} started before {} finished'.format(node, dependency)
+
+
+@pytest.mark.parametrize('max_workers', [1, 2, 4])
+def test_every_node_runs_after_its_dependencies(max_workers):
+    runner = RecordingRunner()
+
+    node_seconds = run_graph(GRAPH, runner, max_workers=max_workers)
+
+    assert sorted(runner.started()) == sorted(GRAPH)
+    assert sorted(node_seconds) == sorted(GRAPH)
+    runner.assert_dependencies_finished_first(GRAPH)
+
+
+def test_independent_nodes_run_at_the_same_time():
+    running_nodes = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def run_node(node):
+        with lock:
+            if running_nodes:
+                overlaps.append(node)
+            running_nodes.add(node)
+        time.sleep(0.05)
+        with lock:
+            running_nodes.remove(node)
+
+    run_graph(GRAPH, run_node, max_workers=2)
+
+    assert overlaps
+
+
+def test_target_list_runs_only_the_targets_and_their_dependencies():
+    runner = RecordingRunner()
+
+    run_graph(GRAPH, runner, max_workers=2, target_list=['dim_b'])
+
+    assert sorted(runner.started()) == ['dim_b', 'stage_a', 'stage_b']
+    runner.assert_dependencies_finished_first(GRAPH)
+
+
+def test_failure_stops_dependent_nodes_and_is_raised():
+    runner = RecordingRunner(failing_nodes=['stage_a'])
+
+    with pytest.raises(RuntimeError, match='stage_a failed'):
+        run_graph(GRAPH, runner, max_workers=1)
+
+    assert not {'dim_a', 'dim_b', 'fact'} & set(runner.started())
+
+
+def test_failure_lets_running_nodes_finish():
+    runner = RecordingRunner(failing_nodes=['stage_a'])
+    slow_runner_finished = []
+
+    def run_node(node):
+        if node == 'stage_b':
+            time.sleep(0.1)
+            slow_runner_finished.append(node)
+        else:
+            runner(node)
+
+    with pytest.raises(RuntimeError):
+        run_graph(GRAPH, run_node, max_workers=2)
+
+    assert slow_runner_finished == ['stage_b']
+    assert not {'dim_a', 'dim_b', 'fact'} & set(runner.started())
+
+
+def test_cycle_is_rejected():
+    graph = {'a': {'depends_on': ['b']}, 'b': {'depends_on': ['a']}}
+
+    with pytest.raises(ValueError, match='cycle'):
+        run_graph(graph, RecordingRunner())
+
+
+def test_unknown_target_is_rejected():
+    with pytest.raises(ValueError, match='Unknown table'):
+        select_nodes(GRAPH, ['dim_c'])
+
+
+def test_critical_path_is_the_slowest_chain():
+    node_seconds = {'stage_a': 1.0, 'stage_b': 5.0, 'dim_a': 3.0, 'dim_b': 1.0, 'fact': 2.0}
+
+    assert get_critical_path(GRAPH, node_seconds) == (['stage_b', 'dim_b', 'fact'], 8.0)
+
+
+@pytest.mark.parametrize('fact_source', sorted(SqlQueries.fact_sources))
+def test_load_graph_loads_every_table_after_its_dependencies(fact_source):
+    graph = SqlQueries().get_load_graph(fact_source)
+    runner = RecordingRunner(seconds=0)
+
+    run_graph(graph, runner, max_workers=4)
+
+    assert sorted(runner.started()) == sorted(graph)
+    runner.assert_dependencies_finished_first(graph)
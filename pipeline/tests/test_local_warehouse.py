@@ -0,0 +1,130 @@
+import datetime
+import re
+import pytest
+from helpers.local_warehouse import LocalWarehousePool, translate_sql
+from helpers.sql_queries import SqlQueries
+
+
+query_helper = SqlQueries()
+
+# Every table of both load graphs, i.e. every table create_tables.py creates
+TABLE_NAMES = sorted(set(query_helper.get_load_graph('sql')) | set(query_helper.get_load_graph('spark')))
+
+
+@pytest.fixture
+def warehouse(tmp_path):
+    """
+    A connection to an empty local warehouse with every table created from SqlQueries.
+    """
+    pool = LocalWarehousePool(str(tmp_path / 'warehouse.duckdb'), str(tmp_path / 'data'), max_connections=1)
+
+    with pool.connection() as connection:
+        with connection.cursor() as crsr:
+            for table in TABLE_NAMES:
+                crsr.execute(query_helper.get_sql_command(table, 'create'))
+        connection.commit()
+
+        yield connection
+
+    pool.closeall()
+
+
+def run_query(connection, sql):
+    with connection.cursor() as crsr:
+        crsr.execute(sql)
+        return crsr.fetchall()
+
+
+def get_merge_sql(fact_source, dim_vehicle_mode, min_summons_number, max_summons_number):
+    """
+    Builds the SQL of the fact table's 'merge' command the way etl.run_table_commands() does.
+    """
+    return query_helper.get_sql_command('fact_parkingviolation', 'delete_range').format(
+        min_summons_number=min_summons_number, max_summons_number=max_summons_number) + \
+        query_helper.get_sql_command(
+            'fact_parkingviolation', query_helper.fact_sources[fact_source]['insert_command']).format(
+            vehicle_join_condition=query_helper.dim_vehicle_modes[dim_vehicle_mode]['vehicle_join_condition'],
+            min_summons_number=min_summons_number, max_summons_number=max_summons_number)
+
+
+def test_translate_sql_string_concatenation():
+    sql = translate_sql("select coalesce(nullif(spv.house_number, 'NaN') + ' ', '') + nullif(spv.street_name, 'NaN'), "
+                        "spv.time_key + 1 from stage_parking_violations spv")
+
+    assert sql == "select coalesce(nullif(spv.house_number, 'NaN') || ' ', '') || nullif(spv.street_name, 'NaN'), " \
+                  "spv.time_key + 1 from stage_parking_violations spv"
+
+
+def test_translate_sql_leaves_plus_inside_literals_alone():
+    assert translate_sql("select '1 + 1' as sum_text") == "select '1 + 1' as sum_text"
+
+
+def test_translate_ddl_drops_keys_and_replaces_identity():
+    sql = translate_sql(query_helper.get_sql_command('dim_vehicle', 'create'))
+
+    assert 'CREATE SEQUENCE IF NOT EXISTS dim_vehicle_identity' in sql
+    assert "DEFAULT nextval('dim_vehicle_identity')" in sql
+    for redshift_only in (r'IDENTITY\s*\(', r'DISTKEY', r'SORTKEY', r'PRIMARY\s+KEY'):
+        assert re.search(redshift_only, sql, re.IGNORECASE) is None
+
+
+@pytest.mark.parametrize('redshift_sql, expected', [
+    ("select dateadd(minute, 90, '1900-01-01 00:00:00')", datetime.datetime(1900, 1, 1, 1, 30)),
+    ("select datediff(day, '2020-07-01', '2020-08-01')", 31),
+    ("select to_char(cast('2020-07-04' as timestamp), 'YYYYMMDD')", '20200704'),
+    ("select to_char(cast('2020-07-01' as timestamp), 'Day')", 'Wednesday'),
+    ("select to_char(cast('2020-07-04' as timestamp), 'Day')", 'Saturday '),
+    ("select to_date('20200704', 'YYYYMMDD')", datetime.date(2020, 7, 4)),
+    ("select len('0752A')", 5),
+    # Redshift divides integers with integer division, as insert_dim_time relies on
+    ("select 780 / 60", 13),
+])
+def test_translated_functions_match_redshift(warehouse, redshift_sql, expected):
+    assert run_query(warehouse, redshift_sql) == [(expected,)]
+
+
+@pytest.mark.parametrize('table', TABLE_NAMES)
+def test_load_commands_run(warehouse, table):
+    for fact_source in sorted(query_helper.fact_sources):
+        for command in query_helper.get_load_graph(fact_source).get(table, {}).get('commands', []):
+            if command == 'copy':
+                continue
+            elif command == 'truncate':
+                sql_list = [query_helper.truncate_sql_format.format(table)]
+            elif command == 'merge':
+                sql_list = [get_merge_sql(fact_source, dim_vehicle_mode, 1, 10)
+                            for dim_vehicle_mode in sorted(query_helper.dim_vehicle_modes)]
+            elif table == 'dim_vehicle' and command == 'insert':
+                sql_list = [query_helper.get_sql_command(table, mode['insert_command'])
+                            for mode in query_helper.dim_vehicle_modes.values()]
+            else:
+                sql_list = [query_helper.get_sql_command(table, command)]
+
+            for sql in sql_list:
+                run_query(warehouse, sql)
+                warehouse.commit()
+
+
+def test_insert_dim_time(warehouse):
+    run_query(warehouse, "insert into stage_parking_violations (summons_number, time_key) "
+                         "values (1, 0), (2, 90), (3, 780), (4, null), (5, 90)")
+    run_query(warehouse, query_helper.get_sql_command('dim_time', 'insert'))
+
+    assert run_query(warehouse, "select time_key, time_timestamp, hour_number, minute_number, am_pm, "
+                                "military_display_time, military_time_hour_number from dim_time order by time_key") == [
+        (0, datetime.datetime(1900, 1, 1, 0, 0), 12, 0, 'AM', '00:00', 0),
+        (90, datetime.datetime(1900, 1, 1, 1, 30), 1, 30, 'AM', '01:30', 1),
+        (780, datetime.datetime(1900, 1, 1, 13, 0), 1, 0, 'PM', '13:00', 13),
+    ]
+
+
+def test_insert_fact_parkingviolation_keeps_one_row_per_violation(warehouse):
+    run_query(warehouse, "insert into stage_parking_violations (summons_number, time_key, house_number, street_name) "
+                         "values (1, 90, '12', 'MAIN ST'), (2, null, 'NaN', 'BROADWAY'), (2, null, 'NaN', 'BROADWAY')")
+    run_query(warehouse, get_merge_sql('sql', 'cross_product', 1, 2))
+
+    assert run_query(warehouse, "select parking_violation_key, time_key, violation_address, vehicle_key "
+                                "from fact_parkingviolation order by parking_violation_key") == [
+        (1, 90, '12 MAIN ST', 0),
+        (2, 0, 'BROADWAY', 0),
+    ]
@@ -0,0 +1,192 @@
+import os
+import threading
+
+
+class AdaptiveBatchSizer:
+    """
+    Chooses how many rows to ask Socrata for on each call from what the previous calls cost. After every full page the
+    size moves towards the number of rows Socrata can return within the target latency, then is capped so that the
+    pages held at once fit in the memory budget: the smaller of the configured ceiling and a share of the memory
+    currently available, estimated from the bytes per row observed so far. The result is kept within the configured
+    bounds. A page that times out or is throttled cuts the size at once, and is retried at the smaller size. Every
+    change is printed with the limit that decided it. With equal bounds the size is fixed.
+    """
+
+    # Rows held as Python dictionaries, then as Arrow or Pandas, take several times their JSON size in memory
+    MEMORY_PER_PAYLOAD_BYTE = 4
+    # Only this share of the memory currently available is budgeted for pages, the rest is left to Spark
+    AVAILABLE_MEMORY_SHARE = 0.5
+    # The most the size may grow or shrink after a single page, so one unusually fast or slow response can't swing it
+    MAX_STEP = 2
+    # Smaller changes than this share of the current size are ignored, so the size does not wobble from page to page
+    MIN_CHANGE = 0.1
+    # The Socrata client waits this many times the target latency for a response, so pages near the target are never
+    # cut off, while a page far slower than it times out and is retried smaller
+    REQUEST_TIMEOUT_FACTOR = 2
+
+    def __init__(self, batch_size, min_batch_size=None, max_batch_size=None, target_seconds=30.0,
+                 memory_ceiling_bytes=None, pages_in_memory=1):
+        """
+        :param batch_size: the number of rows to ask for first
+        :param min_batch_size: Optional. The fewest rows to ask for. Defaults to batch_size.
+        :param max_batch_size: Optional. The most rows to ask for. Defaults to batch_size.
+        :param target_seconds: Optional. The response time the size is adjusted towards
+        :param memory_ceiling_bytes: Optional. The most memory the pages held at once may take
+        :param pages_in_memory: Optional. How many pages can be held at once, e.g. in flight on several threads or
+            waiting in a PrefetchQueue
+        """
+        self.min_batch_size = min_batch_size or batch_size
+        self.max_batch_size = max(max_batch_size or batch_size, self.min_batch_size)
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.target_seconds = target_seconds
+        self.memory_ceiling_bytes = memory_ceiling_bytes
+        self.pages_in_memory = max(1, pages_in_memory)
+        self.bytes_per_row = None
+        self.smallest_batch_size = self.largest_batch_size = self.batch_size
+        self.changes = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Shipped to the executors, where every task adapts its own copy
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def adaptive(self):
+        return self.min_batch_size < self.max_batch_size
+
+    @property
+    def request_timeout_seconds(self):
+        return self.target_seconds * self.REQUEST_TIMEOUT_FACTOR
+
+    def next_size(self):
+        """
+        :return: the number of rows to ask for in the next call
+        """
+        with self._lock:
+            return self.batch_size
+
+    def get_memory_budget(self):
+        """
+        Works out how much memory a single page may take.
+        :return: the budget in bytes, or None if there is no ceiling and the available memory is unknown
+        """
+        budgets = []
+        if self.memory_ceiling_bytes:
+            budgets.append(self.memory_ceiling_bytes)
+
+        available_bytes = get_available_memory_bytes()
+        if available_bytes is not None:
+            budgets.append(available_bytes * self.AVAILABLE_MEMORY_SHARE)
+
+        if len(budgets) == 0:
+            return None
+
+        return min(budgets) / self.pages_in_memory
+
+    def record(self, limit, row_count, seconds, payload_bytes):
+        """
+        Adjusts the size from a page that was just fetched.
+        :param limit: the number of rows asked for
+        :param row_count: the number of rows returned
+        :param seconds: how long the response took
+        :param payload_bytes: the size of the response body
+        :return: None
+        """
+        if not self.adaptive or row_count == 0:
+            return
+
+        with self._lock:
+            # React to wider rows at once, but forget them slowly
+            bytes_per_row = payload_bytes / row_count
+            self.bytes_per_row = bytes_per_row if self.bytes_per_row is None \
+                else max(bytes_per_row, 0.75 * self.bytes_per_row)
+
+            size = self.batch_size
+            reason = None
+
+            # A short page ends its range and its latency says little about larger ones
+            if row_count >= limit and seconds > 0:
+                size = int(row_count / seconds * self.target_seconds)
+                size = min(max(size, limit // self.MAX_STEP), limit * self.MAX_STEP)
+                reason = 'latency: {} rows in {:.3g} s, target {:g} s'.format(
+                    row_count, seconds, self.target_seconds)
+
+            memory_budget = self.get_memory_budget()
+            if memory_budget is not None:
+                memory_size = int(memory_budget / (self.bytes_per_row * self.MEMORY_PER_PAYLOAD_BYTE))
+                if memory_size < size:
+                    size = memory_size
+                    reason = 'memory: {:.1f} MB per page at {:.0f} bytes per row'.format(
+                        memory_budget / 1024 ** 2, self.bytes_per_row)
+
+            if size > self.max_batch_size:
+                size = self.max_batch_size
+                reason = 'the maximum batch size'
+            elif size < self.min_batch_size:
+                size = self.min_batch_size
+                reason = 'the minimum batch size'
+
+            if size != self.batch_size and (size in (self.min_batch_size, self.max_batch_size) or
+                                            abs(size - self.batch_size) > self.MIN_CHANGE * self.batch_size):
+                print('Batch size {} -> {} rows, limited by {}.'.format(self.batch_size, size, reason))
+                self.batch_size = size
+                self.smallest_batch_size = min(self.smallest_batch_size, size)
+                self.largest_batch_size = max(self.largest_batch_size, size)
+                self.changes += 1
+
+    def shrink(self, limit, reason):
+        """
+        Cuts the size after a call failed in a way a smaller page may avoid, so that its retry and the calls after it
+        ask for fewer rows.
+        :param limit: the number of rows the failed call asked for
+        :param reason: what the call failed with, e.g. 'a timeout'
+        :return: the number of rows to ask for in the retry
+        """
+        if not self.adaptive:
+            return limit
+
+        with self._lock:
+            # Another thread may already have shrunk the size below what this call asked for
+            size = max(min(self.batch_size, limit // self.MAX_STEP), self.min_batch_size)
+
+            if size < self.batch_size:
+                print('Batch size {} -> {} rows, after {}.'.format(self.batch_size, size, reason))
+                self.batch_size = size
+                self.smallest_batch_size = min(self.smallest_batch_size, size)
+                self.changes += 1
+
+            return size
+
+    def report(self):
+        """
+        Prints the range of sizes used.
+        :return: None
+        """
+        if self.adaptive:
+            print('Batch size summary: asked for {} to {} rows per call with {} change(s), ending at {}.'.format(
+                self.smallest_batch_size, self.largest_batch_size, self.changes, self.batch_size))
+
+
+def get_available_memory_bytes():
+    """
+    Reads how much memory this machine can still hand out without swapping.
+    :return: the available memory in bytes, or None if it can't be determined
+    """
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
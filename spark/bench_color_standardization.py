@@ -0,0 +1,123 @@
+import argparse
+import random
+import re
+import time
+from pyspark.sql import SparkSession
+import pyspark.sql.functions as f
+from pyspark.sql.types import *
+from process_violations import create_color_standardizer, standardize_color
+
+
+# A sample of raw 'vehicle_color' inputs as officers actually type them, plus a few that should fall through to 'OTH'
+SAMPLE_COLORS = ['BLACK', 'BLK', 'BK', 'Black', 'WHITE', 'WHT', 'WH', 'WT', 'GRAY', 'GREY', 'GY', 'GRY', 'BLUE', 'BL',
+                 'BLU', 'BROWN', 'BR', 'BRN', 'GOLD', 'GL', 'GLD', 'MAROON', 'MR', 'ORANGE', 'OR', 'PINK', 'PK',
+                 'PURPLE', 'PR', 'RED', 'RD', 'TAN', 'TN', 'YELLOW', 'YW', 'YELLO', 'SILVER', 'SILVR', 'SL', 'GREEN',
+                 'GRN', 'GR', 'BEIGE', 'OTHER', 'UNK', 'b l k', '', None]
+
+
+@f.udf(returnType=StringType())
+def color_udf(r):
+    """
+    A Spark User-Defined-Function (udf) intended to process every row of the DataFrame's 'vehicle_color' column
+    and match the most likely standard color code based on the officer's original input. This is the row-at-a-time
+    version process_violations.py used to apply, kept here as the reference the lookup-based standardizer is
+    checked and timed against.
+    :param r: a single row of the DataFrame to be processed
+    :return: a color code from a standardized list based on the outcome of the Regex match algorithm
+    """
+
+    color_list = ['B{}K', 'W{}H', 'G{}Y', 'B{}L', 'B{}R', 'G{}L', 'M{}R', 'O{}R', 'P{}K', 'P{}R', 'R{}D', 'T{}N',
+                  'Y{}W']
+    if r is not None:
+        mid_pattern = "+[A-Z]{0,}"
+        color_input = r.upper()
+
+        for color in color_list:
+            color_match = re.match(color.format(mid_pattern), color_input)
+            if color_match is not None:
+                # returns the first match. Codes above are two letters only, so we combine the first and last letter.
+                return color[0] + color[-1]
+
+        return 'OTH'
+
+    else:
+        return 'OTH'
+
+
+def create_local_spark_session():
+    """
+    Instantiates a local Spark session for benchmarking, independent of the EMR configuration
+    :return: SparkSession object
+    """
+    return SparkSession.builder.master("local[*]").appName("bench_color_standardization").getOrCreate()
+
+
+def generate_colors(row_count, distinct_count, seed):
+    """
+    Generates raw color values with roughly the distribution of the real dataset: a handful of common spellings plus a
+    long tail of distinct free-text inputs.
+    :param row_count: the number of rows to generate
+    :param distinct_count: the approximate number of distinct values to generate
+    :param seed: the random seed, so that runs are comparable
+    :return: a list of single-value tuples ready for spark.createDataFrame
+    """
+    rng = random.Random(seed)
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    tail = [''.join(rng.choice(letters) for _ in range(rng.randint(2, 6))) for _ in range(distinct_count)]
+    values = SAMPLE_COLORS + tail
+
+    return [(rng.choice(SAMPLE_COLORS) if rng.random() < 0.9 else rng.choice(values),) for _ in range(row_count)]
+
+
+def time_write(sdf):
+    """
+    Forces full evaluation of a DataFrame without writing any output
+    :param sdf: the Spark DataFrame to evaluate
+    :return: elapsed seconds
+    """
+    start_time = time.perf_counter()
+    sdf.write.format("noop").mode("overwrite").save()
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the row-at-a-time color UDF with the ColumnStandardizer")
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--distinct", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    spark = create_local_spark_session()
+
+    rows = generate_colors(args.rows, args.distinct, args.seed)
+    schema = StructType([StructField("vehicle_color", StringType(), True)])
+    sdf = spark.createDataFrame(rows, schema).cache()
+    sdf.count()
+
+    # Correctness first: every distinct value must produce exactly the same code as the original UDF
+    distinct_values = [r[0] for r in sdf.distinct().collect()]
+    mismatches = [v for v in distinct_values if standardize_color(v) != color_udf.func(v)]
+    print("Distinct values checked: {}, mismatches: {}".format(len(distinct_values), len(mismatches)))
+
+    udf_seconds = time_write(sdf.withColumn("vehicle_color_standardized", color_udf("vehicle_color")))
+
+    standardizer = create_color_standardizer()
+    start_time = time.perf_counter()
+    standardizer.update(distinct_values)
+    resolve_seconds = time.perf_counter() - start_time
+    standardizer_seconds = time_write(standardizer.standardize(spark, sdf)) + resolve_seconds
+
+    both = sdf.withColumn("udf_code", color_udf("vehicle_color"))
+    row_mismatches = standardizer.standardize(spark, both) \
+        .where(f.col("udf_code") != f.col("vehicle_color_standardized")).count()
+    print("Row-level mismatches against color_udf: {}".format(row_mismatches))
+
+    print("color_udf:          {:.2f} s, {:,.0f} rows/s".format(udf_seconds, args.rows / udf_seconds))
+    print("ColumnStandardizer: {:.2f} s, {:,.0f} rows/s (of which {:.3f} s resolving {} distinct values)".format(
+        standardizer_seconds, args.rows / standardizer_seconds, resolve_seconds, len(distinct_values)))
+
+    spark.stop()
+
+
+if __name__ == "__main__":
+    main()
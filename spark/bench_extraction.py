@@ -0,0 +1,193 @@
+import argparse
+import datetime
+import itertools
+import json
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from generate_violations import generate_chunk_records, get_default_chunk_count, split_rows
+from socrata_stand_in import SocrataStandIn
+
+
+def run_worker(settings):
+    """
+    Runs one extraction from the Socrata stand-in in this process, so that peak RSS belongs to that run alone.
+    :param settings: a dictionary with the stand-in URL, the expected row count and the extraction settings
+    :return: a dictionary of measurements
+    """
+    # Imported here so that the parent process never starts a JVM of its own
+    from pyspark.sql import SparkSession
+    from process_violations import process_parking_violations
+
+    spark = SparkSession.builder.master("local[*]").appName("bench_extraction").getOrCreate()
+    output_data = tempfile.mkdtemp(prefix="bench_extraction_")
+    baseline_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    try:
+        start_time = time.perf_counter()
+        job_counter = process_parking_violations(
+            spark, settings['dataset_id'], output_data, batch_size=settings['batch_size'],
+            shard_count=settings['shards'], max_workers=settings['fetch_workers'], extract_on=settings['extract_on'],
+            ingest=settings['ingest'], prefetch_depth=settings['prefetch_depth'],
+            output_format=settings['output_format'], socrata_domain=settings['socrata_domain'],
+            min_batch_size=settings.get('min_batch_size'), max_batch_size=settings.get('max_batch_size'),
+            target_page_seconds=settings.get('target_page_seconds', 30.0))
+        seconds = time.perf_counter() - start_time
+    finally:
+        spark.stop()
+        shutil.rmtree(output_data, ignore_errors=True)
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    jobs_per_batch = job_counter.jobs_per_batch if job_counter is not None else []
+
+    return {
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(settings['rows'] / seconds, 1),
+        "driver_peak_rss_mb": round(peak_rss_kb / 1024.0, 1),
+        "driver_rss_growth_mb": round((peak_rss_kb - baseline_rss_kb) / 1024.0, 1),
+        "batches": len(jobs_per_batch),
+        "spark_jobs": sum(jobs_per_batch),
+        "max_spark_jobs_per_batch": max(jobs_per_batch, default=0)
+    }
+
+
+def get_settings_grid(args):
+    """
+    Lists the extraction settings to measure: every combination of the batch sizes, shard counts and extraction sides
+    asked for. Sharded runs on the driver fetch with one worker per shard. With batch size bounds, every batch size is
+    only where the adaptive batch size starts.
+    :param args: the parsed command line
+    :return: a list of dictionaries of settings
+    """
+    return [{"batch_size": batch_size, "shards": shards, "fetch_workers": shards, "extract_on": extract_on,
+             "prefetch_depth": prefetch_depth, "ingest": args.ingest, "output_format": args.output_format,
+             "min_batch_size": args.min_batch_size, "max_batch_size": args.max_batch_size,
+             "target_page_seconds": args.target_page_seconds}
+            for batch_size, shards, extract_on, prefetch_depth in itertools.product(
+                args.batch_sizes, args.shards, args.extract_on, args.prefetch_depths)
+            # Prefetching only applies to pages fetched on the driver
+            if not (extract_on == 'executors' and prefetch_depth > 0)]
+
+
+def get_settings_key(result):
+    return tuple(result.get(name) for name in ["batch_size", "min_batch_size", "max_batch_size", "shards",
+                                               "extract_on", "prefetch_depth", "ingest", "output_format"])
+
+
+def print_results(results, baseline_results=None):
+    """
+    Prints the results as a markdown table, with the throughput relative to a previous run where it has the same
+    settings.
+    :param results: the list of results of this run
+    :param baseline_results: Optional. The list of results of a previous run to compare with
+    :return: None
+    """
+    baseline_throughput = {get_settings_key(result): result["rows_per_second"] for result in baseline_results or []}
+
+    print("|batch size|bounds|shards|extract on|prefetch|rows/s|vs baseline|driver peak RSS (MB)|batches|Spark jobs|"
+          "max jobs per batch|requests|throttled|")
+    print("|---|---|---|---|---|---|---|---|---|---|---|---|---|")
+
+    for result in results:
+        baseline = baseline_throughput.get(get_settings_key(result))
+        relative = "{:+.0%}".format(result["rows_per_second"] / baseline - 1) if baseline else "-"
+        bounds = "{}-{}".format(result.get("min_batch_size") or result["batch_size"],
+                                result.get("max_batch_size") or result["batch_size"])
+
+        print("|{batch_size}|{bounds}|{shards}|{extract_on}|{prefetch_depth}|{rows_per_second:.0f}|{relative}|"
+              "{driver_peak_rss_mb}|{batches}|{spark_jobs}|{max_spark_jobs_per_batch}|{requests}|{throttled_requests}|"
+              .format(relative=relative, bounds=bounds, **result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks process_violations.py end to end against a local Socrata "
+                                                 "stand-in, across batch sizes and concurrency settings")
+    parser.add_argument("--rows", type=int, default=200000, help="The number of rows the stand-in serves")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--min-batch-size", type=int,
+                        help="Let the batch size adapt down to this many rows, starting from each of --batch-sizes")
+    parser.add_argument("--max-batch-size", type=int,
+                        help="Let the batch size adapt up to this many rows, starting from each of --batch-sizes")
+    parser.add_argument("--target-page-seconds", type=float, default=30.0,
+                        help="The response time the adaptive batch size aims for")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--extract-on", choices=['driver', 'executors'], nargs="+", default=['driver', 'executors'])
+    parser.add_argument("--prefetch-depths", type=int, nargs="+", default=[0])
+    parser.add_argument("--ingest", choices=['arrow', 'pandas'], default='arrow')
+    parser.add_argument("--output-format", choices=['json', 'parquet'], default='json')
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latency the stand-in adds to every response")
+    parser.add_argument("--latency-ms-per-1000-rows", type=float, default=20.0,
+                        help="Latency the stand-in adds per 1000 rows returned")
+    parser.add_argument("--max-requests-per-second", type=float,
+                        help="Throttle the stand-in to this many requests per second")
+    parser.add_argument("--max-concurrent-requests", type=int,
+                        help="Throttle the stand-in to this many requests in flight")
+    parser.add_argument("--results", default="bench_extraction_results.json",
+                        help="The JSON file in which the settings and results of this run are saved")
+    parser.add_argument("--compare", help="The results JSON of a previous run to compare throughput with")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return
+
+    started_at = datetime.datetime.now().isoformat(timespec='seconds')
+
+    baseline_results = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline_results = json.load(baseline_file)["results"]
+
+    records = [record for chunk in split_rows(args.rows, get_default_chunk_count(args.rows), 1400000000)
+               for record in generate_chunk_records(chunk, args.seed, 2021)]
+    stand_in = SocrataStandIn(records, latency_seconds=args.latency_ms / 1000.0,
+                              latency_seconds_per_1000_rows=args.latency_ms_per_1000_rows / 1000.0,
+                              max_requests_per_second=args.max_requests_per_second,
+                              max_concurrent_requests=args.max_concurrent_requests)
+    socrata_domain = stand_in.start()
+    del records
+
+    results = []
+    try:
+        for settings in get_settings_grid(args):
+            print("Extracting {} rows with {}".format(args.rows, settings), flush=True)
+            stats_before = stand_in.get_stats()
+
+            worker_settings = dict(settings, socrata_domain=socrata_domain, dataset_id=stand_in.dataset_id,
+                                   rows=args.rows)
+            output = subprocess.run([sys.executable, __file__, "--worker", json.dumps(worker_settings)], check=True,
+                                    capture_output=True, text=True).stdout
+
+            stats_after = stand_in.get_stats()
+            results.append(dict(settings, **json.loads(output.strip().splitlines()[-1]),
+                                requests=stats_after['requests'] - stats_before['requests'],
+                                throttled_requests=stats_after['throttled_requests'] -
+                                stats_before['throttled_requests']))
+    finally:
+        stand_in.stop()
+
+    with open(args.results, 'w') as results_file:
+        json.dump({
+            "started_at": started_at,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rows": args.rows,
+            "seed": args.seed,
+            "stand_in": {"latency_ms": args.latency_ms, "latency_ms_per_1000_rows": args.latency_ms_per_1000_rows,
+                         "max_requests_per_second": args.max_requests_per_second,
+                         "max_concurrent_requests": args.max_concurrent_requests},
+            "results": results
+        }, results_file, indent=2)
+
+    print_results(results, baseline_results)
+    print("Saved the results to " + args.results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+from pyspark.sql import SparkSession
+from process_violations import PARKING_VIOLATIONS_COLUMNS, create_standardizers, records_to_spark
+
+
+def make_sample_records(row_count, seed):
+    """
+    Builds a page of rows shaped like a Socrata response: every value is a string and some optional fields are left
+    out entirely, as Socrata does for nulls.
+    :param row_count: the number of rows to build
+    :param seed: the random seed, so that runs are comparable
+    :return: a list of dictionaries, one per row
+    """
+    rng = random.Random(seed)
+    optional_columns = ['house_number', 'intersecting_street', 'meter_number', 'time_first_observed',
+                        'violation_legal_code', 'unregistered_vehicle', 'violation_post_code']
+    records = []
+
+    for i in range(row_count):
+        record = {column: 'X' * rng.randint(1, 12) for column in PARKING_VIOLATIONS_COLUMNS}
+        record['summons_number'] = str(1000000000 + i)
+        record['issue_date'] = '2020-{:02d}-{:02d}T00:00:00.000'.format(rng.randint(1, 12), rng.randint(1, 28))
+        record['vehicle_color'] = rng.choice(['BLK', 'WHITE', 'GY', 'BLUE', 'RED', 'SILVR', 'BRN', 'TAN'])
+        record['violation_time'] = '{:02d}{:02d}{}'.format(rng.randint(1, 12), rng.randint(0, 59), rng.choice('AP'))
+        for column in optional_columns:
+            if rng.random() < 0.5:
+                del record[column]
+        records.append(record)
+
+    return records
+
+
+def run_worker(ingest, row_count, seed):
+    """
+    Measures a single ingest path in this process, so that peak RSS belongs to that path alone.
+    :param ingest: 'arrow' or 'pandas'
+    :param row_count: the number of rows per batch
+    :param seed: the random seed
+    :return: a dictionary of measurements
+    """
+    spark = SparkSession.builder.master("local[*]").appName("bench_ingest").getOrCreate()
+    if ingest == 'arrow':
+        spark.conf.set("spark.sql.execution.arrow.pyspark.enabled", "true")
+
+    records = make_sample_records(row_count, seed)
+    baseline_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start_time = time.perf_counter()
+    sdf = records_to_spark(spark, records, create_standardizers(), ingest)
+    conversion_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    sdf.write.format("noop").mode("overwrite").save()
+    write_seconds = time.perf_counter() - start_time
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    spark.stop()
+
+    return {
+        "ingest": ingest,
+        "rows": row_count,
+        "conversion_seconds": round(conversion_seconds, 3),
+        "write_seconds": round(write_seconds, 3),
+        "driver_peak_rss_mb": round(peak_rss_kb / 1024.0, 1),
+        "driver_rss_growth_mb": round((peak_rss_kb - baseline_rss_kb) / 1024.0, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the Pandas and Arrow ingest paths for one Socrata batch")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--worker", choices=['arrow', 'pandas'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_worker(args.worker, args.rows, args.seed)))
+        return
+
+    results = []
+    for ingest in ['pandas', 'arrow']:
+        output = subprocess.run([sys.executable, __file__, "--worker", ingest, "--rows", str(args.rows), "--seed",
+                                 str(args.seed)], check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print("|ingest|rows|conversion (s)|write (s)|driver peak RSS (MB)|driver RSS growth (MB)|")
+    print("|---|---|---|---|---|---|")
+    for result in results:
+        print("|{ingest}|{rows}|{conversion_seconds}|{write_seconds}|{driver_peak_rss_mb}|{driver_rss_growth_mb}|"
+              .format(**result))
+
+
+if __name__ == "__main__":
+    main()
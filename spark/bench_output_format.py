@@ -0,0 +1,69 @@
+import argparse
+import time
+from pyspark.sql import SparkSession
+from bench_ingest import make_sample_records
+from hadoop_files import get_hadoop_path
+from process_violations import STANDARDIZED_SCHEMA, create_standardizers, records_to_spark, transform_batch, write_batch
+
+
+# Each variant is an output format and a compression codec, as passed to write_batch()
+VARIANTS = [('json', 'none'), ('json', 'gzip'), ('parquet', 'snappy'), ('parquet', 'zstd')]
+
+
+def load_sample(spark, input_data, row_count, seed):
+    """
+    Loads the dataset to benchmark: either existing JSON output of process_violations.py or a synthetic batch.
+    :param spark: the current SparkSession
+    :param input_data: Optional. A directory of JSON output written by process_violations.py
+    :param row_count: the number of synthetic rows to generate if input_data is not set
+    :param seed: the random seed for synthetic rows
+    :return: a Spark DataFrame ready for write_batch()
+    """
+    if input_data is not None:
+        return transform_batch(spark.read.schema(STANDARDIZED_SCHEMA).json(input_data))
+    return transform_batch(records_to_spark(spark, make_sample_records(row_count, seed), create_standardizers()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares bytes written and scan time of the staging output formats")
+    parser.add_argument("--input", help="Existing JSON output of process_violations.py. Synthetic rows if not set.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--work-dir", default="/tmp/bench_output_format")
+    args = parser.parse_args()
+
+    spark = SparkSession.builder.appName("bench_output_format").getOrCreate()
+    spark.conf.set("spark.sql.execution.arrow.pyspark.enabled", "true")
+
+    sdf = load_sample(spark, args.input, args.rows, args.seed).cache()
+    row_count = sdf.count()
+
+    print("|format|compression|rows|bytes written|bytes/row|write (s)|full scan (s)|")
+    print("|---|---|---|---|---|---|---|")
+
+    for output_format, compression in VARIANTS:
+        output_data = "{}/{}_{}".format(args.work_dir, output_format, compression)
+        fs, hadoop_path = get_hadoop_path(spark, output_data)
+        fs.delete(hadoop_path, True)
+
+        start_time = time.perf_counter()
+        write_batch(sdf, output_data, output_format, compression)
+        write_seconds = time.perf_counter() - start_time
+
+        bytes_written = fs.getContentSummary(hadoop_path).getLength()
+
+        start_time = time.perf_counter()
+        spark.read.format(output_format).load(output_data).write.format("noop").mode("overwrite").save()
+        scan_seconds = time.perf_counter() - start_time
+
+        print("|{}|{}|{}|{:,}|{:.1f}|{:.2f}|{:.2f}|".format(output_format, compression, row_count, bytes_written,
+                                                            bytes_written / float(row_count), write_seconds,
+                                                            scan_seconds))
+
+    print("Upload each directory to S3 and run pipeline/bench_copy_formats.py to compare COPY times.")
+
+    spark.stop()
+
+
+if __name__ == "__main__":
+    main()
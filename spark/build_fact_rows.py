@@ -0,0 +1,195 @@
+import argparse
+import json
+import re
+from pyspark.sql import Window
+import pyspark.sql.functions as f
+from pyspark.sql.types import *
+from hadoop_files import read_text_file
+from process_violations import STAGE_SCHEMA, UNKNOWN_TIME_KEY, create_spark_session
+
+
+# The columns written to the output, in the same order as the stage_fact_parkingviolation table in the data warehouse,
+# since columnar formats such as Parquet are COPYed by position. These are the columns of fact_parkingviolation, except
+# that the vehicle is identified by its hash key: vehicle_key is an IDENTITY handed out by the warehouse.
+FACT_STAGE_COLUMNS = ['parking_violation_key', 'summons_number', 'plate_id', 'registration_state_key', 'plate_type',
+                      'fine_amount', 'issue_date_key', 'violation_key', 'vehicle_hash_key', 'issuing_agency_key',
+                      'vehicle_expiration_date_key', 'violation_precinct_key', 'issuer_precinct_key', 'borough_key',
+                      'time_key', 'violation_address', 'vehicle_year']
+
+# The columns of the stage_precinct and stage_violation tables. COPY loads CSV columns by position, so the reference
+# files are read the same way rather than by their header names.
+PRECINCT_COLUMNS = ['precinctcode', 'borough', 'name', 'address', 'flagbelow96th']
+
+VIOLATION_COLUMNS = ['violation code', 'violation description', 'fineamount96thstbelow', 'fineamountother']
+
+
+def read_reference_csv(spark, path, columns):
+    """
+    Reads one of the reference CSV files that are also COPYed to the stage tables of the data warehouse, every column as
+    a string, just as the stage tables hold them.
+    :param spark: the current SparkSession
+    :param path: the directory or file of the CSV, with a header row
+    :param columns: the names to give the columns, in order, e.g. PRECINCT_COLUMNS
+    :return: a Spark DataFrame
+    """
+    return spark.read.option("header", "true").csv(path).toDF(*columns)
+
+
+def read_stage_rows(spark, stage_input, input_format='json', manifest_path=None, from_month=None, to_month=None):
+    """
+    Reads the output of process_violations.py: all of it, the files listed in one of its manifests, or a range of its
+    year/month partitions. Pick the same rows as etl.py stages into stage_parking_violations. A range of months is
+    read as a filter on the partition columns, which Spark prunes to the matching directories.
+    :param spark: the current SparkSession
+    :param stage_input: the output directory of process_violations.py
+    :param input_format: Optional. 'json' or 'parquet', the --output-format process_violations.py was run with
+    :param manifest_path: Optional. The path of a manifest written by process_violations.py --manifest
+    :param from_month: Optional. The first month to read, as 'YYYY-MM'. Requires to_month.
+    :param to_month: Optional. The last month to read, as 'YYYY-MM'
+    :return: a Spark DataFrame matching STAGE_SCHEMA
+    """
+    reader = spark.read.schema(STAGE_SCHEMA).format(input_format)
+
+    if manifest_path is not None:
+        # The manifest lists s3:// URLs for Redshift; Spark reads the same objects through s3a://
+        path_list = [re.sub(r'^s3://', 's3a://', entry["url"])
+                     for entry in json.loads(read_text_file(spark, manifest_path))["entries"]]
+    elif from_month is not None:
+        # Months as YYYYMM numbers, so that the range is a single comparison
+        first_month, last_month = [int(month.split('-')[0]) * 100 + int(month.split('-')[1])
+                                   for month in [from_month, to_month]]
+
+        return reader.load(stage_input) \
+            .where((f.col("year_number") * 100 + f.col("month_number")).between(first_month, last_month)) \
+            .select(*STAGE_SCHEMA.fieldNames())
+    else:
+        path_list = [stage_input]
+
+    if not path_list:
+        return spark.createDataFrame([], STAGE_SCHEMA)
+
+    return reader.load(path_list)
+
+
+def build_fact_rows(stage_sdf, precinct_sdf, violation_sdf):
+    """
+    Resolves every key of fact_parkingviolation that doesn't need the warehouse, with the same rules as
+    insert_fact_parkingviolation in pipeline/helpers/sql_queries.py: the fine amount with the below-96th rule, the
+    violation and precinct keys, and the borough key, numbered by each borough's lowest precinct code just like
+    insert_dim_borough. The reference tables have a few hundred rows at most, so they are broadcast to every task
+    instead of shuffling the violations. The time and date keys were already computed by process_violations.py.
+    :param stage_sdf: the violations, as written by process_violations.py
+    :param precinct_sdf: the precinct reference data, with PRECINCT_COLUMNS
+    :param violation_sdf: the violation code reference data, with VIOLATION_COLUMNS
+    :return: a Spark DataFrame with FACT_STAGE_COLUMNS
+    """
+    borough_sdf = precinct_sdf.groupBy("borough") \
+        .agg(f.min(f.col("precinctcode").cast(IntegerType())).alias("first_precinct")) \
+        .select(f.col("borough").alias("borough_name"),
+                f.rank().over(Window.orderBy("first_precinct")).alias("borough_key"))
+
+    violation_precinct_sdf = precinct_sdf.join(f.broadcast(borough_sdf),
+                                               precinct_sdf["borough"] == borough_sdf["borough_name"], "left") \
+        .select(f.col("precinctcode").alias("violation_precinct_code"),
+                f.col("flagbelow96th"),
+                f.col("borough_key"))
+
+    issuer_precinct_sdf = precinct_sdf.select(f.col("precinctcode").alias("issuer_precinct_code"))
+
+    violation_code_sdf = violation_sdf.select(f.col("violation code").alias("violation_code_raw"),
+                                              f.col("fineamount96thstbelow"),
+                                              f.col("fineamountother"))
+
+    joined_sdf = stage_sdf \
+        .join(f.broadcast(violation_code_sdf), f.col("violation_code") == f.col("violation_code_raw"), "left") \
+        .join(f.broadcast(violation_precinct_sdf), f.col("violation_precinct") == f.col("violation_precinct_code"),
+              "left") \
+        .join(f.broadcast(issuer_precinct_sdf), f.col("issuer_precinct") == f.col("issuer_precinct_code"), "left")
+
+    house_number = f.when(f.col("house_number") != 'NaN', f.col("house_number"))
+    street_name = f.when(f.col("street_name") != 'NaN', f.col("street_name"))
+
+    return joined_sdf.select(
+        f.col("summons_number").alias("parking_violation_key"),
+        f.col("summons_number"),
+        f.col("plate_id"),
+        f.regexp_replace("registration_state", "99", "UK").alias("registration_state_key"),
+        f.regexp_replace("plate_type", "999", "UNK").alias("plate_type"),
+        f.when(f.col("flagbelow96th") == '1', f.col("fineamount96thstbelow").cast(IntegerType()))
+            .otherwise(f.coalesce(f.col("fineamountother").cast(IntegerType()), f.lit(0))).alias("fine_amount"),
+        f.col("issue_date_key"),
+        f.coalesce(f.col("violation_code_raw").cast(IntegerType()), f.lit(0)).alias("violation_key"),
+        f.col("vehicle_hash_key"),
+        f.col("issuing_agency").alias("issuing_agency_key"),
+        f.col("vehicle_expiration_date_key"),
+        f.coalesce(f.col("violation_precinct_code").cast(IntegerType()), f.lit(0)).alias("violation_precinct_key"),
+        f.coalesce(f.col("issuer_precinct_code").cast(IntegerType()), f.lit(0)).alias("issuer_precinct_key"),
+        f.coalesce(f.col("borough_key"), f.lit(0)).alias("borough_key"),
+        f.coalesce(f.col("time_key"), f.lit(UNKNOWN_TIME_KEY)).alias("time_key"),
+        f.when(street_name.isNotNull(), f.concat(f.coalesce(f.concat(house_number, f.lit(' ')), f.lit('')),
+                                                 street_name)).alias("violation_address"),
+        f.col("vehicle_year").cast(IntegerType()).alias("vehicle_year"))
+
+
+def write_fact_rows(fact_sdf, output_data, output_format='json', compression=None):
+    """
+    Replaces the contents of the output directory with the fact rows of this load, for etl.py to COPY into
+    stage_fact_parkingviolation.
+    :param fact_sdf: the fact rows, see build_fact_rows()
+    :param output_data: the directory to write, e.g. s3a://<bucket>/fact_parkingviolation
+    :param output_format: Optional. 'json' for JSON Lines or 'parquet'
+    :param compression: Optional. The compression codec. Spark's default for the format is used if not set.
+    :return: None
+    """
+    writer = fact_sdf.select(*FACT_STAGE_COLUMNS).write
+
+    if compression is not None:
+        writer = writer.option('compression', compression)
+
+    writer.format(output_format).mode('overwrite').save(output_data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds load-ready fact_parkingviolation rows from the output of "
+                                                 "process_violations.py, for etl.py with FACT_SOURCE=spark")
+    parser.add_argument("--input", default="hdfs:///parking_violations",
+                        help="The output directory of process_violations.py")
+    parser.add_argument("--input-format", choices=['json', 'parquet'], default='json',
+                        help="The --output-format process_violations.py was run with")
+    parser.add_argument("--manifest", help="Only read the files listed in this manifest of process_violations.py")
+    parser.add_argument("--from-month", help="Only read the partitions from this month on, as YYYY-MM")
+    parser.add_argument("--to-month", help="Only read the partitions up to this month, as YYYY-MM")
+    parser.add_argument("--reference", default="s3a://farchila-udacity-final",
+                        help="The directory holding the precinct/ and violation/ reference CSVs")
+    parser.add_argument("--output", default="s3a://farchila-udacity-final/fact_parkingviolation",
+                        help="The directory in which the fact rows are written, replacing its contents")
+    parser.add_argument("--output-format", choices=['json', 'parquet'], default='json',
+                        help="Write JSON Lines or Parquet")
+    parser.add_argument("--compression", choices=['none', 'snappy', 'gzip', 'zstd', 'lz4'],
+                        help="Compression codec for the output. Defaults to Spark's default for the format.")
+    args = parser.parse_args()
+
+    if args.manifest and (args.from_month or args.to_month):
+        parser.error("--manifest cannot be combined with --from-month/--to-month")
+    if bool(args.from_month) != bool(args.to_month):
+        parser.error("--from-month and --to-month must be given together")
+
+    spark = create_spark_session()
+
+    if args.output_format == 'parquet':
+        # Redshift tries to read every object under the COPY prefix as Parquet, including the empty _SUCCESS marker
+        spark.sparkContext._jsc.hadoopConfiguration().set("mapreduce.fileoutputcommitter.marksuccessfuljobs", "false")
+
+    stage_sdf = read_stage_rows(spark, args.input, args.input_format, args.manifest, args.from_month, args.to_month)
+    precinct_sdf = read_reference_csv(spark, args.reference.rstrip('/') + '/precinct', PRECINCT_COLUMNS)
+    violation_sdf = read_reference_csv(spark, args.reference.rstrip('/') + '/violation', VIOLATION_COLUMNS)
+
+    write_fact_rows(build_fact_rows(stage_sdf, precinct_sdf, violation_sdf), args.output, args.output_format,
+                    args.compression)
+    print("Wrote the fact rows to " + args.output)
+
+    spark.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from hadoop_files import get_hadoop_path, list_data_files, list_partition_directories
+
+
+def recover_interrupted_compaction(spark, output_data):
+    """
+    Finishes or rolls back partition swaps left behind by a compaction that died half-way, see compact_partitions().
+    If a partition was moved aside but its replacement never moved in, the original files are put back. If the
+    replacement is already live, the leftover original files are removed.
+    :param spark: the current SparkSession
+    :param output_data: the output directory written by write_batch()
+    :return: None
+    """
+    jvm = spark.sparkContext._jvm
+    fs, old_root = get_hadoop_path(spark, output_data + "_compaction_old")
+
+    for partition in list_partition_directories(spark, output_data + "_compaction_old"):
+        old_path = jvm.org.apache.hadoop.fs.Path(output_data + "_compaction_old/" + partition)
+        live_path = jvm.org.apache.hadoop.fs.Path(output_data + "/" + partition)
+
+        if fs.exists(live_path):
+            fs.delete(old_path, True)
+        else:
+            print("Restoring " + partition + " from an interrupted compaction.")
+            fs.rename(old_path, live_path)
+
+    fs.delete(old_root, True)
+    fs.delete(jvm.org.apache.hadoop.fs.Path(output_data + "_compaction"), True)
+
+
+def compact_partitions(spark, output_data, schema, output_format='json', compression=None,
+                       target_file_bytes=128 * 1024 ** 2):
+    """
+    Rewrites every year_number=/month_number= partition that holds more files than its size calls for into files of
+    roughly target_file_bytes each, sorted by summons_number. Each partition is written to a staging directory first
+    and then swapped in with two renames, so readers see either the old or the new files, never a mix. A swap that is
+    interrupted between the renames is repaired by recover_interrupted_compaction() on the next run.
+    :param spark: the current SparkSession
+    :param output_data: the output directory written by write_batch()
+    :param schema: the schema of the output, e.g. STAGE_SCHEMA
+    :param output_format: Optional. The format of the output, 'json' or 'parquet'
+    :param compression: Optional. The compression codec for the rewritten files
+    :param target_file_bytes: Optional. The desired size of each file after compaction
+    :return: None
+    """
+    jvm = spark.sparkContext._jvm
+    fs, output_path = get_hadoop_path(spark, output_data)
+
+    recover_interrupted_compaction(spark, output_data)
+
+    total_files_before, total_bytes_before, total_files_after, total_bytes_after = 0, 0, 0, 0
+
+    for partition in list_partition_directories(spark, output_data):
+        partition_data = output_data + "/" + partition
+        files_before = list_data_files(spark, partition_data)
+        bytes_before = sum(size for path, size in files_before)
+        target_file_count = max(1, -(-bytes_before // target_file_bytes))
+
+        total_files_before += len(files_before)
+        total_bytes_before += bytes_before
+
+        if len(files_before) <= target_file_count:
+            total_files_after += len(files_before)
+            total_bytes_after += bytes_before
+            continue
+
+        staging_data = output_data + "_compaction/" + partition
+        writer = spark.read.schema(schema).format(output_format).load(partition_data) \
+            .repartitionByRange(target_file_count, 'summons_number') \
+            .sortWithinPartitions('summons_number') \
+            .write
+
+        if compression is not None:
+            writer = writer.option('compression', compression)
+
+        writer.format(output_format).mode('overwrite').save(staging_data)
+        fs.delete(jvm.org.apache.hadoop.fs.Path(staging_data + "/_SUCCESS"), False)
+
+        old_path = jvm.org.apache.hadoop.fs.Path(output_data + "_compaction_old/" + partition)
+        fs.mkdirs(old_path.getParent())
+        fs.rename(jvm.org.apache.hadoop.fs.Path(partition_data), old_path)
+        fs.rename(jvm.org.apache.hadoop.fs.Path(staging_data), jvm.org.apache.hadoop.fs.Path(partition_data))
+        fs.delete(old_path, True)
+
+        files_after = list_data_files(spark, partition_data)
+        bytes_after = sum(size for path, size in files_after)
+        total_files_after += len(files_after)
+        total_bytes_after += bytes_after
+
+        print("Compacted {}: {} files / {:,} bytes -> {} files / {:,} bytes".format(
+            partition, len(files_before), bytes_before, len(files_after), bytes_after))
+
+    recover_interrupted_compaction(spark, output_data)
+
+    print("Compaction complete: {} files / {:,} bytes -> {} files / {:,} bytes".format(
+        total_files_before, total_bytes_before, total_files_after, total_bytes_after))
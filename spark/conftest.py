@@ -0,0 +1 @@
+# Lets the tests import the modules of this directory the way its scripts do
@@ -0,0 +1,100 @@
+import datetime
+import json
+from hadoop_files import read_text_file, write_text_file
+
+
+class ExtractionWatermark:
+    """
+    A durable checkpoint of how far extraction has got, stored as a small JSON file on any Hadoop-compatible file
+    system (local, HDFS or S3). 'summons_number' is the high watermark: every row up to and including it has been
+    written. While a sharded run is in progress, each shard's own cursor is kept as well, so a crashed run resumes
+    every shard where it left off. The file is rewritten after each successful write, via write_text_file(), so a
+    reader always sees either the previous or the new state. Only the batch that was being written when the driver
+    died can end up written twice.
+    """
+
+    def __init__(self, spark, path, dataset_id):
+        """
+        :param spark: the current SparkSession
+        :param path: the Hadoop-compatible path of the watermark file
+        :param dataset_id: the alphanumeric ID of the source dataset, recorded to guard against mixing datasets
+        """
+        self.spark = spark
+        self.path = path
+        self.state = {"dataset_id": dataset_id, "summons_number": 0, "shards": None}
+
+    def load(self):
+        """
+        Reads the watermark file, if it exists.
+        :return: the high watermark summons_number
+        """
+        saved = read_text_file(self.spark, self.path)
+        if saved is not None:
+            saved_state = json.loads(saved)
+            if saved_state["dataset_id"] != self.state["dataset_id"]:
+                raise ValueError("Watermark {} belongs to dataset {}, not {}".format(
+                    self.path, saved_state["dataset_id"], self.state["dataset_id"]))
+            self.state = saved_state
+
+        return self.state["summons_number"]
+
+    def save(self):
+        """
+        Atomically replaces the watermark file with the current state.
+        :return: None
+        """
+        self.state["updated_at"] = datetime.datetime.utcnow().isoformat()
+        write_text_file(self.spark, self.path, json.dumps(self.state))
+
+    @property
+    def summons_number(self):
+        return self.state["summons_number"]
+
+    def advance(self, summons_number):
+        """
+        Moves the high watermark forward after a successful write and clears any shard cursors.
+        :param summons_number: the highest summons_number written
+        :return: None
+        """
+        self.state["summons_number"] = max(self.state["summons_number"], summons_number)
+        self.state["shards"] = None
+        self.save()
+
+    def start_shards(self, summons_ranges):
+        """
+        Records the shards of a new sharded run.
+        :param summons_ranges: a list of (lower, upper) summons_number ranges, see split_summons_range()
+        :return: None
+        """
+        self.state["shards"] = [{"lower": lower, "upper": upper, "cursor": lower, "done": False}
+                                for lower, upper in summons_ranges]
+        self.save()
+
+    def pending_shard_ranges(self):
+        """
+        Returns the remaining work of an interrupted sharded run, in the form iter_sharded_pages() accepts.
+        :return: a list with a (cursor, upper) range per shard, or None for shards that are complete. None if there is
+            no sharded run in progress.
+        """
+        if self.state["shards"] is None:
+            return None
+
+        return [None if shard["done"] else (shard["cursor"], shard["upper"]) for shard in self.state["shards"]]
+
+    def advance_shard(self, shard_number, cursor, is_done):
+        """
+        Moves a shard's cursor forward after a successful write. Once every shard is done, the high watermark moves to
+        the top of the sharded keyspace.
+        :param shard_number: the index of the shard
+        :param cursor: the highest summons_number written for the shard
+        :param is_done: whether the shard has been fully fetched
+        :return: None
+        """
+        shard = self.state["shards"][shard_number]
+        shard["cursor"] = max(shard["cursor"], cursor)
+        shard["done"] = is_done
+
+        if all(shard["done"] for shard in self.state["shards"]):
+            self.advance(max(shard["upper"] for shard in self.state["shards"]))
+        else:
+            self.save()
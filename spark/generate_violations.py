@@ -0,0 +1,475 @@
+import argparse
+import csv
+import datetime
+import io
+import json
+import random
+from functools import partial
+from hadoop_files import write_text_file
+from process_violations import STANDARDIZED_SCHEMA, create_executor_lookups, create_spark_session, \
+    create_standardizers, merge_executor_lookups, standardize_partition, transform_batch, write_batch
+
+
+# The value pools below are modeled on the Parking Violations Issued dataset, weights included, down to its mess:
+# free-text colors, 12-hour times with filler characters, '0E-8' and '88880088' expiration dates, and the '99' and
+# '999' placeholders for unknown states and plate types. Fields Socrata leaves out of a row are left out here too, so
+# the extractor turns them into 'NaN' just like it does for the real rows.
+
+# (code, borough, name, address, south of 96th Street) for the precincts in the generated stage_precinct CSV
+PRECINCTS = [(1, 'Manhattan', '1st Precinct', '16 Ericsson Place', 1),
+             (5, 'Manhattan', '5th Precinct', '19 Elizabeth Street', 1),
+             (6, 'Manhattan', '6th Precinct', '233 West 10th Street', 1),
+             (9, 'Manhattan', '9th Precinct', '321 East 5th Street', 1),
+             (13, 'Manhattan', '13th Precinct', '230 East 21st Street', 1),
+             (14, 'Manhattan', 'Midtown South Precinct', '357 West 35th Street', 1),
+             (18, 'Manhattan', 'Midtown North Precinct', '306 West 54th Street', 1),
+             (19, 'Manhattan', '19th Precinct', '153 East 67th Street', 1),
+             (20, 'Manhattan', '20th Precinct', '120 West 82nd Street', 1),
+             (23, 'Manhattan', '23rd Precinct', '164 East 102nd Street', 0),
+             (28, 'Manhattan', '28th Precinct', '2271-89 Frederick Douglass Boulevard', 0),
+             (34, 'Manhattan', '34th Precinct', '4295 Broadway', 0),
+             (40, 'Bronx', '40th Precinct', '257 Alexander Avenue', 0),
+             (44, 'Bronx', '44th Precinct', '2 East 169th Street', 0),
+             (46, 'Bronx', '46th Precinct', '2120 Ryer Avenue', 0),
+             (52, 'Bronx', '52nd Precinct', '3016 Webster Avenue', 0),
+             (60, 'Brooklyn', '60th Precinct', '2951 West 8th Street', 0),
+             (67, 'Brooklyn', '67th Precinct', '2820 Snyder Avenue', 0),
+             (75, 'Brooklyn', '75th Precinct', '1000 Sutter Avenue', 0),
+             (84, 'Brooklyn', '84th Precinct', '301 Gold Street', 0),
+             (90, 'Brooklyn', '90th Precinct', '211 Union Avenue', 0),
+             (103, 'Queens', '103rd Precinct', '168-02 91st Avenue', 0),
+             (108, 'Queens', '108th Precinct', '5-47 50th Avenue', 0),
+             (109, 'Queens', '109th Precinct', '37-05 Union Street', 0),
+             (114, 'Queens', '114th Precinct', '34-16 Astoria Boulevard', 0),
+             (120, 'Staten Island', '120th Precinct', '78 Richmond Terrace', 0),
+             (122, 'Staten Island', '122nd Precinct', '2320 Hylan Boulevard', 0)]
+
+# (code, description, fine south of 96th Street, fine elsewhere, weight). School zone speed cameras alone issue about
+# a third of the tickets, and write no precinct.
+VIOLATIONS = [(36, 'PHTO SCHOOL ZN SPEED VIOLATION', 50, 50, 33),
+              (21, 'NO PARKING-STREET CLEANING', 65, 45, 13),
+              (38, 'FAIL TO DSPLY MUNI METER RECPT', 65, 35, 8),
+              (14, 'NO STANDING-DAY/TIME LIMITS', 115, 115, 7),
+              (20, 'NO PARKING-DAY/TIME LIMITS', 65, 60, 5),
+              (7, 'FAILURE TO STOP AT RED LIGHT', 50, 50, 5),
+              (40, 'FIRE HYDRANT', 115, 115, 5),
+              (71, 'INSP. STICKER-EXPIRED/MISSING', 65, 65, 4),
+              (46, 'DOUBLE PARKING', 115, 115, 4),
+              (70, 'REG. STICKER-EXPIRED/MISSING', 65, 65, 3),
+              (5, 'BUS LANE VIOLATION', 50, 50, 3),
+              (19, 'NO STANDING-BUS STOP', 115, 115, 2),
+              (31, 'NO STANDING-COMM METER ZONE', 115, 115, 2),
+              (37, 'EXPIRED MUNI METER', 65, 35, 2)]
+
+CAMERA_VIOLATION_CODES = {5, 7, 36}
+
+# (code, name, weight) of the agencies in the generated stage_issuingagency CSV
+ISSUING_AGENCIES = [('V', 'DEPARTMENT OF TRANSPORTATION', 41), ('T', 'TRAFFIC', 45), ('P', 'POLICE DEPARTMENT', 8),
+                    ('S', 'DEPARTMENT OF SANITATION', 4), ('K', 'PARKS DEPARTMENT', 1), ('X', 'OTHER/UNKNOWN AGENCIES', 1)]
+
+# (state, postal code, population, weight) of the states in the generated stage_registrationstate CSV. Plates from
+# unknown states are written as '99'.
+REGISTRATION_STATES = [('New York', 'NY', 19453561, 760), ('New Jersey', 'NJ', 8882190, 95),
+                       ('Pennsylvania', 'PA', 12801989, 35), ('Connecticut', 'CT', 3565287, 15),
+                       ('Florida', 'FL', 21477737, 15), ('Massachusetts', 'MA', 6892503, 6),
+                       ('Texas', 'TX', 28995881, 5), ('North Carolina', 'NC', 10488084, 5),
+                       ('Virginia', 'VA', 8535519, 5), ('Georgia', 'GA', 10617423, 4),
+                       ('Maryland', 'MD', 6045680, 4), ('Maine', 'ME', 1344212, 3), ('Ohio', 'OH', 11689100, 3),
+                       ('Illinois', 'IL', 12671821, 2), ('California', 'CA', 39512223, 2),
+                       ('Indiana', 'IN', 6732219, 2), ('99', '99', 0, 3)]
+
+PLATE_TYPES = [('PAS', 72), ('COM', 14), ('OMT', 6), ('OMS', 2), ('SRF', 2), ('OMR', 1), ('MOT', 1), ('APP', 1),
+               ('999', 1)]
+
+VEHICLE_MAKES = [('TOYOT', 12), ('HONDA', 11), ('NISSA', 10), ('FORD', 9), ('CHEVR', 5), ('HYUND', 4), ('ME/BE', 4),
+                 ('BMW', 4), ('JEEP', 4), ('LEXUS', 3), ('DODGE', 3), ('SUBAR', 3), ('INFIN', 2), ('ACURA', 2),
+                 ('FRUEH', 2), ('INTER', 1), ('ISUZU', 1), ('KIA', 2), ('VOLKS', 2), ('MAZDA', 1), (None, 2)]
+
+VEHICLE_BODY_TYPES = [('SUBN', 42), ('4DSD', 28), ('VAN', 8), ('DELV', 5), ('PICK', 4), ('SDN', 3), ('2DSD', 2),
+                      ('REFG', 1), ('TRAC', 1), ('UTIL', 1), ('TAXI', 1), (None, 4)]
+
+# The officer types the color in by hand, so the same color comes in many spellings and cases
+VEHICLE_COLORS = [('BK', 14), ('BLACK', 6), ('BLK', 4), ('WH', 10), ('WHITE', 6), ('WHT', 2), ('GY', 11), ('GREY', 4),
+                  ('GRAY', 3), ('GRY', 2), ('SILVE', 3), ('SILVR', 2), ('BL', 5), ('BLUE', 3), ('BLU', 1), ('RD', 3),
+                  ('RED', 2), ('BROWN', 1), ('BR', 1), ('TN', 1), ('GREEN', 1), ('GR', 1), ('YW', 1), ('YELLO', 1),
+                  ('OTHER', 1), ('MR', 1), ('blk', 1), ('Wht', 1), ('GY/BK', 1), (None, 6)]
+
+STREET_NAMES = ['Broadway', 'WB ATLANTIC AVE @ CLASSON AVE', 'E 14th St', 'W 34th St', 'Queens Blvd', 'Fulton St',
+                'NB BRUCKNER BLVD @ E 138TH ST', 'Flatbush Ave', 'Lexington Ave', 'Grand Concourse', 'Northern Blvd',
+                '3rd Ave', 'Hylan Blvd', 'EB JAMAICA AVE @ 150TH ST', 'Amsterdam Ave', 'Ocean Pkwy']
+
+VIOLATION_COUNTIES = [('NY', 25), ('K', 22), ('Q', 18), ('BX', 17), ('QN', 6), ('BK', 5), ('MN', 3), ('R', 3),
+                      ('Kings', 1)]
+
+
+def get_cumulative_weights(weighted_values):
+    """
+    Splits (value, weight) pairs for random.choices().
+    :param weighted_values: a list of (value, weight) tuples
+    :return: a (values, cumulative weights) tuple
+    """
+    values, weights = zip(*weighted_values)
+    cumulative_weights = []
+    total = 0
+
+    for weight in weights:
+        total += weight
+        cumulative_weights.append(total)
+
+    return list(values), cumulative_weights
+
+
+PRECINCT_CODES = [code for code, borough, name, address, below_96th in PRECINCTS]
+
+VIOLATION_CHOICES = get_cumulative_weights([(violation[:4], violation[4]) for violation in VIOLATIONS])
+
+ISSUING_AGENCY_CHOICES = get_cumulative_weights([(code, weight) for code, name, weight in ISSUING_AGENCIES])
+
+REGISTRATION_STATE_CHOICES = get_cumulative_weights([(postal_code, weight) for state, postal_code, population, weight
+                                                     in REGISTRATION_STATES])
+
+PLATE_TYPE_CHOICES = get_cumulative_weights(PLATE_TYPES)
+
+VEHICLE_MAKE_CHOICES = get_cumulative_weights(VEHICLE_MAKES)
+
+VEHICLE_BODY_TYPE_CHOICES = get_cumulative_weights(VEHICLE_BODY_TYPES)
+
+VEHICLE_COLOR_CHOICES = get_cumulative_weights(VEHICLE_COLORS)
+
+VIOLATION_COUNTY_CHOICES = get_cumulative_weights(VIOLATION_COUNTIES)
+
+
+def choose(rng, choices):
+    """
+    Picks one value at random.
+    :param rng: the random.Random of the current chunk
+    :param choices: a (values, cumulative weights) tuple, see get_cumulative_weights()
+    :return: the value picked
+    """
+    values, cumulative_weights = choices
+    return rng.choices(values, cum_weights=cumulative_weights)[0]
+
+
+def make_violation_time(rng):
+    """
+    Makes a 'violation_time' the way officers enter it: mostly a 12-hour time such as '0752A', sometimes with a filler
+    character in place of a digit, and now and then a 24-hour time, an impossible time or plain garbage. Most of the
+    impossible, garbage and missing values can't be read as a time of day; the pipeline must still load a fact row for
+    each of them, with the unknown time_key, or the grain check fails.
+    :param rng: the random.Random of the current chunk
+    :return: the raw 'violation_time', or None if it is left out
+    """
+    draw = rng.random()
+    hour_number, minute_number = rng.randint(1, 12), rng.randint(0, 59)
+    violation_time = '{:02d}{:02d}{}'.format(hour_number, minute_number, rng.choice('AP'))
+
+    if draw < 0.9:
+        return violation_time
+    if draw < 0.95:
+        # A space or a dot typed in place of a digit
+        position = rng.randint(0, 3)
+        return violation_time[:position] + rng.choice(' .') + violation_time[position + 1:]
+    if draw < 0.97:
+        return '{:02d}{:02d}'.format(rng.randint(0, 23), rng.randint(0, 59))
+    if draw < 0.98:
+        # Minutes past 59, which can't be read as a time of day and are loaded with the unknown time_key
+        return '{:02d}{}{}'.format(hour_number, rng.randint(60, 99), rng.choice('AP'))
+    if draw < 0.99:
+        return rng.choice(['0', '+', '1', '*', '0000'])
+
+    return None
+
+
+def make_issue_date(rng, fiscal_year):
+    """
+    Makes an 'issue_date' within the fiscal year, which runs from July to June. A few are typos that land years away,
+    which is why the real output has partitions well outside the fiscal year.
+    :param rng: the random.Random of the current chunk
+    :param fiscal_year: e.g. 2021 for July 2020 to June 2021
+    :return: the raw 'issue_date', e.g. '2020-08-31T00:00:00.000'
+    """
+    first_date = datetime.date(fiscal_year - 1, 7, 1)
+    issue_date = first_date + datetime.timedelta(days=rng.randint(0, 364))
+
+    if rng.random() < 0.001:
+        issue_date = issue_date.replace(year=issue_date.year + rng.choice([-9, -1, 1, 9]), day=min(issue_date.day, 28))
+
+    return issue_date.strftime('%Y-%m-%dT00:00:00.000')
+
+
+def make_expiration_date(rng, issue_date):
+    """
+    Makes a 'vehicle_expiration_date' as a YYYYMMDD number: usually within two years of the ticket, otherwise one of
+    the placeholders officers enter for a registration that doesn't expire or can't be read, or an impossible date.
+    :param rng: the random.Random of the current chunk
+    :param issue_date: the raw 'issue_date' of the same row
+    :return: the raw 'vehicle_expiration_date'
+    """
+    draw = rng.random()
+
+    if draw < 0.7:
+        expiration_date = datetime.date(int(issue_date[:4]), int(issue_date[5:7]), int(issue_date[8:10])) + \
+            datetime.timedelta(days=rng.randint(-120, 730))
+        return expiration_date.strftime('%Y%m%d')
+    if draw < 0.95:
+        return '0E-8'
+    if draw < 0.99:
+        return '88880088'
+
+    return '{}0231'.format(rng.randint(2019, 2023))
+
+
+def make_violation_record(rng, summons_number, fiscal_year):
+    """
+    Makes one row shaped like a Socrata response: every value is a string and missing fields are left out.
+    :param rng: the random.Random of the current chunk
+    :param summons_number: the summons number of the row
+    :param fiscal_year: the fiscal year the violations are issued in, see make_issue_date()
+    :return: a dictionary
+    """
+    violation_code, violation_description, fine_below_96th, fine_other = choose(rng, VIOLATION_CHOICES)
+    is_camera = violation_code in CAMERA_VIOLATION_CODES
+    precinct_code = 0 if is_camera or rng.random() < 0.02 else rng.choice(PRECINCT_CODES)
+    issue_date = make_issue_date(rng, fiscal_year)
+
+    record = {
+        'summons_number': str(summons_number),
+        'plate_id': ''.join(rng.choice('ABCDEFGHJKLMNPRSTUVWXYZ0123456789') for i in range(rng.randint(5, 8))),
+        'registration_state': choose(rng, REGISTRATION_STATE_CHOICES),
+        'plate_type': choose(rng, PLATE_TYPE_CHOICES),
+        'issue_date': issue_date,
+        'violation_code': str(violation_code),
+        'vehicle_body_type': choose(rng, VEHICLE_BODY_TYPE_CHOICES),
+        'vehicle_make': choose(rng, VEHICLE_MAKE_CHOICES),
+        'issuing_agency': 'V' if is_camera else choose(rng, ISSUING_AGENCY_CHOICES),
+        'street_code1': '0' if is_camera else str(rng.randint(10000, 99999)),
+        'street_code2': '0' if is_camera else str(rng.choice([0, rng.randint(10000, 99999)])),
+        'street_code3': '0' if is_camera else str(rng.choice([0, rng.randint(10000, 99999)])),
+        'vehicle_expiration_date': make_expiration_date(rng, issue_date),
+        'violation_location': str(precinct_code) if precinct_code else None,
+        'violation_precinct': str(precinct_code),
+        'issuer_precinct': '0' if is_camera else str(rng.choice([precinct_code] * 8 + PRECINCT_CODES[:2])),
+        'issuer_code': '0' if is_camera else str(rng.randint(300000, 999999)),
+        'issuer_command': None if is_camera else rng.choice(['T103', 'T401', 'T301', 'T202', 'KN09', '0019']),
+        'issuer_squad': None if is_camera else rng.choice('ABCDEFGHJKLM0'),
+        'violation_time': make_violation_time(rng),
+        'violation_county': choose(rng, VIOLATION_COUNTY_CHOICES) if rng.random() < 0.9 else None,
+        'violation_in_front_of_or_opposite': None if is_camera else rng.choice(['F', 'F', 'F', 'O']),
+        'house_number': None if is_camera or rng.random() < 0.2 else rng.choice(
+            [str(rng.randint(1, 2999)), '{}-{}'.format(rng.randint(1, 250), rng.randint(1, 99))]),
+        'street_name': rng.choice(STREET_NAMES) if rng.random() < 0.995 else None,
+        'date_first_observed': '0' if rng.random() < 0.98 else issue_date[:10].replace('-', ''),
+        'law_section': '1180' if is_camera else rng.choice(['408', '408', '408', '1111']),
+        'sub_division': rng.choice(['D', 'D1', 'J7', 'C', 'E2', 'F1', 'h1', 'K4']),
+        'days_parking_in_effect': None if is_camera else rng.choice(['BBBBBBB', 'YYYYYYY', 'YYYYYBB', 'BBYBBBB']),
+        'from_hours_in_effect': None if is_camera else rng.choice(['ALL', '0700A', '0800A', '0830A', '1100A']),
+        'to_hours_in_effect': None if is_camera else rng.choice(['ALL', '0700P', '0400P', '1000A', '1130A']),
+        'vehicle_color': choose(rng, VEHICLE_COLOR_CHOICES),
+        'unregistered_vehicle': '0' if rng.random() < 0.1 else None,
+        'vehicle_year': '0' if rng.random() < 0.2 else str(rng.randint(1990, fiscal_year)),
+        'meter_number': rng.choice(['-', '{}-{:04d}'.format(rng.randint(100, 499), rng.randint(0, 9999))])
+        if violation_code in (37, 38) else None,
+        'feet_from_curb': '0',
+        'intersecting_street': '{}ft {}/of {}'.format(rng.randint(5, 80), rng.choice('NESW'), rng.choice(STREET_NAMES))
+        if rng.random() < 0.3 else None,
+        'time_first_observed': make_violation_time(rng) if rng.random() < 0.05 else None,
+        'violation_legal_code': 'T' if rng.random() < 0.05 else None,
+        'violation_description': violation_description if is_camera or rng.random() < 0.1 else None,
+        'violation_post_code': '{} {}'.format(rng.choice('ABCDEFGHJKLM'), rng.randint(1, 99))
+        if rng.random() < 0.3 else None
+    }
+
+    return {column: value for column, value in record.items() if value is not None}
+
+
+# The number of rows generated from one seed when the number of chunks isn't given
+ROWS_PER_CHUNK = 1000000
+
+
+def get_default_chunk_count(row_count):
+    """
+    Gives the number of chunks the rows are generated in unless told otherwise: one per ROWS_PER_CHUNK rows. It only
+    depends on the row count, so that the same seed and row count generate the same rows in every tool using
+    split_rows() and on any cluster.
+    :param row_count: the total number of rows
+    :return: the number of chunks
+    """
+    return max(1, -(-row_count // ROWS_PER_CHUNK))
+
+
+def split_rows(row_count, chunk_count, first_summons_number):
+    """
+    Splits the rows into chunks of consecutive summons numbers. Each chunk is generated by one Spark task from its own
+    seed, so the output only depends on the seed and the chunks, never on the cluster.
+    :param row_count: the total number of rows
+    :param chunk_count: the number of chunks
+    :param first_summons_number: the summons number of the first row
+    :return: a list of (chunk number, first summons number, row count) tuples
+    """
+    boundaries = [row_count * chunk_number // chunk_count for chunk_number in range(chunk_count + 1)]
+
+    return [(chunk_number, first_summons_number + boundaries[chunk_number],
+             boundaries[chunk_number + 1] - boundaries[chunk_number])
+            for chunk_number in range(chunk_count) if boundaries[chunk_number + 1] > boundaries[chunk_number]]
+
+
+def generate_chunk_records(chunk, seed, fiscal_year):
+    """
+    Generates the rows of one chunk, see split_rows().
+    :param chunk: a (chunk number, first summons number, row count) tuple
+    :param seed: the seed of the whole data set
+    :param fiscal_year: the fiscal year the violations are issued in
+    :return: a generator of Socrata-shaped dictionaries, see make_violation_record()
+    """
+    chunk_number, first_summons_number, row_count = chunk
+    rng = random.Random('{}-{}'.format(seed, chunk_number))
+
+    for summons_number in range(first_summons_number, first_summons_number + row_count):
+        yield make_violation_record(rng, summons_number, fiscal_year)
+
+
+def generate_violations(spark, output_data, row_count, seed=42, chunk_count=None, first_summons_number=1400000000,
+                        fiscal_year=2021, raw=False, output_format='json', compression=None):
+    """
+    Generates synthetic parking violations in parallel, one Spark task per chunk of rows. The generated rows are then
+    spread over the whole cluster, so that fewer chunks than cores don't limit the rest of the job. By default they go
+    through the same standardization and partitioned write as the extracted data, so etl.py can stage them as is; with
+    raw set, the Socrata-shaped rows are written as JSON Lines instead, as a stand-in for the source itself. Like the
+    extractor, this appends to the output, so a larger data set can be built up over several runs with successive
+    summons numbers.
+    :param spark: the current SparkSession
+    :param output_data: the directory in which the output is written
+    :param row_count: the number of rows to generate
+    :param seed: Optional. The same seed, row count and chunk count always generate the same rows
+    :param chunk_count: Optional. The number of chunks, i.e. Spark tasks generating rows. Defaults to
+        get_default_chunk_count().
+    :param first_summons_number: Optional. The summons number of the first row; the rest follow consecutively
+    :param fiscal_year: Optional. The fiscal year the violations are issued in, e.g. 2021 for July 2020 to June 2021
+    :param raw: Optional. Write the raw Socrata-shaped rows instead of the standardized, partitioned output
+    :param output_format: Optional. 'json' for JSON Lines or 'parquet'. Raw rows are always JSON Lines.
+    :param compression: Optional. The compression codec for the output
+    :return: None
+    """
+    sc = spark.sparkContext
+
+    if chunk_count is None:
+        chunk_count = get_default_chunk_count(row_count)
+
+    chunks = split_rows(row_count, chunk_count, first_summons_number)
+    records = sc.parallelize(chunks, len(chunks)).flatMap(partial(generate_chunk_records, seed=seed,
+                                                                  fiscal_year=fiscal_year))
+
+    # Which rows are generated depends on the chunks alone; the parallelism of everything after that on the cluster
+    if sc.defaultParallelism > len(chunks):
+        records = records.repartition(sc.defaultParallelism)
+
+    if raw:
+        lines = records.map(lambda record: (json.dumps(record),))
+
+        writer = spark.createDataFrame(lines, 'value STRING').write
+        if compression is not None:
+            writer = writer.option('compression', compression)
+
+        writer.mode('append').text(output_data)
+    else:
+        if output_format == 'parquet':
+            # Redshift tries to read every object under the COPY prefix as Parquet, including the empty _SUCCESS marker
+            sc._jsc.hadoopConfiguration().set("mapreduce.fileoutputcommitter.marksuccessfuljobs", "false")
+
+        standardizers = create_standardizers()
+        lookups = create_executor_lookups(spark, standardizers)
+
+        rows = records.mapPartitions(partial(standardize_partition, lookups=lookups))
+        write_batch(transform_batch(spark.createDataFrame(rows, STANDARDIZED_SCHEMA)), output_data, output_format,
+                    compression)
+
+        merge_executor_lookups(spark, standardizers, lookups)
+
+    print('Generated summons numbers {} to {} in {} chunks to {}'.format(
+        first_summons_number, first_summons_number + row_count - 1, len(chunks), output_data))
+
+
+def to_csv(header, rows):
+    """
+    Formats rows as CSV text with a header row.
+    :param header: the column names
+    :param rows: a list of tuples
+    :return: the CSV text
+    """
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(header)
+    writer.writerows(rows)
+
+    return output.getvalue()
+
+
+def write_reference_csvs(spark, reference_data):
+    """
+    Writes reference CSVs covering every code the generator uses, in the layout etl.py COPYs the stage tables from,
+    e.g. <reference_data>/precinct/precinct.csv, so that a data warehouse can be loaded from generated data alone.
+    :param spark: the current SparkSession
+    :param reference_data: the directory standing in for the bucket, e.g. s3a://<bucket> or a local directory
+    :return: None
+    """
+    reference_csvs = {
+        'precinct': to_csv(['PrecinctCode', 'Borough', 'Name', 'Address', 'FlagBelow96th'], PRECINCTS),
+        'violation': to_csv(['VIOLATION CODE', 'VIOLATION DESCRIPTION', 'FineAmount96thStBelow', 'FineAmountOther'],
+                            [violation[:4] for violation in VIOLATIONS]),
+        'issuingagency': to_csv(['AgencyCode', 'Name'], [(code, name) for code, name, weight in ISSUING_AGENCIES]),
+        'registrationstate': to_csv(['Geographic Area', 'Postal Code', 'Total Resident Population'],
+                                    [(state, postal_code, population) for state, postal_code, population, weight
+                                     in REGISTRATION_STATES if postal_code != '99']),
+        'vehicle': to_csv(['Record Type', 'Make', 'Body Type', 'Registration Class'],
+                          [('VEH', make, body_type, 'PAS') for make, make_weight in VEHICLE_MAKES
+                           for body_type, body_type_weight in VEHICLE_BODY_TYPES
+                           if make is not None and body_type is not None])
+    }
+
+    for table, text in reference_csvs.items():
+        path = '{}/{}/{}.csv'.format(reference_data.rstrip('/'), table, table)
+        write_text_file(spark, path, text)
+        print('Wrote ' + path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates synthetic NYC parking violations, as messy as the real "
+                                                 "ones, for testing at scales beyond the real dataset")
+    parser.add_argument("--rows", type=int, default=1000000, help="The number of rows to generate")
+    parser.add_argument("--seed", type=int, default=42, help="The same seed, rows and chunks generate the same data")
+    parser.add_argument("--chunks", type=int,
+                        help="Generate the rows in this many chunks, each from its own seed. Defaults to one per "
+                             "million rows, whatever the cluster.")
+    parser.add_argument("--first-summons-number", type=int, default=1400000000,
+                        help="The summons number of the first row. Pick one above the last run's to append to it.")
+    parser.add_argument("--fiscal-year", type=int, default=2021,
+                        help="Issue the violations from July of the year before to June of this year")
+    parser.add_argument("--output", default="hdfs:///parking_violations",
+                        help="Hadoop-compatible directory to which the generated violations are appended")
+    parser.add_argument("--output-format", choices=['json', 'parquet'], default='json',
+                        help="Write JSON Lines or Parquet, partitioned like process_violations.py")
+    parser.add_argument("--compression", choices=['none', 'snappy', 'gzip', 'zstd', 'lz4'],
+                        help="Compression codec for the output. Defaults to Spark's default for the format.")
+    parser.add_argument("--raw", action="store_true",
+                        help="Write the raw Socrata-shaped rows as JSON Lines instead of the standardized output")
+    parser.add_argument("--reference",
+                        help="Also write the reference CSVs covering every generated code under this directory, "
+                             "e.g. s3a://<bucket>")
+    args = parser.parse_args()
+
+    if args.raw and args.output_format != 'json':
+        parser.error("--raw always writes JSON Lines")
+
+    spark = create_spark_session()
+
+    generate_violations(spark, args.output, args.rows, args.seed, args.chunks, args.first_summons_number,
+                        args.fiscal_year, args.raw, args.output_format, args.compression)
+
+    if args.reference:
+        write_reference_csvs(spark, args.reference)
+
+    spark.stop()
+
+
+if __name__ == "__main__":
+    main()
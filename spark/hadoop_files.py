@@ -0,0 +1,93 @@
+def get_hadoop_path(spark, path):
+    """
+    Resolves a path string (hdfs://, s3a://, file:// or a bare local path) into its Hadoop FileSystem so that small
+    metadata files can be read and written through the same storage layer Spark itself uses.
+    :param spark: the current SparkSession
+    :param path: the target path
+    :return: a tuple of the Hadoop FileSystem and Path objects for the given path
+    """
+    jvm = spark.sparkContext._jvm
+    hadoop_path = jvm.org.apache.hadoop.fs.Path(path)
+    return hadoop_path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration()), hadoop_path
+
+
+def read_text_file(spark, path):
+    """
+    Reads a small UTF-8 text file through the Hadoop FileSystem API.
+    :param spark: the current SparkSession
+    :param path: the path of the file to read
+    :return: the file contents as a string, or None if the file does not exist
+    """
+    fs, hadoop_path = get_hadoop_path(spark, path)
+    if not fs.exists(hadoop_path):
+        # write_text_file() may have been interrupted after removing the old file but before renaming the new one
+        # into place. The temporary file is complete at that point, so read it instead.
+        hadoop_path = spark.sparkContext._jvm.org.apache.hadoop.fs.Path(path + ".tmp")
+        if not fs.exists(hadoop_path):
+            return None
+
+    stream = fs.open(hadoop_path)
+    try:
+        return spark.sparkContext._jvm.org.apache.commons.io.IOUtils.toString(stream, "UTF-8")
+    finally:
+        stream.close()
+
+
+def write_text_file(spark, path, text):
+    """
+    Writes a small UTF-8 text file through the Hadoop FileSystem API. The contents are written to a temporary file next
+    to the target first and then renamed into place so that readers never see a partially written file.
+    :param spark: the current SparkSession
+    :param path: the path of the file to write
+    :param text: the contents to write
+    :return: None
+    """
+    jvm = spark.sparkContext._jvm
+    fs, hadoop_path = get_hadoop_path(spark, path)
+    temp_path = jvm.org.apache.hadoop.fs.Path(path + ".tmp")
+
+    stream = fs.create(temp_path, True)
+    try:
+        stream.write(bytearray(text.encode("utf-8")))
+    finally:
+        stream.close()
+
+    if fs.exists(hadoop_path):
+        fs.delete(hadoop_path, False)
+    fs.rename(temp_path, hadoop_path)
+
+
+def list_data_files(spark, directory):
+    """
+    Lists the data files directly inside a directory, ignoring hidden and marker files such as _SUCCESS and .crc files.
+    :param spark: the current SparkSession
+    :param directory: the directory to list
+    :return: a list of (path, size in bytes) tuples
+    """
+    fs, hadoop_path = get_hadoop_path(spark, directory)
+    if not fs.exists(hadoop_path):
+        return []
+
+    return [(status.getPath().toString(), status.getLen()) for status in fs.listStatus(hadoop_path)
+            if status.isFile() and not status.getPath().getName().startswith(('_', '.'))]
+
+
+def list_partition_directories(spark, output_data):
+    """
+    Lists the year_number=/month_number= partition directories of the output.
+    :param spark: the current SparkSession
+    :param output_data: the output directory written by write_batch()
+    :return: a sorted list of partition paths relative to output_data, e.g. 'year_number=2020/month_number=7'
+    """
+    fs, hadoop_path = get_hadoop_path(spark, output_data)
+    if not fs.exists(hadoop_path):
+        return []
+
+    partitions = []
+    for year_status in fs.listStatus(hadoop_path):
+        if year_status.isDirectory() and year_status.getPath().getName().startswith('year_number='):
+            for month_status in fs.listStatus(year_status.getPath()):
+                if month_status.isDirectory() and month_status.getPath().getName().startswith('month_number='):
+                    partitions.append(year_status.getPath().getName() + '/' + month_status.getPath().getName())
+
+    return sorted(partitions)
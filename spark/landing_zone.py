@@ -0,0 +1,146 @@
+import json
+import os
+import pyarrow.fs as pafs
+import re
+
+
+class LandingZone:
+    """
+    Keeps every page exactly as Socrata returned it, compressed, in <path>/<dataset_id>/ with the first and last
+    summons_number of the page in the file name, e.g. 0000001400000001-0000001400500000.json.zst. Replaying the
+    landing zone reruns the transform from local or cluster storage without calling Socrata. The files are read and
+    written with pyarrow's filesystems so that executors can land the pages they fetch too: bare local paths, file://,
+    s3:// or s3a://, and hdfs:// where libhdfs is installed.
+    """
+
+    EXTENSIONS = {'gzip': 'gz', 'zstd': 'zst'}
+    PAGE_NAME = re.compile(r"^(\d+)-(\d+)\.json\.(gz|zst)$")
+
+    def __init__(self, path, dataset_id, compression='zstd'):
+        """
+        :param path: the root directory of the landing zone
+        :param dataset_id: the alphanumeric ID of the source dataset from data.cityofnewyork.us
+        :param compression: Optional. 'zstd' or 'gzip', for the pages landed from now on. Both are read back.
+        """
+        self.path = path
+        self.dataset_id = dataset_id
+        self.compression = compression
+        self._filesystem = None
+        self._directory = None
+
+    def __getstate__(self):
+        # Shipped to the executors, which connect to the filesystem themselves
+        state = self.__dict__.copy()
+        state['_filesystem'] = None
+        return state
+
+    def get_filesystem(self):
+        """
+        :return: a tuple of the pyarrow FileSystem and the directory of the dataset's pages on it
+        """
+        if self._filesystem is None:
+            path = re.sub(r"^s3[an]://", "s3://", self.path)
+            if "://" not in path:
+                path = os.path.abspath(path)
+
+            self._filesystem, root = pafs.FileSystem.from_uri(path)
+            self._directory = root.rstrip('/') + '/' + self.dataset_id
+
+        return self._filesystem, self._directory
+
+    def land(self, records, payload):
+        """
+        Writes one page. Empty pages are skipped.
+        :param records: the rows of the page, to name the file after their summons_number range
+        :param payload: the response body as received from Socrata
+        :return: the path of the file written, or None
+        """
+        if len(records) == 0:
+            return None
+
+        filesystem, directory = self.get_filesystem()
+        name = "{:016d}-{:016d}.json.{}".format(int(records[0]["summons_number"]), int(records[-1]["summons_number"]),
+                                               self.EXTENSIONS[self.compression])
+        filesystem.create_dir(directory, recursive=True)
+
+        # Written under a temporary name first so that a replay never reads a partially written page
+        with filesystem.open_output_stream(directory + '/_' + name, compression=self.compression) as stream:
+            stream.write(payload)
+        filesystem.move(directory + '/_' + name, directory + '/' + name)
+
+        return directory + '/' + name
+
+    def list_pages(self):
+        """
+        :return: a list of (path, first summons_number, last summons_number) tuples of the landed pages, in
+            summons_number order
+        """
+        filesystem, directory = self.get_filesystem()
+        pages = []
+
+        for file_info in filesystem.get_file_info(pafs.FileSelector(directory, allow_not_found=True)):
+            match = self.PAGE_NAME.match(file_info.base_name)
+            if match:
+                pages.append((file_info.path, int(match.group(1)), int(match.group(2))))
+
+        return sorted(pages, key=lambda page: (page[1], -page[2]))
+
+    def plan_replay(self):
+        """
+        Chooses the pages to replay so that every landed row is replayed once, even where pages overlap, e.g. after
+        a full extraction was run again with a different batch size.
+        :return: a list of (path, summons_number) tuples. Only the rows of the page above that summons_number are to be
+            replayed; None means all of them.
+        """
+        plan = []
+        replayed_up_to = None
+
+        for path, first_summons_number, last_summons_number in self.list_pages():
+            if replayed_up_to is not None and last_summons_number <= replayed_up_to:
+                continue
+
+            plan.append((path, replayed_up_to if replayed_up_to is not None and first_summons_number <= replayed_up_to
+                         else None))
+            replayed_up_to = last_summons_number
+
+        return plan
+
+    def read_page(self, path, lower_summons_number=None):
+        """
+        Reads one landed page.
+        :param path: the path of the page, see plan_replay()
+        :param lower_summons_number: Optional. Only rows with a summons_number greater than this value are returned
+        :return: a list of dictionaries, one per row, as returned by Socrata
+        """
+        filesystem, directory = self.get_filesystem()
+
+        with filesystem.open_input_stream(path, compression='detect') as stream:
+            records = json.loads(stream.read())
+
+        if lower_summons_number is not None:
+            records = [record for record in records if int(record["summons_number"]) > lower_summons_number]
+
+        return records
+
+
+def iter_landed_pages(landing_zone, pages, batch_size):
+    """
+    Reads landed pages back in summons_number order, combining consecutive pages into batches of at least batch_size
+    rows so that small pages don't each cost a Spark job.
+    :param landing_zone: the LandingZone
+    :param pages: the pages to read, see LandingZone.plan_replay()
+    :param batch_size: the number of rows above which a batch is handed on
+    :return: a generator of (shard_number, list of row dictionaries, exhausted) tuples like iter_serial_pages(). The
+        shard_number is always 0.
+    """
+    batch = []
+
+    for path, lower_summons_number in pages:
+        batch.extend(landing_zone.read_page(path, lower_summons_number))
+
+        if len(batch) >= batch_size:
+            yield 0, batch, False
+            batch = []
+
+    if len(batch) > 0:
+        yield 0, batch, True
@@ -0,0 +1,48 @@
+import json
+import re
+from hadoop_files import list_data_files, list_partition_directories, write_text_file
+
+
+def snapshot_output_files(spark, output_data):
+    """
+    Takes an inventory of the data files in every partition of the output, so that two snapshots can be compared.
+    :param spark: the current SparkSession
+    :param output_data: the output directory written by write_batch()
+    :return: a dictionary of partition -> {file path: size in bytes}
+    """
+    return {partition: dict(list_data_files(spark, output_data + "/" + partition))
+            for partition in list_partition_directories(spark, output_data)}
+
+
+def write_manifest(spark, manifest_path, files_before, files_after):
+    """
+    Writes a Redshift COPY manifest of the files this run added to the output. A partition that only gained files
+    contributes its new files; a partition whose files were rewritten, e.g. by compact_partitions(), contributes all of
+    its current files, since its old files may no longer exist.
+    :param spark: the current SparkSession
+    :param manifest_path: Hadoop-compatible path of the manifest file
+    :param files_before: the snapshot_output_files() taken before the run
+    :param files_after: the snapshot_output_files() taken after the run
+    :return: the number of files listed in the manifest
+    """
+    entries = []
+
+    for partition, files in sorted(files_after.items()):
+        previous_files = files_before.get(partition, {})
+        if set(previous_files).issubset(files):
+            new_files = {path: size for path, size in files.items() if path not in previous_files}
+        else:
+            new_files = files
+
+        # Redshift only understands s3:// URLs, and content_length is required to COPY Parquet from a manifest
+        entries.extend({"url": re.sub(r'^s3[an]://', 's3://', path), "mandatory": True,
+                        "meta": {"content_length": size}} for path, size in sorted(new_files.items()))
+
+    write_text_file(spark, manifest_path, json.dumps({"entries": entries}, indent=1))
+
+    if not entries:
+        print("Warning: no new files were written, so the manifest at " + manifest_path + " is empty.")
+    else:
+        print("Manifest of {} new file(s) written to {}".format(len(entries), manifest_path))
+
+    return len(entries)
@@ -0,0 +1,71 @@
+import queue
+import threading
+import time
+
+
+class PrefetchQueue:
+    """
+    Runs a page generator on a background thread and keeps up to a fixed number of fetched pages in a bounded queue,
+    so Socrata can be serving the next batch while Spark transforms and writes the current one. When the queue is
+    full the fetching thread blocks, which keeps driver memory bounded. The time each side spends waiting on the other
+    is recorded to show which stage is the bottleneck.
+    """
+
+    _end_of_pages = object()
+
+    def __init__(self, pages, depth):
+        """
+        :param pages: the page generator to run in the background, e.g. iter_serial_pages()
+        :param depth: the maximum number of fetched pages waiting to be processed
+        """
+        self.pages = pages
+        self.queue = queue.Queue(maxsize=depth)
+        self.fetch_seconds = 0.0
+        self.fetch_wait_seconds = 0.0
+        self.process_wait_seconds = 0.0
+        self._thread = threading.Thread(target=self._produce, name="socrata-prefetch", daemon=True)
+
+    def _produce(self):
+        try:
+            while True:
+                start_time = time.perf_counter()
+                page = next(self.pages, self._end_of_pages)
+                self.fetch_seconds += time.perf_counter() - start_time
+
+                start_time = time.perf_counter()
+                self.queue.put(page)
+                self.fetch_wait_seconds += time.perf_counter() - start_time
+
+                if page is self._end_of_pages:
+                    break
+        except Exception as e:
+            self.queue.put(e)
+
+    def __iter__(self):
+        self._thread.start()
+
+        while True:
+            start_time = time.perf_counter()
+            page = self.queue.get()
+            self.process_wait_seconds += time.perf_counter() - start_time
+
+            if page is self._end_of_pages:
+                break
+            if isinstance(page, Exception):
+                raise page
+
+            yield page
+
+    def report(self):
+        """
+        Prints how long each stage waited on the other.
+        :return: None
+        """
+        print("Prefetch summary: fetching took {:.1f} s and waited {:.1f} s for Spark to free a queue slot; Spark "
+              "waited {:.1f} s for Socrata.".format(self.fetch_seconds, self.fetch_wait_seconds,
+                                                    self.process_wait_seconds))
+
+        if self.fetch_wait_seconds > self.process_wait_seconds:
+            print("Spark transform/write is the bottleneck.")
+        else:
+            print("Socrata fetching is the bottleneck.")
@@ -1,13 +1,94 @@
-import boto3
+import argparse
+import datetime
+from functools import partial
 import json
-import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyspark
+from pyspark.accumulators import AccumulatorParam
 from pyspark.sql import SparkSession
 import pyspark.sql.functions as f
+from pyspark.sql.pandas.types import to_arrow_type
 from pyspark.sql.types import *
-import pyspark.sql.udf
 import re
-from sodapy import Socrata
+from adaptive_batch_sizer import AdaptiveBatchSizer
+from compaction import compact_partitions
+from extraction_watermark import ExtractionWatermark
+from hadoop_files import read_text_file, write_text_file
+from landing_zone import LandingZone, iter_landed_pages
+from output_manifest import snapshot_output_files, write_manifest
+from prefetch_queue import PrefetchQueue
+from socrata_client import create_socrata_client, fetch_sized_page, get_socrata_app_token, iter_serial_pages, \
+    iter_sharded_pages, probe_summons_range, split_summons_range
+from spark_job_counter import SparkJobCounter
+
+
+# Set the schema explicitly here first. Most important is that summons_number is a LongType since that column is
+# always populated in the dataset and provides an obvious choice for sorting and batching.
+PARKING_VIOLATIONS_SCHEMA = StructType([
+    StructField("summons_number", LongType(), True),
+    StructField("plate_id", StringType(), True),
+    StructField("registration_state", StringType(), True),
+    StructField("plate_type", StringType(), True),
+    StructField("issue_date", StringType(), True),
+    StructField("violation_code", StringType(), True),
+    StructField("vehicle_body_type", StringType(), True),
+    StructField("vehicle_make", StringType(), True),
+    StructField("issuing_agency", StringType(), True),
+    StructField("street_code1", StringType(), True),
+    StructField("street_code2", StringType(), True),
+    StructField("street_code3", StringType(), True),
+    StructField("vehicle_expiration_date", StringType(), True),
+    StructField("violation_location", StringType(), True),
+    StructField("violation_precinct", StringType(), True),
+    StructField("issuer_precinct", StringType(), True),
+    StructField("issuer_code", StringType(), True),
+    StructField("issuer_command", StringType(), True),
+    StructField("issuer_squad", StringType(), True),
+    StructField("violation_time", StringType(), True),
+    StructField("violation_county", StringType(), True),
+    StructField("violation_in_front_of_or_opposite", StringType(), True),
+    StructField("house_number", StringType(), True),
+    StructField("street_name", StringType(), True),
+    StructField("date_first_observed", StringType(), True),
+    StructField("law_section", StringType(), True),
+    StructField("sub_division", StringType(), True),
+    StructField("days_parking_in_effect", StringType(), True),
+    StructField("from_hours_in_effect", StringType(), True),
+    StructField("to_hours_in_effect", StringType(), True),
+    StructField("vehicle_color", StringType(), True),
+    StructField("unregistered_vehicle", StringType(), True),
+    StructField("vehicle_year", StringType(), True),
+    StructField("meter_number", StringType(), True),
+    StructField("feet_from_curb", StringType(), True),
+    StructField("intersecting_street", StringType(), True),
+    StructField("time_first_observed", StringType(), True),
+    StructField("violation_legal_code", StringType(), True),
+    StructField("violation_description", StringType(), True),
+    StructField("violation_post_code", StringType(), True)])
+
+PARKING_VIOLATIONS_COLUMNS = PARKING_VIOLATIONS_SCHEMA.fieldNames()
+
+# The schema of a batch once the standardized color code, the time key and the date keys have been added
+STANDARDIZED_SCHEMA = StructType(PARKING_VIOLATIONS_SCHEMA.fields +
+                                 [StructField("vehicle_color_standardized", StringType(), True),
+                                  StructField("time_key", IntegerType(), True),
+                                  StructField("issue_date_key", IntegerType(), True),
+                                  StructField("vehicle_expiration_date_key", IntegerType(), True)])
+
+# The schema of a batch once transform_batch() has added the vehicle hash key. The partitioning columns are left out.
+TRANSFORMED_SCHEMA = StructType(STANDARDIZED_SCHEMA.fields + [StructField("vehicle_hash_key", LongType(), True)])
+
+# The columns written to the output, in the same order as the stage_parking_violations table in the data warehouse.
+# Columnar formats such as Parquet are COPYed by position, so this order must match the table's DDL.
+STAGE_COLUMNS = [column for column in PARKING_VIOLATIONS_COLUMNS if column != 'violation_post_code'] + \
+                ['vehicle_color_standardized', 'time_key', 'issue_date_key', 'vehicle_expiration_date_key',
+                 'vehicle_hash_key']
+
+PARTITION_COLUMNS = ['year_number', 'month_number']
+
+STAGE_SCHEMA = StructType([TRANSFORMED_SCHEMA[column] for column in STAGE_COLUMNS])
 
 
 def create_spark_session():
@@ -22,169 +103,976 @@ def create_spark_session():
     return spark
 
 
-def get_socrata_client(socrata_domain, secret_name, region_name, secret_key):
+# Standard color codes. Each entry is the first and last letter of the color name around a placeholder for the
+# letters in between, e.g. 'B{}K' matches 'BK', 'BLK', 'BLACK' and so on.
+COLOR_LIST = ['B{}K', 'W{}H', 'G{}Y', 'B{}L', 'B{}R', 'G{}L', 'M{}R', 'O{}R', 'P{}K', 'P{}R', 'R{}D', 'T{}N', 'Y{}W']
+
+COLOR_PATTERNS = [(re.compile(color.format("+[A-Z]{0,}")), color[0] + color[-1]) for color in COLOR_LIST]
+
+
+def standardize_color(r):
     """
-    Initializes an AWS Secrets Manager session from which we can retrieve the Socrata application key and query the
-    NYC Parking Violations dataset.
-    :param socrata_domain: The URL endpoint of the Socrata service where the target API is located
-    :param secret_name: The AWS Secrets Manager secret name where the application key is stored
-    :param region_name: The AWS region name where the Secrets Manager instance is located
-    :param secret_key: The Secret key whose value is the application key needed to call Socrata
-    :return: the Socrata client
+    Matches the most likely standard color code based on the officer's original 'vehicle_color' input
+    :param r: the raw 'vehicle_color' value
+    :return: a color code from a standardized list based on the outcome of the Regex match algorithm
     """
+    if r is not None:
+        color_input = r.upper()
 
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name
-    )
+        for color_pattern, color_code in COLOR_PATTERNS:
+            if color_pattern.match(color_input) is not None:
+                # returns the first match. Codes above are two letters only, so we combine the first and last letter.
+                return color_code
+
+    return 'OTH'
 
-    get_secret_value_response = json.loads(client.get_secret_value(SecretId=secret_name)["SecretString"])
 
-    api_token = get_secret_value_response[secret_key]
+# Characters officers type in place of a digit in 'violation_time'. 'A' and 'P' are left alone since they mark AM and PM.
+VIOLATION_TIME_FILLER_PATTERN = re.compile(r'[a-zB-OQ-Z\s. ]')
 
-    client = Socrata(domain=socrata_domain, app_token=api_token)
-    return client
+DIGITS_PATTERN = re.compile(r'[0-9]+')
 
+# The time_key given to every 'violation_time' that is missing or isn't a time of day. It is midnight, which is what the
+# warehouse SQL ended up with for these values, so the fact table keeps one row per violation.
+UNKNOWN_TIME_KEY = 0
 
-@f.udf(returnType=StringType())
-def color_udf(r):
+
+def normalize_violation_time(violation_time):
     """
-    A Spark User-Defined-Function (udf) intended to process every row of the DataFrame's 'vehicle_color' column
-    and match the most likely standard color code based on the officer's original input
-    :param r: a single row of the DataFrame to be processed
-    :return: a color code from a standardized list based on the outcome of the Regex match algorithm
+    Converts the officer's original 'violation_time' input, e.g. '0752A', '1130P' or '1945', into the number of minutes
+    after midnight, which is the time_key of dim_time. This is the logic the warehouse used to apply with regular
+    expressions in SQL: filler characters count as zeros, a trailing 'A' or 'P' gives a 12-hour time, trailing digits
+    are read as a 24-hour time, and anything else is midnight. Values that can't be read as a time of day, e.g. '0176A',
+    are midnight too, so that every violation still gets a fact row.
+    :param violation_time: the raw 'violation_time' value
+    :return: minutes after midnight
     """
+    if violation_time is None:
+        return UNKNOWN_TIME_KEY
 
-    color_list = ['B{}K', 'W{}H', 'G{}Y', 'B{}L', 'B{}R', 'G{}L', 'M{}R', 'O{}R', 'P{}K', 'P{}R', 'R{}D', 'T{}N',
-                  'Y{}W']
-    if r is not None:
-        mid_pattern = "+[A-Z]{0,}"
-        color_input = r.upper()
+    last_character = violation_time[-1:]
 
-        for color in color_list:
-            color_match = re.match(color.format(mid_pattern), color_input)
-            if color_match is not None:
-                # returns the first match. Codes above are two letters only, so we combine the first and last letter.
-                return color[0] + color[-1]
+    if last_character in ('A', 'P'):
+        clock_digits = VIOLATION_TIME_FILLER_PATTERN.sub('0', violation_time)[:-1]
+        if DIGITS_PATTERN.fullmatch(clock_digits) is None:
+            return UNKNOWN_TIME_KEY
 
-        return 'OTH'
+        hour_number, minute_number = divmod(int(clock_digits) % 1200 + (1200 if last_character == 'P' else 0), 100)
+    elif DIGITS_PATTERN.fullmatch(last_character) is not None:
+        if DIGITS_PATTERN.fullmatch(violation_time[:2]) is None or DIGITS_PATTERN.fullmatch(violation_time[-2:]) is None:
+            return UNKNOWN_TIME_KEY
 
+        hour_number, minute_number = int(violation_time[:2]), int(violation_time[-2:])
     else:
-        return 'OTH'
+        return UNKNOWN_TIME_KEY
+
+    if hour_number > 23 or minute_number > 59:
+        return UNKNOWN_TIME_KEY
+
+    return hour_number * 60 + minute_number
+
+
+# The date_key given to every date that is missing or isn't a real calendar date, e.g. the '0E-8' and '88880088'
+# placeholders officers enter for a registration that doesn't expire. dim_date always has a row for it.
+DATE_KEY_SENTINEL = 19000101
+
+# Real calendar dates outside these years are typos, e.g. an expiration date of 0202 or 2920, and get the sentinel too.
+# This also keeps the calendar of insert_dim_date within the 100,000 days it can generate.
+MIN_DATE_KEY_YEAR = 1970
+MAX_DATE_KEY_YEAR = 2099
+
+ISO_DATE_PATTERN = re.compile(r'([0-9]{4})-([0-9]{2})-([0-9]{2})')
+
+NUMERIC_DATE_PATTERN = re.compile(r'([0-9]{4})([0-9]{2})([0-9]{2})(\.0*)?')
+
 
+def date_to_key(date_text):
+    """
+    Converts a raw date, either an ISO timestamp such as 'issue_date' ('2020-08-31T00:00:00.000') or a YYYYMMDD number
+    such as 'vehicle_expiration_date' ('20210228.0'), into the integer YYYYMMDD date_key of dim_date. Anything that
+    isn't a real calendar date between MIN_DATE_KEY_YEAR and MAX_DATE_KEY_YEAR gets DATE_KEY_SENTINEL.
+    :param date_text: the raw date value
+    :return: the date_key
+    """
+    if date_text is None:
+        return DATE_KEY_SENTINEL
+
+    date_match = ISO_DATE_PATTERN.match(date_text) or NUMERIC_DATE_PATTERN.fullmatch(date_text)
+    if date_match is None:
+        return DATE_KEY_SENTINEL
+
+    year_number, month_number, day_number = (int(part) for part in date_match.group(1, 2, 3))
+    if year_number < MIN_DATE_KEY_YEAR or year_number > MAX_DATE_KEY_YEAR:
+        return DATE_KEY_SENTINEL
 
-def process_parking_violations(spark, dataset_id, output_data):
+    try:
+        datetime.date(year_number, month_number, day_number)
+    except ValueError:
+        return DATE_KEY_SENTINEL
+
+    return year_number * 10000 + month_number * 100 + day_number
+
+
+class ColumnStandardizer:
+    """
+    Standardizes a free-text column by resolving each distinct raw value only once. Resolved values are kept in a
+    lookup table which survives across batches and, when a cache path is given, across runs. The lookup table is
+    small (a few thousand rows at most), so it is broadcast-joined back onto each batch instead of calling Python for
+    every row.
+    """
+
+    def __init__(self, source_column, target_column, resolve_function, default_value, cache_path=None,
+                 target_type=StringType()):
+        """
+        :param source_column: the name of the raw column to standardize
+        :param target_column: the name of the standardized column to add
+        :param resolve_function: a plain Python function mapping one raw value to its standardized value
+        :param default_value: the standardized value for rows whose raw value is null
+        :param cache_path: Optional. A Hadoop-compatible path of a JSON file in which the lookup table is persisted
+        :param target_type: Optional. The Spark data type of the standardized column
+        """
+        self.source_column = source_column
+        self.target_column = target_column
+        self.resolve_function = resolve_function
+        self.default_value = default_value
+        self.cache_path = cache_path
+        self.target_type = target_type
+        self.mapping = {}
+        self.is_dirty = False
+        self._lookup_sdf = None
+
+    def load(self, spark):
+        """
+        Loads a previously persisted lookup table, if a cache path is set and the file exists.
+        :param spark: the current SparkSession
+        :return: the number of cached values loaded
+        """
+        if self.cache_path is not None:
+            cached = read_text_file(spark, self.cache_path)
+            if cached is not None:
+                self.mapping.update(json.loads(cached))
+                self._lookup_sdf = None
+
+        return len(self.mapping)
+
+    def save(self, spark):
+        """
+        Persists the lookup table if a cache path is set and new values have been resolved since the last save.
+        :param spark: the current SparkSession
+        :return: None
+        """
+        if self.cache_path is not None and self.is_dirty:
+            write_text_file(spark, self.cache_path, json.dumps(self.mapping, sort_keys=True))
+            self.is_dirty = False
+
+    def update(self, values):
+        """
+        Resolves any raw values that are not in the lookup table yet.
+        :param values: an iterable of raw values, usually the distinct values of the current batch
+        :return: the number of newly resolved values
+        """
+        # Fields missing from a Socrata response arrive as NaN rather than as strings. Those rows fall through the
+        # join and get the default value, so only strings need to be resolved here.
+        new_values = [value for value in values if isinstance(value, str) and value not in self.mapping]
+
+        for value in new_values:
+            self.mapping[value] = self.resolve_function(value)
+
+        if len(new_values) > 0:
+            self.is_dirty = True
+            self._lookup_sdf = None
+
+        return len(new_values)
+
+    def merge(self, mapping):
+        """
+        Adds values that were resolved elsewhere, e.g. on the executors, to the lookup table.
+        :param mapping: a dictionary of raw values to standardized values
+        :return: the number of new values added
+        """
+        new_values = {value: code for value, code in mapping.items() if value not in self.mapping}
+        self.mapping.update(new_values)
+
+        if len(new_values) > 0:
+            self.is_dirty = True
+            self._lookup_sdf = None
+
+        return len(new_values)
+
+    def standardize_pandas(self, pdf):
+        """
+        Adds the standardized column to a batch that is still a Pandas DataFrame on the driver.
+        :param pdf: the Pandas DataFrame to standardize
+        :return: None, the column is added in place
+        """
+        self.update(pdf[self.source_column].unique())
+        values = pdf[self.source_column].map(self.mapping).where(pdf[self.source_column].notna(), self.default_value)
+
+        if not isinstance(self.target_type, StringType):
+            # map() turns integers into floats as soon as one is missing, but Spark expects Python integers and None
+            values = values.astype('Int64').astype(object)
+            values = values.where(values.notna(), None)
+
+        pdf[self.target_column] = values
+
+    def standardize_arrow(self, table):
+        """
+        Adds the standardized column to a batch that is still an Arrow table on the driver. The raw column is
+        dictionary-encoded so each distinct value is looked up once and the results are gathered by index.
+        :param table: the pyarrow Table to standardize
+        :return: a new pyarrow Table with the standardized column appended
+        """
+        encoded = pc.dictionary_encode(table[self.source_column]).combine_chunks()
+        distinct_values = encoded.dictionary.to_pylist()
+        self.update(distinct_values)
+
+        codes = pa.array([self.mapping.get(value, self.default_value) for value in distinct_values],
+                         to_arrow_type(self.target_type))
+        standardized = codes.take(encoded.indices)
+
+        if self.default_value is not None:
+            # Only null raw values get the default; a raw value that resolved to null stays null
+            standardized = pc.if_else(pc.is_null(encoded.indices), pa.scalar(self.default_value, codes.type),
+                                      standardized)
+
+        return table.append_column(self.target_column, standardized)
+
+    def lookup_dataframe(self, spark):
+        """
+        Builds (or reuses) the Spark DataFrame holding the lookup table.
+        :param spark: the current SparkSession
+        :return: a two-column Spark DataFrame of raw and standardized values
+        """
+        if self._lookup_sdf is None:
+            lookup_schema = StructType([
+                StructField(self.source_column + "_raw", StringType(), False),
+                StructField(self.target_column, self.target_type, True)])
+            self._lookup_sdf = spark.createDataFrame(list(self.mapping.items()), lookup_schema)
+
+        return self._lookup_sdf
+
+    def standardize(self, spark, sdf):
+        """
+        Adds the standardized column to a Spark DataFrame by broadcast-joining the lookup table on the raw column. The
+        lookup table must already hold every distinct value of the DataFrame, see update(). Batches that are still on
+        the driver should use standardize_pandas() or standardize_arrow() instead, which avoid the extra Spark job
+        needed to build the broadcast.
+        :param spark: the current SparkSession
+        :param sdf: the Spark DataFrame to standardize
+        :return: the Spark DataFrame with the standardized column appended
+        """
+        lookup_sdf = self.lookup_dataframe(spark)
+        raw_column = self.source_column + "_raw"
+
+        return sdf.join(f.broadcast(lookup_sdf), sdf[self.source_column] == lookup_sdf[raw_column], "left") \
+            .drop(raw_column) \
+            .withColumn(self.target_column, f.when(f.col(self.source_column).isNull(), f.lit(self.default_value))
+                        .otherwise(f.col(self.target_column)))
+
+
+def create_color_standardizer(cache_path=None):
+    """
+    Creates the ColumnStandardizer that adds the 'vehicle_color_standardized' column.
+    :param cache_path: Optional. A Hadoop-compatible path of a JSON file in which the color lookup table is persisted
+    :return: the ColumnStandardizer for 'vehicle_color'
+    """
+    return ColumnStandardizer("vehicle_color", "vehicle_color_standardized", standardize_color, 'OTH', cache_path)
+
+
+def create_time_normalizer(cache_path=None):
+    """
+    Creates the ColumnStandardizer that adds the integer 'time_key' column. There are only a few thousand distinct
+    'violation_time' inputs, so each is normalized once and then looked up. Missing times count as midnight, as they
+    did in the warehouse SQL.
+    :param cache_path: Optional. A Hadoop-compatible path of a JSON file in which the time lookup table is persisted
+    :return: the ColumnStandardizer for 'violation_time'
+    """
+    return ColumnStandardizer("violation_time", "time_key", normalize_violation_time, UNKNOWN_TIME_KEY, cache_path,
+                              IntegerType())
+
+
+def create_date_key_standardizer(source_column, target_column):
+    """
+    Creates a ColumnStandardizer that adds an integer date_key column, see date_to_key(). A batch only holds a few
+    hundred distinct dates and they are trivial to resolve, so the lookup table isn't persisted between runs.
+    :param source_column: the raw date column, 'issue_date' or 'vehicle_expiration_date'
+    :param target_column: the date_key column to add
+    :return: the ColumnStandardizer for the date column
+    """
+    return ColumnStandardizer(source_column, target_column, date_to_key, DATE_KEY_SENTINEL, None, IntegerType())
+
+
+def create_standardizers(color_cache_path=None, time_cache_path=None):
+    """
+    Creates every ColumnStandardizer the job applies, in the order their columns appear in STANDARDIZED_SCHEMA.
+    :param color_cache_path: Optional. Where the resolved 'vehicle_color' lookup table is persisted between runs
+    :param time_cache_path: Optional. Where the resolved 'violation_time' lookup table is persisted between runs
+    :return: a list of ColumnStandardizers
+    """
+    return [create_color_standardizer(color_cache_path), create_time_normalizer(time_cache_path),
+            create_date_key_standardizer("issue_date", "issue_date_key"),
+            create_date_key_standardizer("vehicle_expiration_date", "vehicle_expiration_date_key")]
+
+
+class DictAccumulatorParam(AccumulatorParam):
+    """
+    Lets executors report back dictionaries, e.g. newly resolved lookup values, which are merged on the driver.
+    """
+
+    def zero(self, value):
+        return {}
+
+    def addInPlace(self, value1, value2):
+        value1.update(value2)
+        return value1
+
+
+def create_executor_lookups(spark, standardizers):
+    """
+    Ships the lookup table of each ColumnStandardizer to the executors, with an accumulator through which they report
+    the values they resolve themselves.
+    :param spark: the current SparkSession
+    :param standardizers: the ColumnStandardizers to apply, see create_standardizers()
+    :return: one (source column, resolve function, default value, broadcast lookup table, accumulator of newly resolved
+        values) tuple per ColumnStandardizer, see standardize_record()
+    """
+    sc = spark.sparkContext
+
+    return [(standardizer.source_column, standardizer.resolve_function, standardizer.default_value,
+             sc.broadcast(standardizer.mapping), sc.accumulator({}, DictAccumulatorParam()))
+            for standardizer in standardizers]
+
+
+def merge_executor_lookups(spark, standardizers, lookups):
+    """
+    Adds the values the executors resolved to the lookup table of each ColumnStandardizer and persists it. Must only be
+    called once the Spark job that used the lookups has run.
+    :param spark: the current SparkSession
+    :param standardizers: the ColumnStandardizers passed to create_executor_lookups()
+    :param lookups: the tuples returned by create_executor_lookups()
+    :return: None
+    """
+    for standardizer, (source_column, resolve_function, default_value, mapping, accumulator) in zip(standardizers,
+                                                                                                      lookups):
+        print('Resolved {} new {} values.'.format(standardizer.merge(accumulator.value), source_column))
+        standardizer.save(spark)
+
+
+def standardize_record(record, lookups, known_values, new_values):
+    """
+    Runs on the executors: turns one Socrata row into a tuple matching STANDARDIZED_SCHEMA, resolving each
+    standardized column from the broadcast lookup tables, or with the resolve function for values they don't hold yet.
+    :param record: a dictionary, as returned by Socrata
+    :param lookups: the tuples returned by create_executor_lookups()
+    :param known_values: one dictionary per lookup of every value resolved so far, updated in place
+    :param new_values: one dictionary per lookup of the values resolved on this executor, updated in place
+    :return: a tuple matching STANDARDIZED_SCHEMA
+    """
+    standardized_values = []
+
+    for (source_column, resolve_function, default_value, mapping, accumulator), known, new in zip(
+            lookups, known_values, new_values):
+        value = record.get(source_column)
+        if value is None:
+            standardized_values.append(default_value)
+        elif value in known:
+            standardized_values.append(known[value])
+        else:
+            known[value] = new[value] = resolve_function(value)
+            standardized_values.append(known[value])
+
+    # Fields Socrata leaves out of a row end up as the string 'NaN' when a batch goes through Pandas on the driver. Do
+    # the same here so the warehouse SQL sees identical values either way.
+    return (int(record['summons_number']),) + tuple(
+        str(record[column]) if column in record else 'NaN'
+        for column in PARKING_VIOLATIONS_COLUMNS[1:]) + tuple(standardized_values)
+
+
+def standardize_partition(records, lookups):
+    """
+    Runs on the executors: yields the rows with the standardized columns appended, then reports the values that were
+    resolved along the way to the driver.
+    :param records: an iterator of row dictionaries as returned by Socrata
+    :param lookups: the lookup tables of the ColumnStandardizers, see create_executor_lookups()
+    :return: a generator of tuples matching STANDARDIZED_SCHEMA
+    """
+    known_values = [dict(mapping.value) for source_column, resolve_function, default_value, mapping, accumulator
+                    in lookups]
+    new_values = [{} for lookup in lookups]
+
+    for record in records:
+        yield standardize_record(record, lookups, known_values, new_values)
+
+    for (source_column, resolve_function, default_value, mapping, accumulator), new in zip(lookups, new_values):
+        accumulator.add(new)
+
+
+def fetch_summons_ranges_partition(summons_ranges, socrata_domain, app_token, dataset_id, batch_sizer, lookups,
+                                   landing_zone=None):
+    """
+    Runs on the executors: pages through each summons_number range of the partition and yields the rows with the
+    standardized columns appended, so that no row has to pass through the driver.
+    :param summons_ranges: an iterator of (lower, upper) summons_number ranges, see split_summons_range()
+    :param socrata_domain: The URL endpoint of the Socrata service where the target API is located
+    :param app_token: the Socrata application key, or None
+    :param dataset_id: the alphanumeric ID of the source dataset from data.cityofnewyork.us
+    :param batch_sizer: the AdaptiveBatchSizer choosing the number of rows requested from Socrata per call. Every
+        task adapts its own copy.
+    :param lookups: the lookup tables of the ColumnStandardizers, see create_executor_lookups()
+    :param landing_zone: Optional. The LandingZone in which every raw page is kept
+    :return: a generator of tuples matching STANDARDIZED_SCHEMA
+    """
+    def fetch_records():
+        client = create_socrata_client(socrata_domain, app_token, batch_sizer.request_timeout_seconds)
+
+        for lower_summons_number, upper_summons_number in summons_ranges:
+            cursor = lower_summons_number
+
+            while True:
+                records, exhausted = fetch_sized_page(client, dataset_id, cursor, upper_summons_number, batch_sizer,
+                                                      landing_zone)
+                yield from records
+
+                if exhausted:
+                    break
+
+                cursor = int(records[-1]['summons_number'])
+
+    return standardize_partition(fetch_records(), lookups)
+
+
+def read_landed_pages_partition(pages, landing_zone, lookups):
+    """
+    Runs on the executors: reads each landed page of the partition and yields the rows with the standardized columns
+    appended.
+    :param pages: an iterator of (path, summons_number) tuples, see LandingZone.plan_replay()
+    :param landing_zone: the LandingZone
+    :param lookups: the lookup tables of the ColumnStandardizers, see create_executor_lookups()
+    :return: a generator of tuples matching STANDARDIZED_SCHEMA
+    """
+    records = (record for path, lower_summons_number in pages
+               for record in landing_zone.read_page(path, lower_summons_number))
+
+    return standardize_partition(records, lookups)
+
+
+def write_on_executors(spark, items, read_partition, standardizers, output_data, output_format='json',
+                       compression=None):
+    """
+    Distributes the items across the cluster, one per task, turns them into standardized rows inside the executors
+    and writes them. The whole write is a single Spark job.
+    :param spark: the current SparkSession
+    :param items: the list of items to distribute, e.g. summons_number ranges
+    :param read_partition: a function of an iterator of items and the lookups, returning the standardized rows, e.g.
+        fetch_summons_ranges_partition()
+    :param standardizers: the ColumnStandardizers to apply, see create_standardizers()
+    :param output_data: The HDFS directory in which we'll write the processed output
+    :param output_format: Optional. 'json' for JSON Lines or 'parquet', see write_batch()
+    :param compression: Optional. The compression codec, see write_batch()
+    :return: the SparkJobCounter of the write
+    """
+    lookups = create_executor_lookups(spark, standardizers)
+    rows = spark.sparkContext.parallelize(items, len(items)).mapPartitions(partial(read_partition, lookups=lookups))
+
+    job_counter = SparkJobCounter(spark)
+    job_counter.start_batch('executor extraction')
+
+    write_batch(transform_batch(spark.createDataFrame(rows, STANDARDIZED_SCHEMA)), output_data, output_format,
+                compression)
+
+    job_counter.end_batch()
+    merge_executor_lookups(spark, standardizers, lookups)
+
+    return job_counter
+
+
+def extract_on_executors(spark, socrata_domain, app_token, dataset_id, output_data, summons_ranges, batch_sizer,
+                         standardizers, watermark=None, output_format='json', compression=None, landing_zone=None):
+    """
+    Distributes the summons_number ranges across the cluster and fetches them inside the executors, so extraction
+    throughput grows with the number of workers instead of being capped by the driver's memory and network link. The
+    whole extraction is a single Spark job: the partitioned write.
+    :param spark: the current SparkSession
+    :param socrata_domain: The URL endpoint of the Socrata service where the target API is located
+    :param app_token: the Socrata application key, or None
+    :param dataset_id: the alphanumeric ID of the source dataset from data.cityofnewyork.us
+    :param output_data: The HDFS directory in which we'll write the processed JSON output
+    :param summons_ranges: a list of (lower, upper) summons_number ranges, see split_summons_range()
+    :param batch_sizer: the AdaptiveBatchSizer choosing the number of rows requested from Socrata per call
+    :param standardizers: the ColumnStandardizers to apply, see create_standardizers()
+    :param watermark: Optional. The ExtractionWatermark to advance once the write has succeeded
+    :param output_format: Optional. 'json' for JSON Lines or 'parquet', see write_batch()
+    :param compression: Optional. The compression codec, see write_batch()
+    :param landing_zone: Optional. The LandingZone in which every raw page is kept
+    :return: the SparkJobCounter of the extraction
+    """
+    job_counter = write_on_executors(
+        spark, summons_ranges,
+        partial(fetch_summons_ranges_partition, socrata_domain=socrata_domain, app_token=app_token,
+                dataset_id=dataset_id, batch_sizer=batch_sizer, landing_zone=landing_zone),
+        standardizers, output_data, output_format, compression)
+
+    print('Wrote summons numbers {} to {} to {}'.format(summons_ranges[0][0] + 1, summons_ranges[-1][1], output_data))
+
+    if watermark is not None:
+        watermark.advance(max(upper for lower, upper in summons_ranges))
+
+    return job_counter
+
+
+def records_to_pandas(records):
+    """
+    Converts a page of Socrata rows into a Pandas DataFrame with the columns of PARKING_VIOLATIONS_SCHEMA
+    :param records: a list of dictionaries, one per row, as returned by Socrata
+    :return: a Pandas DataFrame
+    """
+    # Pandas DataFrame is a straightforward format from which to convert to SparkSQL DataFrame. The dataset is
+    # returned from Socrata as a JSON array.
+    pdf = pd.DataFrame(data=records, columns=PARKING_VIOLATIONS_COLUMNS)
+
+    # Converting to numeric allows for more intuitive sorting later. String sorting on what are actually numeric
+    # values can be unpredictable.
+    pdf['summons_number'] = pd.to_numeric(pdf['summons_number'])
+
+    return pdf
+
+
+# The same schema as PARKING_VIOLATIONS_SCHEMA, but every field is read as a string first, which is how Socrata
+# returns all values in its JSON responses.
+ARROW_STRING_SCHEMA = pa.schema([pa.field(column, pa.string()) for column in PARKING_VIOLATIONS_COLUMNS])
+
+
+def records_to_arrow(records):
+    """
+    Converts a page of Socrata rows straight into an Arrow table matching PARKING_VIOLATIONS_SCHEMA, without building a
+    Pandas DataFrame of object columns first.
+    :param records: a list of dictionaries, one per row, as returned by Socrata
+    :return: a pyarrow Table
+    """
+    table = pa.Table.from_pylist(records, schema=ARROW_STRING_SCHEMA)
+
+    columns = []
+    for column in PARKING_VIOLATIONS_COLUMNS:
+        if column == 'summons_number':
+            columns.append(pc.cast(table[column], pa.int64()))
+        else:
+            # Fields Socrata leaves out of a row end up as the string 'NaN' on the Pandas path. Do the same here so the
+            # warehouse SQL sees identical values either way.
+            columns.append(pc.fill_null(table[column], 'NaN'))
+
+    return pa.Table.from_arrays(columns, names=PARKING_VIOLATIONS_COLUMNS)
+
+
+def arrow_to_spark(spark, table):
+    """
+    Hands an Arrow table to Spark through Arrow rather than pickling it row by row. Spark 4 accepts the table as-is;
+    older versions go through a Pandas DataFrame that reuses the Arrow buffers where it can.
+    :param spark: the current SparkSession, with spark.sql.execution.arrow.pyspark.enabled set
+    :param table: a pyarrow Table matching STANDARDIZED_SCHEMA
+    :return: a Spark DataFrame
+    """
+    if int(pyspark.__version__.split('.')[0]) >= 4:
+        return spark.createDataFrame(table, STANDARDIZED_SCHEMA)
+
+    return spark.createDataFrame(table.to_pandas(split_blocks=True, self_destruct=True), STANDARDIZED_SCHEMA)
+
+
+def records_to_spark(spark, records, standardizers, ingest='arrow'):
+    """
+    Converts a page of Socrata rows into a Spark DataFrame, adding the standardized columns while the batch is still on
+    the driver. Creating the DataFrame from local data does not run a Spark job.
+    :param spark: the current SparkSession
+    :param records: a list of dictionaries, one per row, as returned by Socrata
+    :param standardizers: the ColumnStandardizers to apply, see create_standardizers()
+    :param ingest: 'arrow' to convert through Arrow record batches, or 'pandas' for the original Pandas path
+    :return: a Spark DataFrame matching STANDARDIZED_SCHEMA
+    """
+    if ingest == 'arrow':
+        table = records_to_arrow(records)
+        for standardizer in standardizers:
+            table = standardizer.standardize_arrow(table)
+
+        return arrow_to_spark(spark, table)
+
+    pdf = records_to_pandas(records)
+    for standardizer in standardizers:
+        standardizer.standardize_pandas(pdf)
+
+    return spark.createDataFrame(pdf, STANDARDIZED_SCHEMA)
+
+
+def transform_batch(sdf):
+    """
+    Adds the vehicle hash key and the year and month partitioning columns to a batch.
+    The vehicle hash key identifies the vehicle's make, body type and standardized color, so that the fact load can
+    find its dim_vehicle row with a single BIGINT join. It is null when the make is missing, i.e. the vehicle is unknown.
+    The partitioning columns are taken from the integer issue_date_key rather than by parsing 'issue_date' again;
+    violations without a valid issue date end up under year_number=1900/month_number=1.
+    :param sdf: the batch as a Spark DataFrame, with the standardized columns already added
+    :return: the transformed Spark DataFrame
+    """
+    vehicle_columns = ["vehicle_make", "vehicle_body_type", "vehicle_color_standardized"]
+    is_unknown_vehicle = f.col("vehicle_make").isNull() | (f.col("vehicle_make") == 'NaN') | \
+        f.col("vehicle_body_type").isNull()
+
+    return sdf.withColumn(
+        "vehicle_hash_key",
+        f.when(is_unknown_vehicle, f.lit(None)).otherwise(f.xxhash64(*vehicle_columns))).withColumn(
+        "year_number",
+        (f.col("issue_date_key") / 10000).cast(IntegerType())).withColumn(
+        "month_number",
+        (f.col("issue_date_key") / 100 % 100).cast(IntegerType()))
+
+
+def write_batch(sdf_final, output_data, output_format='json', compression=None):
+    """
+    Appends a transformed batch to the output, partitioned on year then month.
+    :param sdf_final: the transformed Spark DataFrame, see transform_batch()
+    :param output_data: The HDFS directory in which we'll write the processed output
+    :param output_format: Optional. 'json' for JSON Lines or 'parquet'
+    :param compression: Optional. The compression codec, e.g. 'snappy' or 'zstd'. Spark's default for the format is
+        used if not set.
+    :return: None
+    """
+    writer = sdf_final.select(*STAGE_COLUMNS + PARTITION_COLUMNS).write.partitionBy(*PARTITION_COLUMNS)
+
+    if compression is not None:
+        writer = writer.option('compression', compression)
+
+    writer.format(output_format).mode('append').save(output_data)
+
+
+def process_parking_violations(spark, dataset_id, output_data, color_cache_path=None, time_cache_path=None,
+                               batch_size=500000,
+                               shard_count=1, max_workers=4, extract_on='driver', ingest='arrow', prefetch_depth=0,
+                               watermark_path=None, output_format='json', compression=None,
+                               socrata_domain='data.cityofnewyork.us', min_batch_size=None, max_batch_size=None,
+                               target_page_seconds=30.0, page_memory_ceiling_bytes=None, landing_zone_path=None,
+                               landing_compression='zstd', replay=False):
     """
     The main driver function which uses the Socrata client to retrieve the target dataset in batches and processes
     the data to standardize the 'vehicle_color' input and partition the data on year then month before writing the
     resulting JSON to HDFS where we can process it further in our cloud data warehouse.
     :param spark: the current SparkSession
     :param dataset_id: the alphanumeric ID of the source dataset from data.cityofnewyork.us
-    :param output_data: The HDFS directory in which we'll write the processed JSON output
-    :return: None
+    :param output_data: The HDFS directory in which we'll write the processed output
+    :param color_cache_path: Optional. Where the resolved 'vehicle_color' lookup table is persisted between runs
+    :param time_cache_path: Optional. Where the resolved 'violation_time' lookup table is persisted between runs
+    :param batch_size: Optional. The number of rows requested from Socrata per call, or the first one if
+        min_batch_size or max_batch_size allow it to adapt
+    :param shard_count: Optional. If greater than 1, the summons_number keyspace is split into this many ranges which
+        are fetched concurrently
+    :param max_workers: Optional. The maximum number of concurrent Socrata requests when shard_count is greater than 1
+    :param extract_on: Optional. 'driver' fetches every page on the driver, 'executors' distributes shard_count
+        summons_number ranges across the cluster and fetches them inside the executors
+    :param ingest: Optional. How pages fetched on the driver are converted to Spark, 'arrow' or 'pandas'
+    :param prefetch_depth: Optional. If greater than 0, pages are fetched on a background thread while Spark processes
+        earlier ones, with up to this many fetched pages waiting in memory
+    :param watermark_path: Optional. A Hadoop-compatible path of an ExtractionWatermark file. If set, only rows above
+        the watermark are fetched (incremental mode), the watermark is advanced after every successful write, and an
+        interrupted run resumes where it left off. If not set, the whole dataset is fetched.
+    :param output_format: Optional. 'json' for JSON Lines or 'parquet'
+    :param compression: Optional. The compression codec for the output, e.g. 'snappy' or 'zstd'
+    :param socrata_domain: Optional. The Socrata service to extract from. An http:// URL, e.g. of the local stand-in
+        served by socrata_stand_in.py, is queried over plain HTTP and without the application key.
+    :param min_batch_size: Optional. If below batch_size, the AdaptiveBatchSizer may shrink pages down to this size
+    :param max_batch_size: Optional. If above batch_size, the AdaptiveBatchSizer may grow pages up to this size
+    :param target_page_seconds: Optional. The Socrata response time the adaptive batch size aims for. Requests time out
+        after AdaptiveBatchSizer.REQUEST_TIMEOUT_FACTOR times this long.
+    :param page_memory_ceiling_bytes: Optional. The most memory the pages held at once may take when the batch size
+        adapts
+    :param landing_zone_path: Optional. The root directory of a LandingZone in which every page is kept exactly as
+        Socrata returned it, or from which it is replayed
+    :param landing_compression: Optional. 'zstd' or 'gzip', for the pages landed
+    :param replay: Optional. If True, the pages in the landing zone are transformed and written again instead of
+        calling Socrata, in batches of at least batch_size rows on the driver or one task per page on the executors.
+        The watermark is neither read nor advanced.
+    :return: the SparkJobCounter of the run, or None if there was nothing to process
     """
 
-    client = get_socrata_client("data.cityofnewyork.us", "udacity/deng", "us-east-1", "socrata_app_token")
-
-    # Set the schema explicitly here first. Most important is that summons_number is a LongType since that column is
-    # always populated in the dataset and provides an obvious choice for sorting and batching.
-    schema = StructType([
-        StructField("summons_number", LongType(), True),
-        StructField("plate_id", StringType(), True),
-        StructField("registration_state", StringType(), True),
-        StructField("plate_type", StringType(), True),
-        StructField("issue_date", StringType(), True),
-        StructField("violation_code", StringType(), True),
-        StructField("vehicle_body_type", StringType(), True),
-        StructField("vehicle_make", StringType(), True),
-        StructField("issuing_agency", StringType(), True),
-        StructField("street_code1", StringType(), True),
-        StructField("street_code2", StringType(), True),
-        StructField("street_code3", StringType(), True),
-        StructField("vehicle_expiration_date", StringType(), True),
-        StructField("violation_location", StringType(), True),
-        StructField("violation_precinct", StringType(), True),
-        StructField("issuer_precinct", StringType(), True),
-        StructField("issuer_code", StringType(), True),
-        StructField("issuer_command", StringType(), True),
-        StructField("issuer_squad", StringType(), True),
-        StructField("violation_time", StringType(), True),
-        StructField("violation_county", StringType(), True),
-        StructField("violation_in_front_of_or_opposite", StringType(), True),
-        StructField("house_number", StringType(), True),
-        StructField("street_name", StringType(), True),
-        StructField("date_first_observed", StringType(), True),
-        StructField("law_section", StringType(), True),
-        StructField("sub_division", StringType(), True),
-        StructField("days_parking_in_effect", StringType(), True),
-        StructField("from_hours_in_effect", StringType(), True),
-        StructField("to_hours_in_effect", StringType(), True),
-        StructField("vehicle_color", StringType(), True),
-        StructField("unregistered_vehicle", StringType(), True),
-        StructField("vehicle_year", StringType(), True),
-        StructField("meter_number", StringType(), True),
-        StructField("feet_from_curb", StringType(), True),
-        StructField("intersecting_street", StringType(), True),
-        StructField("time_first_observed", StringType(), True),
-        StructField("violation_legal_code", StringType(), True),
-        StructField("violation_description", StringType(), True),
-        StructField("violation_post_code", StringType(), True)])
-
-    where_clause_format = "summons_number > {}"
+    standardizers = create_standardizers(color_cache_path, time_cache_path)
+    for standardizer in standardizers:
+        print('Loaded {} cached {} values.'.format(standardizer.load(spark), standardizer.source_column))
+
+    if ingest == 'arrow':
+        spark.conf.set("spark.sql.execution.arrow.pyspark.enabled", "true")
+
+    if output_format == 'parquet':
+        # Redshift tries to read every object under the COPY prefix as Parquet, including the empty _SUCCESS marker
+        spark.sparkContext._jsc.hadoopConfiguration().set("mapreduce.fileoutputcommitter.marksuccessfuljobs", "false")
+
+    landing_zone = None
+    if landing_zone_path is not None:
+        landing_zone = LandingZone(landing_zone_path, dataset_id, landing_compression)
+
+    if replay:
+        return replay_landing_zone(spark, landing_zone, output_data, standardizers, extract_on, batch_size, ingest,
+                                   prefetch_depth, output_format, compression)
+
+    app_token = None
+    if not socrata_domain.startswith('http://'):
+        app_token = get_socrata_app_token("udacity/deng", "us-east-1", "socrata_app_token")
+    request_timeout_seconds = target_page_seconds * AdaptiveBatchSizer.REQUEST_TIMEOUT_FACTOR
+    client = create_socrata_client(socrata_domain, app_token, request_timeout_seconds)
+
     starting_summons_number = 0
-    rows_returned = 1
-
-    while rows_returned > 0:
-        # first, write the dataset to Pandas DataFrame because this is a straightforward format from which to convert to
-        # SparkSQL DataFrame. The dataset is returned from Socrata as a JSON array.
-        pdf = pd.DataFrame(data=client.get(dataset_id, where=where_clause_format.format(str(starting_summons_number)),
-                                           order="summons_number", limit=500000),
-                           columns=['summons_number', 'plate_id', 'registration_state', 'plate_type', 'issue_date',
-                                    'violation_code', 'vehicle_body_type', 'vehicle_make', 'issuing_agency',
-                                    'street_code1', 'street_code2', 'street_code3', 'vehicle_expiration_date',
-                                    'violation_location', 'violation_precinct', 'issuer_precinct', 'issuer_code',
-                                    'issuer_command', 'issuer_squad', 'violation_time', 'violation_county',
-                                    'violation_in_front_of_or_opposite', 'house_number', 'street_name',
-                                    'date_first_observed', 'law_section', 'sub_division', 'days_parking_in_effect',
-                                    'from_hours_in_effect', 'to_hours_in_effect', 'vehicle_color',
-                                    'unregistered_vehicle', 'vehicle_year', 'meter_number', 'feet_from_curb',
-                                    'intersecting_street', 'time_first_observed', 'violation_legal_code',
-                                    'violation_description', 'violation_post_code'])
-
-        rows_returned = len(pdf.index)
-
-        print('Processing the next batch: ' + str(rows_returned) + ' rows.')
+    watermark = None
+    summons_ranges = None
 
-        if rows_returned > 0:
-            # Converting to numeric allows for more intuitive sorting later. String sorting on what are actually numeric
-            # values can be unpredictable.
-            pdf['summons_number'] = pd.to_numeric(pdf['summons_number'])
+    if watermark_path is not None:
+        watermark = ExtractionWatermark(spark, watermark_path, dataset_id)
+        starting_summons_number = watermark.load()
+        summons_ranges = watermark.pending_shard_ranges()
 
-            sdf = spark.createDataFrame(pdf, schema)
+        if summons_ranges is not None:
+            print('Resuming {} unfinished shards of an interrupted run.'.format(
+                len([r for r in summons_ranges if r is not None])))
+        else:
+            print('Fetching rows above the watermark summons_number {}.'.format(starting_summons_number))
 
-            starting_summons_number = sdf.agg(f.max('summons_number')).collect()[0]["max(summons_number)"]
+    if summons_ranges is None and (extract_on == 'executors' or shard_count > 1):
+        min_summons_number, max_summons_number = probe_summons_range(client, dataset_id, starting_summons_number)
+        if min_summons_number is None:
+            print('No rows above summons_number {}, nothing to process.'.format(starting_summons_number))
+            return None
 
-            # Add the standardized color code column and separate year and month numbers for partitioning later
-            sdf_final = sdf.withColumn(
-                "vehicle_color_standardized",
-                color_udf("vehicle_color")).withColumn(
-                "year_number",
-                f.year("issue_date")).withColumn(
-                "month_number",
-                f.month("issue_date"))
+        summons_ranges = split_summons_range(min_summons_number, max_summons_number, shard_count)
+        print('Split summons numbers {} to {} into {} ranges.'.format(
+            min_summons_number, max_summons_number, len(summons_ranges)))
 
-            sdf_final.write.partitionBy('year_number', 'month_number').json(output_data, 'append')
+        if watermark is not None and extract_on == 'driver':
+            watermark.start_shards(summons_ranges)
+
+    # Count every page that can be alive at once: the ones being fetched, the ones waiting in the prefetch queue and
+    # the one Spark is processing. On the executors, each concurrent task holds one page.
+    if extract_on == 'executors':
+        pages_in_memory = int(spark.conf.get("spark.executor.cores", "1"))
+    elif summons_ranges is not None:
+        pages_in_memory = max_workers + prefetch_depth + 1
+    else:
+        pages_in_memory = prefetch_depth + 2
+
+    batch_sizer = AdaptiveBatchSizer(batch_size, min_batch_size, max_batch_size, target_page_seconds,
+                                     page_memory_ceiling_bytes, pages_in_memory)
+    if batch_sizer.adaptive:
+        print('Adapting the batch size between {} and {} rows, starting at {}.'.format(
+            batch_sizer.min_batch_size, batch_sizer.max_batch_size, batch_sizer.batch_size))
+
+    if extract_on == 'executors':
+        return extract_on_executors(spark, socrata_domain, app_token, dataset_id, output_data,
+                                    [r for r in summons_ranges if r is not None], batch_sizer, standardizers,
+                                    watermark, output_format, compression, landing_zone)
+
+    if summons_ranges is not None:
+        print('Fetching {} shards with {} workers.'.format(len(summons_ranges), max_workers))
+
+        pages = iter_sharded_pages(lambda: create_socrata_client(socrata_domain, app_token, request_timeout_seconds),
+                                   dataset_id, summons_ranges, batch_sizer, max_workers, landing_zone)
+    else:
+        pages = iter_serial_pages(client, dataset_id, starting_summons_number, batch_sizer, landing_zone)
+
+    if prefetch_depth > 0:
+        print('Prefetching up to {} pages ahead.'.format(prefetch_depth))
+        pages = PrefetchQueue(pages, prefetch_depth)
+
+    job_counter = process_pages(spark, pages, standardizers, output_data, ingest, output_format, compression,
+                                watermark, summons_ranges)
+
+    if prefetch_depth > 0:
+        pages.report()
+
+    batch_sizer.report()
+    job_counter.report()
+
+    return job_counter
+
+
+def process_pages(spark, pages, standardizers, output_data, ingest='arrow', output_format='json', compression=None,
+                  watermark=None, summons_ranges=None):
+    """
+    Transforms and writes the pages fetched on the driver one batch at a time, advancing the watermark after each.
+    :param spark: the current SparkSession
+    :param pages: a page generator, e.g. iter_serial_pages(), or a PrefetchQueue
+    :param standardizers: the ColumnStandardizers to apply, see create_standardizers()
+    :param output_data: The HDFS directory in which we'll write the processed output
+    :param ingest: Optional. How the pages are converted to Spark, 'arrow' or 'pandas'
+    :param output_format: Optional. 'json' for JSON Lines or 'parquet', see write_batch()
+    :param compression: Optional. The compression codec, see write_batch()
+    :param watermark: Optional. The ExtractionWatermark to advance
+    :param summons_ranges: Optional. The shards the pages come from, if they were fetched by iter_sharded_pages()
+    :return: the SparkJobCounter of the batches
+    """
+    job_counter = SparkJobCounter(spark)
+
+    for shard_number, records, exhausted in pages:
+        rows_returned = len(records)
+
+        print('Processing the next batch from shard ' + str(shard_number) + ': ' + str(rows_returned) + ' rows.')
+
+        if rows_returned > 0:
+            job_counter.start_batch('{} rows from shard {}'.format(rows_returned, shard_number))
+
+            write_batch(transform_batch(records_to_spark(spark, records, standardizers, ingest)), output_data,
+                        output_format, compression)
             print('Wrote ' + str(rows_returned) + ' rows to ' + output_data)
 
+            job_counter.end_batch()
+
+            for standardizer in standardizers:
+                standardizer.save(spark)
+
+        if watermark is not None:
+            if summons_ranges is not None:
+                cursor = int(records[-1]["summons_number"]) if rows_returned > 0 else summons_ranges[shard_number][0]
+                watermark.advance_shard(shard_number, cursor, exhausted)
+            elif rows_returned > 0:
+                watermark.advance(int(records[-1]["summons_number"]))
+
+    return job_counter
+
+
+def replay_landing_zone(spark, landing_zone, output_data, standardizers, extract_on='driver', batch_size=500000,
+                        ingest='arrow', prefetch_depth=0, output_format='json', compression=None):
+    """
+    Runs the transform and write again over the pages kept in the landing zone, without any call to Socrata, e.g.
+    after the color rules or the partitioning changed.
+    :param spark: the current SparkSession
+    :param landing_zone: the LandingZone to replay
+    :param output_data: The HDFS directory in which we'll write the processed output
+    :param standardizers: the ColumnStandardizers to apply, see create_standardizers()
+    :param extract_on: Optional. 'driver' reads the pages on the driver, 'executors' reads one page per Spark task
+    :param batch_size: Optional. On the driver, consecutive pages are combined until a batch has this many rows
+    :param ingest: Optional. How pages read on the driver are converted to Spark, 'arrow' or 'pandas'
+    :param prefetch_depth: Optional. If greater than 0, pages are read on a background thread while Spark processes
+        earlier ones, with up to this many batches waiting in memory
+    :param output_format: Optional. 'json' for JSON Lines or 'parquet', see write_batch()
+    :param compression: Optional. The compression codec, see write_batch()
+    :return: the SparkJobCounter of the replay, or None if the landing zone is empty
+    """
+    pages = landing_zone.plan_replay()
+    if len(pages) == 0:
+        print('No pages of {} in the landing zone {}, nothing to replay.'.format(landing_zone.dataset_id,
+                                                                                 landing_zone.path))
+        return None
+
+    print('Replaying {} landed pages of {} from {}.'.format(len(pages), landing_zone.dataset_id, landing_zone.path))
+
+    if extract_on == 'executors':
+        job_counter = write_on_executors(spark, pages, partial(read_landed_pages_partition, landing_zone=landing_zone),
+                                         standardizers, output_data, output_format, compression)
+        print('Wrote the replayed pages to ' + output_data)
+    else:
+        pages = iter_landed_pages(landing_zone, pages, batch_size)
+
+        if prefetch_depth > 0:
+            print('Prefetching up to {} batches ahead.'.format(prefetch_depth))
+            pages = PrefetchQueue(pages, prefetch_depth)
+
+        job_counter = process_pages(spark, pages, standardizers, output_data, ingest, output_format, compression)
+
+        if prefetch_depth > 0:
+            pages.report()
+
+    job_counter.report()
+
+    return job_counter
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Extracts and pre-processes the NYC Parking Violations dataset")
+    parser.add_argument("--output", default="hdfs:///parking_violations",
+                        help="Hadoop-compatible directory in which the processed output is written")
+    parser.add_argument("--output-format", choices=['json', 'parquet'], default='json',
+                        help="Write JSON Lines or Parquet")
+    parser.add_argument("--compression", choices=['none', 'snappy', 'gzip', 'zstd', 'lz4'],
+                        help="Compression codec for the output. Defaults to Spark's default for the format.")
+    parser.add_argument("--compact", action="store_true",
+                        help="Compact the year/month partitions of the output once extraction is done")
+    parser.add_argument("--compact-only", action="store_true",
+                        help="Only compact the existing output, without extracting anything")
+    parser.add_argument("--target-file-mb", type=int, default=128,
+                        help="Desired size of each file after compaction")
+    parser.add_argument("--manifest",
+                        help="Hadoop-compatible path of a Redshift COPY manifest listing the files written by this "
+                             "run, for pipeline/etl.py --manifest")
+    parser.add_argument("--watermark",
+                        help="Hadoop-compatible path of the extraction watermark file. If set, only rows above the "
+                             "watermark are fetched, and an interrupted run resumes where it left off.")
+    parser.add_argument("--color-cache", default="hdfs:///parking_violations_meta/color_cache.json",
+                        help="Hadoop-compatible path of the persisted vehicle color lookup table")
+    parser.add_argument("--time-cache", default="hdfs:///parking_violations_meta/time_cache.json",
+                        help="Hadoop-compatible path of the persisted violation time lookup table")
+    parser.add_argument("--batch-size", type=int, default=500000,
+                        help="Number of rows requested from Socrata per call, or the first one with --min-batch-size "
+                             "or --max-batch-size")
+    parser.add_argument("--min-batch-size", type=int,
+                        help="Let the batch size shrink down to this many rows when responses are slow or memory is "
+                             "short")
+    parser.add_argument("--max-batch-size", type=int,
+                        help="Let the batch size grow up to this many rows while responses are fast and memory allows")
+    parser.add_argument("--target-page-seconds", type=float, default=30.0,
+                        help="The Socrata response time the adaptive batch size aims for. Requests time out after "
+                             "twice this long.")
+    parser.add_argument("--page-memory-ceiling-mb", type=int,
+                        help="The most memory the pages held at once may take when the batch size adapts. Half of "
+                             "the available memory is used at most either way.")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Split the summons_number keyspace into this many ranges and fetch them concurrently, "
+                             "on the driver or, with --extract-on executors, as one Spark task per range")
+    parser.add_argument("--fetch-workers", type=int, default=4,
+                        help="Maximum number of concurrent Socrata requests when --shards is greater than 1")
+    parser.add_argument("--extract-on", choices=['driver', 'executors'], default='driver',
+                        help="Fetch pages on the driver, or distribute the --shards ranges and fetch inside executors")
+    parser.add_argument("--ingest", choices=['arrow', 'pandas'], default='arrow',
+                        help="How pages fetched on the driver are converted to Spark")
+    parser.add_argument("--prefetch-depth", type=int, default=0,
+                        help="Fetch up to this many pages ahead on a background thread while Spark processes the "
+                             "current one. 0 disables prefetching.")
+    parser.add_argument("--socrata-domain", default="data.cityofnewyork.us",
+                        help="The Socrata service to extract from, or the http:// URL of the local stand-in served by "
+                             "socrata_stand_in.py")
+    parser.add_argument("--landing-zone",
+                        help="Directory in which every page is kept as Socrata returned it, compressed, keyed by "
+                             "dataset and summons number range: a local path, s3:// or hdfs://")
+    parser.add_argument("--landing-compression", choices=['zstd', 'gzip'], default='zstd',
+                        help="Compression codec of the pages kept in the landing zone")
+    parser.add_argument("--replay", action="store_true",
+                        help="Transform and write the pages in --landing-zone again instead of calling Socrata")
+    parser.add_argument("--dataset-id", default="pvqr-7yc4",
+                        help="The dataset to extract. Source: https://dev.socrata.com/foundry/data.cityofnewyork.us/"
+                             "pvqr-7yc4")
+    args = parser.parse_args()
+
+    if args.replay and not args.landing_zone:
+        parser.error("--replay needs --landing-zone")
+
     spark = create_spark_session()
-    dataset_id = "pvqr-7yc4"  # Source: https://dev.socrata.com/foundry/data.cityofnewyork.us/pvqr-7yc4
-    output_data = "hdfs:///parking_violations"
+    dataset_id = args.dataset_id
+    output_data = args.output
+
+    if args.manifest:
+        files_before = snapshot_output_files(spark, output_data)
+
+    if not args.compact_only:
+        process_parking_violations(spark, dataset_id, output_data, color_cache_path=args.color_cache,
+                                   time_cache_path=args.time_cache,
+                                   batch_size=args.batch_size, shard_count=args.shards, max_workers=args.fetch_workers,
+                                   extract_on=args.extract_on, ingest=args.ingest,
+                                   prefetch_depth=args.prefetch_depth, watermark_path=args.watermark,
+                                   output_format=args.output_format, compression=args.compression,
+                                   socrata_domain=args.socrata_domain, min_batch_size=args.min_batch_size,
+                                   max_batch_size=args.max_batch_size, target_page_seconds=args.target_page_seconds,
+                                   page_memory_ceiling_bytes=args.page_memory_ceiling_mb * 1024 ** 2
+                                   if args.page_memory_ceiling_mb else None,
+                                   landing_zone_path=args.landing_zone, landing_compression=args.landing_compression,
+                                   replay=args.replay)
+
+    if args.compact or args.compact_only:
+        compact_partitions(spark, output_data, STAGE_SCHEMA, args.output_format, args.compression,
+                           args.target_file_mb * 1024 ** 2)
 
-    process_parking_violations(spark, dataset_id, output_data)
+    if args.manifest:
+        write_manifest(spark, args.manifest, files_before, snapshot_output_files(spark, output_data))
 
     spark.stop()
 
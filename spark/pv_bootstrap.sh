@@ -1,3 +1,3 @@
 #!/bin/bash
 
-sudo python3 -m pip install boto3 pandas sodapy
+sudo python3 -m pip install boto3 pandas pyarrow sodapy
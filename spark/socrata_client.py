@@ -0,0 +1,284 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import boto3
+import json
+import requests
+from sodapy import Socrata
+import threading
+import time
+
+
+def get_socrata_app_token(secret_name, region_name, secret_key):
+    """
+    Initializes an AWS Secrets Manager session from which we can retrieve the Socrata application key needed to query
+    the NYC Parking Violations dataset.
+    :param secret_name: The AWS Secrets Manager secret name where the application key is stored
+    :param region_name: The AWS region name where the Secrets Manager instance is located
+    :param secret_key: The Secret key whose value is the application key needed to call Socrata
+    :return: the Socrata application key
+    """
+
+    # Create a Secrets Manager client
+    session = boto3.session.Session()
+    client = session.client(
+        service_name='secretsmanager',
+        region_name=region_name
+    )
+
+    get_secret_value_response = json.loads(client.get_secret_value(SecretId=secret_name)["SecretString"])
+
+    return get_secret_value_response[secret_key]
+
+
+def get_socrata_client(socrata_domain, secret_name, region_name, secret_key):
+    """
+    Retrieves the Socrata application key from AWS Secrets Manager and initializes a client with which we can query
+    the NYC Parking Violations dataset.
+    :param socrata_domain: The URL endpoint of the Socrata service where the target API is located
+    :param secret_name: The AWS Secrets Manager secret name where the application key is stored
+    :param region_name: The AWS region name where the Secrets Manager instance is located
+    :param secret_key: The Secret key whose value is the application key needed to call Socrata
+    :return: the Socrata client
+    """
+    api_token = get_socrata_app_token(secret_name, region_name, secret_key)
+
+    client = create_socrata_client(socrata_domain, api_token)
+    return client
+
+
+def create_socrata_client(socrata_domain, app_token=None, timeout_seconds=10):
+    """
+    Initializes a Socrata client. A domain given as an http:// URL, such as the local stand-in served by
+    socrata_stand_in.py, is queried over plain HTTP instead of HTTPS.
+    :param socrata_domain: The URL endpoint of the Socrata service where the target API is located
+    :param app_token: Optional. The Socrata application key. Requests without one are throttled more strictly.
+    :param timeout_seconds: Optional. How long to wait for a response before the request fails with a Timeout. Pages
+        sized by an AdaptiveBatchSizer need its request_timeout_seconds.
+    :return: the Socrata client
+    """
+    if socrata_domain.startswith('http://'):
+        client = Socrata(domain=socrata_domain[len('http://'):], app_token=app_token,
+                         session_adapter={'prefix': 'http://', 'adapter': requests.adapters.HTTPAdapter()},
+                         timeout=timeout_seconds)
+    else:
+        client = Socrata(domain=socrata_domain, app_token=app_token, timeout=timeout_seconds)
+
+    # The body, size, duration and row limit of the last successful response, for the LandingZone and the
+    # AdaptiveBatchSizer. sodapy only hands back the parsed rows, so the body is kept from the raw response as it
+    # arrives.
+    client.last_response_content = None
+    client.last_response_bytes = 0
+    client.last_request_seconds = 0.0
+    client.last_request_limit = None
+
+    def record_response(response, *args, **kwargs):
+        client.last_response_content = response.content
+        client.last_response_bytes = len(response.content)
+
+    client.session.hooks['response'].append(record_response)
+
+    return client
+
+
+# HTTP statuses with which Socrata signals throttling or a brief outage. Requests failing with these are retried.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def get_with_retries(client, dataset_id, max_retries=5, batch_sizer=None, **params):
+    """
+    Queries Socrata, retrying with exponential backoff when it is throttling us or briefly unavailable. A Retry-After
+    header sent with the error is honored. With a batch_sizer, a page that timed out or was throttled is retried with
+    the fewer rows the batch_sizer shrinks to.
+    :param client: the Socrata client
+    :param dataset_id: the alphanumeric ID of the source dataset from data.cityofnewyork.us
+    :param max_retries: Optional. Give up and raise the error after this many retries
+    :param batch_sizer: Optional. The AdaptiveBatchSizer that chose the limit of the query
+    :param params: the SoQL parameters of the query, e.g. where, order and limit
+    :return: a list of dictionaries, one per row, as returned by Socrata
+    """
+    attempt = 0
+
+    while True:
+        shrink_reason = None
+
+        try:
+            start_time = time.perf_counter()
+            result = client.get(dataset_id, **params)
+            # Time spent backing off is left out, so throttling does not read as a slow page
+            client.last_request_seconds = time.perf_counter() - start_time
+            client.last_request_limit = params.get('limit')
+            return result
+        except requests.exceptions.HTTPError as e:
+            if attempt >= max_retries or e.response is None or e.response.status_code not in RETRYABLE_STATUS_CODES:
+                raise
+
+            retry_after = e.response.headers.get('Retry-After', '')
+            delay_seconds = float(retry_after) if retry_after.isdigit() else 2 ** attempt
+            print('Socrata answered {}, retrying in {} seconds.'.format(e.response.status_code, delay_seconds))
+
+            if e.response.status_code == 429:
+                shrink_reason = 'a 429 Too Many Requests'
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= max_retries:
+                raise
+
+            delay_seconds = 2 ** attempt
+            print('Socrata request failed ({}), retrying in {} seconds.'.format(type(e).__name__, delay_seconds))
+
+            if isinstance(e, requests.exceptions.Timeout):
+                shrink_reason = 'a timeout'
+
+        if batch_sizer is not None and shrink_reason is not None and 'limit' in params:
+            params['limit'] = batch_sizer.shrink(params['limit'], shrink_reason)
+
+        time.sleep(delay_seconds)
+        attempt += 1
+
+
+def fetch_page(client, dataset_id, lower_summons_number, upper_summons_number=None, limit=500000, batch_sizer=None):
+    """
+    Retrieves one page of the dataset, ordered by summons_number, starting right after the given summons_number.
+    :param client: the Socrata client
+    :param dataset_id: the alphanumeric ID of the source dataset from data.cityofnewyork.us
+    :param lower_summons_number: Only rows with a summons_number greater than this value are returned
+    :param upper_summons_number: Optional. Only rows with a summons_number up to and including this value are returned
+    :param limit: the maximum number of rows to return
+    :param batch_sizer: Optional. The AdaptiveBatchSizer that chose the limit, which may lower it for a retry. The
+        limit finally used is left in client.last_request_limit.
+    :return: a list of dictionaries, one per row, as returned by Socrata
+    """
+    where_clause = "summons_number > {}".format(lower_summons_number)
+    if upper_summons_number is not None:
+        where_clause += " AND summons_number <= {}".format(upper_summons_number)
+
+    return get_with_retries(client, dataset_id, batch_sizer=batch_sizer, where=where_clause, order="summons_number",
+                            limit=limit)
+
+
+def fetch_sized_page(client, dataset_id, lower_summons_number, upper_summons_number, batch_sizer, landing_zone=None):
+    """
+    Retrieves the next page of a summons_number range with as many rows as the AdaptiveBatchSizer chooses, and tells
+    it what the page cost. The page is kept in the landing zone as it was received, if there is one.
+    :param client: a Socrata client from create_socrata_client()
+    :param dataset_id: the alphanumeric ID of the source dataset from data.cityofnewyork.us
+    :param lower_summons_number: Only rows with a summons_number greater than this value are returned
+    :param upper_summons_number: Only rows with a summons_number up to and including this value are returned, or None
+    :param batch_sizer: the AdaptiveBatchSizer
+    :param landing_zone: Optional. The LandingZone in which the raw page is kept
+    :return: a tuple of the list of row dictionaries and whether it was a short page, i.e. the range is exhausted
+    """
+    records = fetch_page(client, dataset_id, lower_summons_number, upper_summons_number, batch_sizer.next_size(),
+                         batch_sizer)
+    limit = client.last_request_limit
+    batch_sizer.record(limit, len(records), client.last_request_seconds, client.last_response_bytes)
+
+    if landing_zone is not None:
+        landing_zone.land(records, client.last_response_content)
+    client.last_response_content = None
+
+    return records, len(records) < limit
+
+
+def probe_summons_range(client, dataset_id, lower_summons_number=0):
+    """
+    Asks Socrata for the lowest and highest summons_number in the dataset so the keyspace can be split into shards.
+    :param client: the Socrata client
+    :param dataset_id: the alphanumeric ID of the source dataset from data.cityofnewyork.us
+    :param lower_summons_number: Optional. Only rows with a summons_number greater than this value are considered
+    :return: a tuple of the minimum and maximum summons_number, or (None, None) if there are no such rows
+    """
+    result = get_with_retries(client, dataset_id,
+                              select="min(summons_number) as min_summons_number, max(summons_number) as "
+                                     "max_summons_number",
+                              where="summons_number > {}".format(lower_summons_number))
+
+    if len(result) == 0 or "min_summons_number" not in result[0]:
+        return None, None
+
+    return int(float(result[0]["min_summons_number"])), int(float(result[0]["max_summons_number"]))
+
+
+def split_summons_range(min_summons_number, max_summons_number, shard_count):
+    """
+    Splits the summons_number keyspace into disjoint ranges of roughly equal width.
+    :param min_summons_number: the lowest summons_number in the dataset
+    :param max_summons_number: the highest summons_number in the dataset
+    :param shard_count: the number of ranges to create
+    :return: a list of (lower, upper) tuples where lower is exclusive and upper is inclusive
+    """
+    lower = min_summons_number - 1
+    width = max(1, -(-(max_summons_number - lower) // shard_count))
+    ranges = []
+
+    while lower < max_summons_number:
+        upper = min(lower + width, max_summons_number)
+        ranges.append((lower, upper))
+        lower = upper
+
+    return ranges
+
+
+def iter_sharded_pages(client_factory, dataset_id, summons_ranges, batch_sizer, max_workers, landing_zone=None):
+    """
+    Fetches every summons_number range concurrently on a bounded thread pool. Each shard keeps its own cursor and
+    only asks for its next page once the previous one has been handed to the caller, so at most max_workers pages are
+    held in memory at a time.
+    :param client_factory: a function returning a new Socrata client. Each worker thread gets its own client.
+    :param dataset_id: the alphanumeric ID of the source dataset from data.cityofnewyork.us
+    :param summons_ranges: a list of (lower, upper) summons_number ranges as returned by split_summons_range(). Entries
+        set to None are shards that are already complete and are skipped.
+    :param batch_sizer: the AdaptiveBatchSizer choosing the number of rows per page
+    :param max_workers: the maximum number of concurrent requests
+    :param landing_zone: Optional. The LandingZone in which every raw page is kept
+    :return: a generator of (shard_number, list of row dictionaries, whether the shard is exhausted) tuples in
+        completion order
+    """
+    thread_state = threading.local()
+
+    def fetch_shard_page(shard_number, cursor):
+        if not hasattr(thread_state, "client"):
+            thread_state.client = client_factory()
+        return (shard_number,) + fetch_sized_page(thread_state.client, dataset_id, cursor,
+                                                  summons_ranges[shard_number][1], batch_sizer, landing_zone)
+
+    waiting_shards = [(shard_number, summons_range[0]) for shard_number, summons_range in enumerate(summons_ranges)
+                      if summons_range is not None]
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(waiting_shards) > 0 or len(pending) > 0:
+            while len(waiting_shards) > 0 and len(pending) < max_workers:
+                pending.add(executor.submit(fetch_shard_page, *waiting_shards.pop(0)))
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                shard_number, records, exhausted = future.result()
+                yield shard_number, records, exhausted
+
+                # A short page means the shard is exhausted. Otherwise, continue right after the last row returned.
+                if not exhausted:
+                    waiting_shards.append((shard_number, int(records[-1]["summons_number"])))
+
+
+def iter_serial_pages(client, dataset_id, starting_summons_number, batch_sizer, landing_zone=None):
+    """
+    Pages through the dataset in summons_number order, one request at a time. The cursor for the next request is the
+    summons_number of the last row returned, which Socrata hands us already sorted.
+    :param client: the Socrata client
+    :param dataset_id: the alphanumeric ID of the source dataset from data.cityofnewyork.us
+    :param starting_summons_number: Only rows with a summons_number greater than this value are returned
+    :param batch_sizer: the AdaptiveBatchSizer choosing the number of rows per page
+    :param landing_zone: Optional. The LandingZone in which every raw page is kept
+    :return: a generator of (shard_number, list of row dictionaries, whether it was a short page) tuples. The
+        shard_number is always 0.
+    """
+    cursor = starting_summons_number
+
+    while True:
+        records, exhausted = fetch_sized_page(client, dataset_id, cursor, None, batch_sizer, landing_zone)
+        yield 0, records, exhausted
+
+        if len(records) == 0:
+            break
+
+        cursor = int(records[-1]["summons_number"])
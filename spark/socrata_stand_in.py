@@ -0,0 +1,334 @@
+import argparse
+import bisect
+import glob
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from generate_violations import generate_chunk_records, get_default_chunk_count, split_rows
+
+
+# The SoQL the extractor sends: conditions on summons_number joined by AND, see fetch_page() and probe_summons_range()
+WHERE_CONDITION_PATTERN = re.compile(r'\s*summons_number\s*(>=|<=|>|<|=)\s*(-?[0-9]+)\s*', re.IGNORECASE)
+
+ORDER_PATTERN = re.compile(r'\s*summons_number(\s+(ASC|DESC))?\s*', re.IGNORECASE)
+
+SELECT_AGGREGATE_PATTERN = re.compile(r'\s*(min|max|count)\((summons_number|\*)\)\s+as\s+(\w+)\s*', re.IGNORECASE)
+
+# Socrata's default $limit when none is given
+DEFAULT_LIMIT = 1000
+
+
+class SoqlError(ValueError):
+    """
+    A query the stand-in can't answer, reported to the client as Socrata reports malformed queries.
+    """
+
+
+def read_jsonl_records(data_path):
+    """
+    Reads rows written by generate_violations.py --raw, or any other JSON Lines files of Socrata rows.
+    :param data_path: a JSON Lines file, or a directory of them, optionally gzipped
+    :return: a list of dictionaries, one per row
+    """
+    if os.path.isdir(data_path):
+        paths = sorted(path for path in glob.glob(os.path.join(data_path, '*'))
+                       if os.path.isfile(path) and not os.path.basename(path).startswith(('_', '.')))
+    else:
+        paths = [data_path]
+
+    records = []
+    for path in paths:
+        with (gzip.open(path, 'rt') if path.endswith('.gz') else open(path)) as data_file:
+            records.extend(json.loads(line) for line in data_file if line.strip())
+
+    return records
+
+
+class SocrataStandIn:
+    """
+    Serves one dataset over HTTP the way Socrata's SODA API does, for the paging queries process_violations.py sends:
+    $where on summons_number ranges, $order by summons_number, $limit/$offset, and the min/max $select of
+    probe_summons_range(). Latency and throttling can be injected, both fixed and per row, so extraction can be tested
+    and benchmarked without data.cityofnewyork.us or AWS. Rows are serialized once up front, so serving a page costs
+    little more than copying its bytes.
+    """
+
+    def __init__(self, records, dataset_id='pvqr-7yc4', latency_seconds=0.0, latency_seconds_per_1000_rows=0.0,
+                 max_requests_per_second=None, max_concurrent_requests=None):
+        """
+        :param records: the rows of the dataset, as Socrata returns them: dictionaries of strings
+        :param dataset_id: Optional. The dataset ID the rows are served under. Other IDs get a 404.
+        :param latency_seconds: Optional. Added to every response
+        :param latency_seconds_per_1000_rows: Optional. Added to every response per 1000 rows returned, as the time
+            the real service takes grows with the page size
+        :param max_requests_per_second: Optional. Requests beyond this rate get a 429 with a Retry-After header, as
+            throttled Socrata requests do. None means no limit.
+        :param max_concurrent_requests: Optional. Requests beyond this many in flight get a 429. None means no limit.
+        """
+        records = sorted(records, key=lambda record: int(record['summons_number']))
+
+        self.dataset_id = dataset_id
+        self.summons_numbers = [int(record['summons_number']) for record in records]
+        self.rows = [json.dumps(record).encode('utf-8') for record in records]
+        self.latency_seconds = latency_seconds
+        self.latency_seconds_per_1000_rows = latency_seconds_per_1000_rows
+        self.max_requests_per_second = max_requests_per_second
+        self.max_concurrent_requests = max_concurrent_requests
+
+        self.lock = threading.Lock()
+        self.tokens = float(max_requests_per_second or 0)
+        self.tokens_updated = time.monotonic()
+        self.in_flight_count = 0
+        self.stats = {'requests': 0, 'throttled_requests': 0, 'failed_requests': 0, 'rows_served': 0,
+                      'bytes_served': 0, 'peak_concurrent_requests': 0}
+        self.server = None
+        self.thread = None
+
+    def acquire(self):
+        """
+        Admits a request, unless the request rate or the number of requests in flight is over its limit.
+        :return: True if the request may proceed, in which case release() must be called once it is answered
+        """
+        with self.lock:
+            self.stats['requests'] += 1
+
+            if self.max_requests_per_second:
+                # A token bucket refilled at the allowed rate, holding up to a second's worth of requests
+                now = time.monotonic()
+                self.tokens = min(float(self.max_requests_per_second),
+                                  self.tokens + (now - self.tokens_updated) * self.max_requests_per_second)
+                self.tokens_updated = now
+
+                if self.tokens < 1:
+                    self.stats['throttled_requests'] += 1
+                    return False
+
+            if self.max_concurrent_requests and self.in_flight_count >= self.max_concurrent_requests:
+                self.stats['throttled_requests'] += 1
+                return False
+
+            if self.max_requests_per_second:
+                self.tokens -= 1
+
+            self.in_flight_count += 1
+            self.stats['peak_concurrent_requests'] = max(self.stats['peak_concurrent_requests'], self.in_flight_count)
+            return True
+
+    def release(self, row_count, byte_count):
+        with self.lock:
+            self.in_flight_count -= 1
+            self.stats['rows_served'] += row_count
+            self.stats['bytes_served'] += byte_count
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def get_row_range(self, where_clause):
+        """
+        Finds the rows matching a $where clause.
+        :param where_clause: conditions on summons_number joined by AND, e.g. 'summons_number > 5 AND summons_number
+            <= 10', or None
+        :return: the (start, end) indexes of the matching rows, end exclusive
+        """
+        start_index, end_index = 0, len(self.rows)
+
+        if where_clause is None:
+            return start_index, end_index
+
+        for condition in re.split(r'\s+AND\s+', where_clause.strip(), flags=re.IGNORECASE):
+            condition_match = WHERE_CONDITION_PATTERN.fullmatch(condition)
+            if condition_match is None:
+                raise SoqlError("Unsupported $where condition: " + condition)
+
+            operator, value = condition_match.group(1), int(condition_match.group(2))
+            if operator in ('>', '>='):
+                bound = (bisect.bisect_right if operator == '>' else bisect.bisect_left)(self.summons_numbers, value)
+                start_index = max(start_index, bound)
+            if operator in ('<', '<='):
+                bound = (bisect.bisect_left if operator == '<' else bisect.bisect_right)(self.summons_numbers, value)
+                end_index = min(end_index, bound)
+            if operator == '=':
+                start_index = max(start_index, bisect.bisect_left(self.summons_numbers, value))
+                end_index = min(end_index, bisect.bisect_right(self.summons_numbers, value))
+
+        return start_index, max(start_index, end_index)
+
+    def query(self, params):
+        """
+        Answers a SODA query on the dataset.
+        :param params: the query parameters, e.g. {'$where': ..., '$order': ..., '$limit': ...}
+        :return: a (JSON response body, number of rows) tuple
+        """
+        unsupported_params = set(params) - {'$select', '$where', '$order', '$limit', '$offset'}
+        if unsupported_params:
+            raise SoqlError("Unsupported parameters: " + ", ".join(sorted(unsupported_params)))
+
+        start_index, end_index = self.get_row_range(params.get('$where'))
+
+        if params.get('$select') is not None:
+            aggregates = {}
+            for expression in params['$select'].split(','):
+                aggregate_match = SELECT_AGGREGATE_PATTERN.fullmatch(expression)
+                if aggregate_match is None:
+                    raise SoqlError("Unsupported $select expression: " + expression)
+
+                function_name, column, alias = aggregate_match.groups()
+                if function_name.lower() == 'count':
+                    aggregates[alias] = str(end_index - start_index)
+                elif end_index > start_index:
+                    # Like Socrata, aggregates over no rows are left out of the response rather than null
+                    index = start_index if function_name.lower() == 'min' else end_index - 1
+                    aggregates[alias] = str(self.summons_numbers[index])
+
+            return json.dumps([aggregates]).encode('utf-8'), 1
+
+        order_match = ORDER_PATTERN.fullmatch(params.get('$order', 'summons_number'))
+        if order_match is None:
+            raise SoqlError("Unsupported $order: " + params['$order'])
+
+        try:
+            limit = int(params.get('$limit', DEFAULT_LIMIT))
+            offset = int(params.get('$offset', 0))
+        except ValueError:
+            raise SoqlError("$limit and $offset must be integers")
+
+        if (order_match.group(2) or 'ASC').upper() == 'DESC':
+            indexes = range(end_index - 1 - offset, max(start_index, end_index - offset - limit) - 1, -1)
+            page = [self.rows[index] for index in indexes]
+        else:
+            page = self.rows[start_index + offset:min(end_index, start_index + offset + limit)]
+
+        return b'[' + b',\n'.join(page) + b']', len(page)
+
+    def start(self, host='127.0.0.1', port=0):
+        """
+        Starts serving on a background thread.
+        :param host: Optional. The interface to listen on
+        :param port: Optional. The port to listen on. 0 picks a free one.
+        :return: the URL to give process_violations.py as its Socrata domain, e.g. http://127.0.0.1:8080
+        """
+        self.server = ThreadingHTTPServer((host, port), SodaRequestHandler)
+        self.server.daemon_threads = True
+        self.server.stand_in = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name="socrata-stand-in", daemon=True)
+        self.thread.start()
+
+        return 'http://{}:{}'.format(*self.server.server_address[:2])
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class SodaRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles the requests of the Socrata client: GET /resource/<dataset id>.json with SoQL parameters, plus GET /stats
+    for the request counters of the stand-in.
+    """
+
+    # Keep connections open between requests, as the client's requests.Session expects
+    protocol_version = 'HTTP/1.1'
+
+    def send_json(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, code, message, headers=None):
+        self.send_json(status, json.dumps({'code': code, 'error': True, 'message': message}).encode('utf-8'), headers)
+
+    def do_GET(self):
+        stand_in = self.server.stand_in
+        url = urlsplit(self.path)
+
+        if url.path == '/stats':
+            self.send_json(200, json.dumps(stand_in.get_stats()).encode('utf-8'))
+            return
+
+        if url.path != '/resource/{}.json'.format(stand_in.dataset_id):
+            self.send_error_json(404, 'not_found', 'Unknown resource ' + url.path)
+            return
+
+        if not stand_in.acquire():
+            self.send_error_json(429, 'too_many_requests', 'Too many requests', {'Retry-After': '1'})
+            return
+
+        body, row_count = b'', 0
+        try:
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            body, row_count = stand_in.query(params)
+
+            time.sleep(stand_in.latency_seconds + stand_in.latency_seconds_per_1000_rows * row_count / 1000.0)
+            self.send_json(200, body)
+        except SoqlError as e:
+            with stand_in.lock:
+                stand_in.stats['failed_requests'] += 1
+            self.send_error_json(400, 'query.compiler.malformed', str(e))
+        finally:
+            stand_in.release(row_count, len(body))
+
+    def log_message(self, format, *args):
+        # Logging every page would drown out the extractor's own output
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves synthetic parking violations through a local stand-in of the "
+                                                 "Socrata API, for process_violations.py --socrata-domain")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--data", help="Serve the rows of these JSON Lines files, e.g. the output of "
+                                       "generate_violations.py --raw, instead of generating them")
+    parser.add_argument("--rows", type=int, default=100000, help="The number of rows to generate")
+    parser.add_argument("--seed", type=int, default=42, help="The seed of the generated rows")
+    parser.add_argument("--chunks", type=int,
+                        help="Generate the rows in this many chunks, as generate_violations.py --chunks does. "
+                             "Defaults to one per million rows.")
+    parser.add_argument("--first-summons-number", type=int, default=1400000000,
+                        help="The summons number of the first generated row")
+    parser.add_argument("--fiscal-year", type=int, default=2021, help="The fiscal year of the generated rows")
+    parser.add_argument("--dataset-id", default="pvqr-7yc4", help="The dataset ID to serve the rows under")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latency added to every response")
+    parser.add_argument("--latency-ms-per-1000-rows", type=float, default=0.0,
+                        help="Latency added to every response per 1000 rows returned")
+    parser.add_argument("--max-requests-per-second", type=float,
+                        help="Answer requests beyond this rate with 429 Too Many Requests")
+    parser.add_argument("--max-concurrent-requests", type=int,
+                        help="Answer requests beyond this many in flight with 429 Too Many Requests")
+    args = parser.parse_args()
+
+    if args.data:
+        records = read_jsonl_records(args.data)
+    else:
+        chunk_count = args.chunks or get_default_chunk_count(args.rows)
+        records = [record for chunk in split_rows(args.rows, chunk_count, args.first_summons_number)
+                   for record in generate_chunk_records(chunk, args.seed, args.fiscal_year)]
+
+    stand_in = SocrataStandIn(records, args.dataset_id, args.latency_ms / 1000.0,
+                              args.latency_ms_per_1000_rows / 1000.0, args.max_requests_per_second,
+                              args.max_concurrent_requests)
+    url = stand_in.start(args.host, args.port)
+
+    print("Serving {} rows of {} at {}. Extract them with process_violations.py --socrata-domain {}".format(
+        len(records), args.dataset_id, url, url))
+
+    try:
+        stand_in.thread.join()
+    except KeyboardInterrupt:
+        stand_in.stop()
+
+
+if __name__ == "__main__":
+    main()
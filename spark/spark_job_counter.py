@@ -0,0 +1,48 @@
+class SparkJobCounter:
+    """
+    Counts the Spark jobs each batch triggers by running the batch in its own job group. A batch should cost exactly
+    one job, the write; anything more (e.g. a collect() to compute the next cursor, or a broadcast that has to be
+    built) is reported so a regression is caught as soon as it shows up in the logs.
+    """
+
+    def __init__(self, spark, expected_jobs_per_batch=1):
+        """
+        :param spark: the current SparkSession
+        :param expected_jobs_per_batch: the number of Spark jobs a batch is expected to trigger
+        """
+        self.spark_context = spark.sparkContext
+        self.expected_jobs_per_batch = expected_jobs_per_batch
+        self.jobs_per_batch = []
+        self._job_group = None
+
+    def start_batch(self, description):
+        """
+        Starts a new job group for the next batch. Must be called from the thread that runs the batch's Spark work.
+        :param description: a human-readable description shown in the Spark UI
+        :return: None
+        """
+        self._job_group = "parking-violations-batch-{}".format(len(self.jobs_per_batch))
+        self.spark_context.setJobGroup(self._job_group, description)
+
+    def end_batch(self):
+        """
+        Records how many Spark jobs ran in the current batch's job group.
+        :return: the number of Spark jobs the batch triggered
+        """
+        job_count = len(self.spark_context.statusTracker().getJobIdsForGroup(self._job_group))
+        self.jobs_per_batch.append(job_count)
+
+        if job_count > self.expected_jobs_per_batch:
+            print("WARNING: batch {} triggered {} Spark jobs, expected {}.".format(
+                len(self.jobs_per_batch) - 1, job_count, self.expected_jobs_per_batch))
+
+        return job_count
+
+    def report(self):
+        """
+        Prints the Spark job count over all batches.
+        :return: None
+        """
+        if len(self.jobs_per_batch) > 0:
+            print("Spark jobs: {} over {} batches, at most {} in a single batch.".format(
+                sum(self.jobs_per_batch), len(self.jobs_per_batch), max(self.jobs_per_batch)))
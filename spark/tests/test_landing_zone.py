@@ -0,0 +1,94 @@
+import json
+import pytest
+from landing_zone import LandingZone, iter_landed_pages
+
+
+DATASET_ID = 'pvqr-7yc4'
+
+
+def make_records(first_summons_number, last_summons_number):
+    return [{'summons_number': str(summons_number), 'plate_id': 'P{}'.format(summons_number)}
+            for summons_number in range(first_summons_number, last_summons_number + 1)]
+
+
+def land_pages(landing_zone, summons_number_ranges):
+    """
+    Lands one page per (first, last) summons_number range, as fetch_sized_page() would.
+    """
+    for first_summons_number, last_summons_number in summons_number_ranges:
+        records = make_records(first_summons_number, last_summons_number)
+        landing_zone.land(records, json.dumps(records).encode('utf-8'))
+
+
+def replay_summons_numbers(landing_zone):
+    return [int(record['summons_number']) for path, lower_summons_number in landing_zone.plan_replay()
+            for record in landing_zone.read_page(path, lower_summons_number)]
+
+
+@pytest.fixture(params=['zstd', 'gzip'])
+def landing_zone(request, tmp_path):
+    return LandingZone(str(tmp_path / 'landing'), DATASET_ID, request.param)
+
+
+def test_land_names_the_page_after_its_summons_numbers(landing_zone):
+    path = landing_zone.land(make_records(14, 20), json.dumps(make_records(14, 20)).encode('utf-8'))
+
+    assert path.endswith('/{}/0000000000000014-0000000000000020.json.{}'.format(
+        DATASET_ID, LandingZone.EXTENSIONS[landing_zone.compression]))
+    assert landing_zone.read_page(path) == make_records(14, 20)
+
+
+def test_empty_pages_are_not_landed(landing_zone):
+    assert landing_zone.land([], b'[]') is None
+    assert landing_zone.plan_replay() == []
+
+
+def test_replay_of_disjoint_pages_reads_every_page_whole(landing_zone):
+    land_pages(landing_zone, [(6, 10), (1, 5), (11, 12)])
+
+    plan = landing_zone.plan_replay()
+
+    assert [lower_summons_number for path, lower_summons_number in plan] == [None, None, None]
+    assert replay_summons_numbers(landing_zone) == list(range(1, 13))
+
+
+def test_replay_of_overlapping_pages_reads_every_row_once(landing_zone):
+    # A full extraction run twice with different batch sizes
+    land_pages(landing_zone, [(1, 5), (6, 10), (1, 3), (4, 8), (9, 10)])
+
+    plan = landing_zone.plan_replay()
+
+    assert [(path.rsplit('/', 1)[1].split('.')[0], lower_summons_number)
+            for path, lower_summons_number in plan] == [
+        ('0000000000000001-0000000000000005', None),
+        ('0000000000000004-0000000000000008', 5),
+        ('0000000000000006-0000000000000010', 8),
+    ]
+    assert replay_summons_numbers(landing_zone) == list(range(1, 11))
+
+
+def test_replay_skips_pages_contained_in_a_larger_one(landing_zone):
+    land_pages(landing_zone, [(1, 100), (20, 30), (1, 50)])
+
+    assert len(landing_zone.plan_replay()) == 1
+    assert replay_summons_numbers(landing_zone) == list(range(1, 101))
+
+
+def test_replay_reads_pages_landed_with_either_compression(tmp_path):
+    land_pages(LandingZone(str(tmp_path), DATASET_ID, 'gzip'), [(1, 5)])
+    landing_zone = LandingZone(str(tmp_path), DATASET_ID, 'zstd')
+    land_pages(landing_zone, [(6, 10)])
+
+    assert replay_summons_numbers(landing_zone) == list(range(1, 11))
+
+
+def test_iter_landed_pages_batches_consecutive_pages(landing_zone):
+    land_pages(landing_zone, [(1, 3), (4, 6), (7, 9), (10, 10)])
+
+    batches = list(iter_landed_pages(landing_zone, landing_zone.plan_replay(), 5))
+
+    assert [(shard_number, [int(record['summons_number']) for record in records], exhausted)
+            for shard_number, records, exhausted in batches] == [
+        (0, [1, 2, 3, 4, 5, 6], False),
+        (0, [7, 8, 9, 10], True),
+    ]
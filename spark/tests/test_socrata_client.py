@@ -0,0 +1,44 @@
+import pytest
+from socrata_client import split_summons_range
+
+
+def get_summons_numbers(summons_ranges):
+    """
+    Lists every summons_number the ranges cover, lower bounds being exclusive and upper bounds inclusive.
+    """
+    return [summons_number for lower, upper in summons_ranges for summons_number in range(lower + 1, upper + 1)]
+
+
+@pytest.mark.parametrize('min_summons_number, max_summons_number, shard_count', [
+    (1, 100, 4),
+    (1, 101, 4),
+    (1400000001, 1400999999, 7),
+    (5, 5, 3),
+    (10, 12, 8),
+    (1, 1000, 1),
+])
+def test_ranges_cover_the_keyspace_once(min_summons_number, max_summons_number, shard_count):
+    summons_ranges = split_summons_range(min_summons_number, max_summons_number, shard_count)
+
+    assert summons_ranges[0][0] == min_summons_number - 1
+    assert summons_ranges[-1][1] == max_summons_number
+    # Each range starts where the previous one ended, so no summons_number is skipped or fetched twice
+    assert all(previous[1] == following[0] for previous, following in zip(summons_ranges, summons_ranges[1:]))
+    assert all(lower < upper for lower, upper in summons_ranges)
+    assert len(summons_ranges) <= shard_count
+
+
+def test_ranges_are_of_roughly_equal_width():
+    summons_ranges = split_summons_range(1, 1000, 3)
+
+    assert [upper - lower for lower, upper in summons_ranges] == [334, 334, 332]
+
+
+def test_every_summons_number_is_in_exactly_one_range():
+    summons_ranges = split_summons_range(17, 96, 6)
+
+    assert get_summons_numbers(summons_ranges) == list(range(17, 97))
+
+
+def test_more_shards_than_summons_numbers():
+    assert split_summons_range(10, 12, 8) == [(9, 10), (10, 11), (11, 12)]